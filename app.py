@@ -7,6 +7,9 @@ from datetime import datetime, timedelta
 from src .main import RAGPipeline
 from src .document_processor import SimpleProgressTracker, ProgressContext
 from src .session_manager import SessionManager
+from src .directory_watcher import DirectoryWatchService
+from src .ingestion_jobs import IngestionJobManager
+from src .async_pipeline import BlockingRAGPipeline
 import json
 import markdown
 from bs4 import BeautifulSoup
@@ -20,12 +23,129 @@ st .set_page_config(
 )
 
 
+@st .cache_resource
+def get_directory_watch_service():
+    """Единый для процесса сервис наблюдения за папками с фоновой индексацией"""
+    return DirectoryWatchService(RAGPipeline())
+
+
+@st .cache_resource
+def warm_start_knowledge_base(_pipeline: RAGPipeline):
+    """Загрузка снимка базы знаний один раз за процесс, при первом создании конвейера"""
+    _pipeline .warm_start()
+
+
+@st .cache_resource
+def get_ingestion_job_manager():
+    """Единая для процесса очередь задач индексации, переживающая перезапуски скрипта"""
+    manager = IngestionJobManager(RAGPipeline)
+    manager .start()
+    return manager
+
+
+def get_query_pipeline() -> BlockingRAGPipeline:
+    """Синхронный фасад асинхронного конвейера запросов для текущего RAGPipeline сессии"""
+    facade = st .session_state .get("query_pipeline")
+    if facade is None or facade .pipeline is not st .session_state .rag_pipeline:
+        if facade is not None:
+            facade .close()
+        facade = BlockingRAGPipeline(st .session_state .rag_pipeline)
+        st .session_state .query_pipeline = facade
+    return facade
+
+
+JOB_STATUS_LABELS = {
+    "queued": "В очереди",
+    "running": "Выполняется",
+    "completed": "Готово",
+    "failed": "Ошибка",
+    "cancelled": "Отменено"
+}
+
+FULL_CONTENT_PAGE_CHARS = 20000
+
+
+@st .fragment(run_every=1.0)
+def render_ingestion_jobs():
+    """Периодически опрашивает снимки задач индексации, не блокируя остальной интерфейс"""
+    job_manager = get_ingestion_job_manager()
+    jobs = job_manager .get_jobs()
+    if not jobs:
+        return
+
+    status = job_manager .get_status()
+    col_summary, col_clear = st .columns([4, 1])
+    with col_summary:
+        st .caption(
+            f"Задачи: {status['running']} выполняется, {status['queued']} в очереди, "
+            f"{status['completed']} готово, {status['failed']} с ошибками")
+    with col_clear:
+        if st .button("Очистить", key="clear_finished_jobs", use_container_width=True):
+            job_manager .clear_finished()
+            st .rerun(scope="fragment")
+
+    for job in jobs[:20]:
+        progress = job .get("progress")or {}
+        col_name, col_action = st .columns([4, 1])
+        with col_name:
+            label = f"**{job['filename']}** — {JOB_STATUS_LABELS .get(job['status'], job['status'])}"
+            if job["status"] == "running":
+                st .progress(
+                    min(progress .get("progress_percent", 0.0), 100.0)/100,
+                    text=f"{label}: {progress .get('message', job['message'])}")
+            else:
+                st .markdown(label)
+                if job["error"]:
+                    st .caption(f"Ошибка: {job['error']}")
+                elif job["status"] == "completed":
+                    st .caption(progress .get("message", job["message"]))
+        with col_action:
+            if job["status"]in ("queued", "running"):
+                if st .button("Отменить", key=f"cancel_job_{job['id']}", use_container_width=True):
+                    job_manager .cancel(job["id"])
+                    st .rerun(scope="fragment")
+            elif job["status"]in ("failed", "cancelled"):
+                if st .button("Повторить", key=f"retry_job_{job['id']}", use_container_width=True):
+                    job_manager .retry(job["id"])
+                    st .rerun(scope="fragment")
+
+
+def render_ingestion_report(report):
+    """Сводка конвейерной индексации: загрузка этапов и простой из-за переполненных очередей"""
+    if not report:
+        return
+    with st .expander("Статистика конвейера индексации", expanded=False):
+        st .caption(
+            f"{report['indexed']} из {report['files']} файлов, {report['chunks']} фрагментов "
+            f"за {report['elapsed_seconds']:.1f} сек")
+        if report .get("boilerplate_chars_saved"):
+            st .caption(
+                f"Удалено колонтитулов и повторов: {report['boilerplate_chars_saved']:,} символов, "
+                f"примерно на {report['boilerplate_chunks_saved']} фрагментов меньше")
+        stage_names = {"extract": "Извлечение", "embed": "Эмбеддинги", "store": "Запись"}
+        rows = []
+        for name, stage in report["stages"].items():
+            rows .append({
+                "Этап": stage_names .get(name, name),
+                "Потоков": stage["workers"],
+                "Элементов": stage["items"],
+                "Загрузка, %": round(stage["utilization"]*100, 1),
+                "Ожидание входа, %": round(stage["starvation"]*100, 1),
+                "Блокировка выхода, %": round(stage["backpressure"]*100, 1),
+                "Макс. очередь": f"{stage['max_queue_depth']}/{stage['queue_size']}"if stage["queue_size"]else "-"
+            })
+        st .dataframe(rows, hide_index=True, use_container_width=True)
+        for path, error in report["failed"].items():
+            st .caption(f"{os .path .basename(path)}: {error}")
+
+
 if "session_manager"not in st .session_state:
     st .session_state .session_manager = SessionManager()
 
     st .session_state .session_manager .initialize_with_autorestore()
 if "rag_pipeline"not in st .session_state:
     st .session_state .rag_pipeline = RAGPipeline()
+    warm_start_knowledge_base(st .session_state .rag_pipeline)
 if "conversation_history"not in st .session_state:
     st .session_state .conversation_history = []
 if "system_initialized"not in st .session_state:
@@ -263,39 +383,33 @@ elif page == "Документы":
                 )
                 if uploaded_files:
                     if st .button("Обработать файлы", type="primary"):
-                        progress_tracker = SimpleProgressTracker()
-                        progress_tracker .setup_ui()
-
-                        rag_with_progress = RAGPipeline(
-                            progress_tracker=progress_tracker)
-
-                        success_count = 0
-
-                        progress_tracker .start_session(
-                            len(uploaded_files), "Обработка загруженных файлов")
-
+                        job_manager = get_ingestion_job_manager()
+                        chunk_size = st .session_state .session_manager .get_setting(
+                            'chunk_size', 512)
+                        chunk_overlap = int(
+                            chunk_size * st .session_state .session_manager .get_setting('chunk_overlap', 25)/100)
+                        document_processor = st .session_state .rag_pipeline .document_processor
+
+                        queued_count = 0
                         for uploaded_file in uploaded_files:
-                            try:
-                                if rag_with_progress .load_uploaded_file(uploaded_file):
-                                    success_count += 1
-                            except Exception as e:
-                                progress_tracker .set_error(
-                                    f"Ошибка обработки {uploaded_file .name}: {str(e)}")
-                                continue
-
-                        progress_tracker .finish_session(success_count > 0)
-
-                        if success_count > 0:
-                            st .session_state .rag_pipeline = rag_with_progress
-
-                        if success_count == len(uploaded_files):
+                            saved_upload = document_processor .save_uploaded_file(
+                                uploaded_file)
+                            if saved_upload:
+                                job_manager .submit_upload(
+                                    saved_upload, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                    dedup_mode=st .session_state .session_manager .get_setting('dedup_mode', "link"))
+                                queued_count += 1
+
+                        if queued_count == len(uploaded_files):
                             st .success(
-                                f"Успешно обработано {success_count} из {len(uploaded_files)} файлов")
-                        elif success_count > 0:
+                                f"{queued_count} файлов поставлено в очередь обработки")
+                        elif queued_count > 0:
                             st .warning(
-                                f"Обработано {success_count} из {len(uploaded_files)} файлов (с ошибками)")
+                                f"В очередь поставлено {queued_count} из {len(uploaded_files)} файлов")
                         else:
-                            st .error(f"Не удалось обработать ни одного файла")
+                            st .error(f"Не удалось сохранить ни одного файла")
+
+                render_ingestion_jobs()
 
             elif upload_method == "Загрузить из папки":
                 directory_path = st .text_input(
@@ -332,10 +446,45 @@ elif page == "Документы":
 
                                 if success:
                                     st .session_state .rag_pipeline = rag_with_progress
+                                render_ingestion_report(
+                                    rag_with_progress .stats .get("last_ingestion"))
 
                     except Exception as e:
                         st .error(f"Ошибка: {str(e)}")
 
+                watch_service = get_directory_watch_service()
+                col_watch, col_unwatch = st .columns(2)
+                with col_watch:
+                    if directory_path and st .button("Следить за папкой", use_container_width=True):
+                        if os .path .isdir(directory_path):
+                            watch_service .watch(directory_path)
+                            st .success(
+                                f"Наблюдение запущено: новые и измененные файлы будут индексироваться автоматически")
+                        else:
+                            st .error(f"Папка не найдена: {directory_path}")
+                with col_unwatch:
+                    if directory_path and st .button("Остановить наблюдение", use_container_width=True):
+                        if watch_service .unwatch(directory_path):
+                            st .info(f"Наблюдение за {directory_path} остановлено")
+                        else:
+                            st .warning("За этой папкой наблюдение не ведется")
+
+                watch_status = watch_service .get_status()
+                if watch_status["watchers"]:
+                    queue_status = watch_status["queue"]
+                    with st .expander("Наблюдаемые папки", expanded=False):
+                        for watcher_status in watch_status["watchers"]:
+                            st .caption(
+                                f"{watcher_status['directory']}: {watcher_status['indexed_files']} файлов в индексе, "
+                                f"{watcher_status['files_seen']} найдено, последний обход "
+                                f"{watcher_status['last_scan_duration'] * 1000:.0f} мс")
+                        st .caption(
+                            f"Очередь: {queue_status['pending']} ожидает, обработано {queue_status['processed']}, "
+                            f"ошибок {queue_status['failed']}, объединено {queue_status['coalesced']}")
+                        if queue_status["current_path"]:
+                            st .caption(
+                                f"Индексируется: {os .path .basename(queue_status['current_path'])}")
+
             else:
                 st .info(
                     "Эта опция переиндексирует файлы, уже находящиеся в папке./data/documents")
@@ -387,6 +536,8 @@ elif page == "Документы":
                                     st .session_state .rag_pipeline = rag_with_progress
                                 else:
                                     st .error("Ошибка переиндексации")
+                                render_ingestion_report(
+                                    rag_with_progress .stats .get("last_ingestion"))
                     else:
                         st .warning(
                             "В папке./data/documents нет поддерживаемых файлов (PDF, DOCX, TXT)")
@@ -510,7 +661,8 @@ elif page == "Документы":
                 if st .session_state .full_content_dialog["content_data"] is None:
                     with st .spinner("Загрузка полного содержимого документа..."):
                         content_data = st .session_state .rag_pipeline .vector_store .get_full_document_content(
-                            filename)
+                            filename, page=st .session_state .full_content_dialog .get("page", 0),
+                            page_chars=FULL_CONTENT_PAGE_CHARS)
                         st .session_state .full_content_dialog["content_data"] = content_data
                 content_data = st .session_state .full_content_dialog["content_data"]
                 if content_data and content_data .get("success"):
@@ -536,8 +688,21 @@ elif page == "Документы":
                         st .metric("Символов", f"{chars:,}")
                     with col4:
                         words = len(content_data .get("content", "").split())
-                        st .metric("Слов", f"{words:,}")
+                        st .metric("Слов на странице"if content_data .get("text_pages", 1) > 1 else "Слов", f"{words:,}")
                     st .markdown("**Содержимое документа:**")
+                    if content_data .get("text_pages", 1) > 1:
+                        text_page = st .number_input(
+                            f"Страница текста (из {content_data['text_pages']})",
+                            min_value=1,
+                            max_value=content_data["text_pages"],
+                            value=content_data["text_page"]+1,
+                            step=1,
+                            key=f"full_content_page_{filename}"
+                        )
+                        if text_page - 1 != content_data["text_page"]:
+                            st .session_state .full_content_dialog["page"] = text_page - 1
+                            st .session_state .full_content_dialog["content_data"] = None
+                            st .rerun()
                     col1, col2, col3 = st .columns([3, 1, 1])
                     with col2:
                         if st .button("Копировать текст", type="secondary", use_container_width=True):
@@ -552,7 +717,7 @@ elif page == "Документы":
                         value=content_data["content"],
                         height=600,
                         disabled=True,
-                        key=f"full_content_{filename}",
+                        key=f"full_content_{filename}_{content_data .get('text_page', 0)}",
                         label_visibility="collapsed"
                     )
                     with st .expander("Детальная информация о фрагментах", expanded=False):
@@ -687,13 +852,15 @@ elif page == "Документы":
                         if st .button(f"Удалить ({len(selected_for_deletion)})", type="secondary", use_container_width=True):
                             deleted_count = 0
                             errors = []
+                            vector_results = {}
+                            if delete_from_vector:
+                                vector_results = st .session_state .rag_pipeline .vector_store .delete_documents_by_filenames(
+                                    selected_for_deletion)
                             for filename in selected_for_deletion:
                                 try:
                                     success = True
                                     if delete_from_vector:
-                                        vector_success = st .session_state .rag_pipeline .vector_store .delete_documents_by_filename(
-                                            filename)
-                                        success = success and vector_success
+                                        success = success and vector_results .get(filename, False)
                                     if delete_physical:
                                         file_success = st .session_state .rag_pipeline .document_processor .delete_physical_file(
                                             filename)
@@ -815,6 +982,15 @@ elif page == "Чат":
                                 "response_type", "unknown")
                             st .caption(
                                 f"**Время и тип ответа:** {time_resp:.2f}с, тип: {type_resp}")
+                            if metadata .get("time_to_first_token")is not None:
+                                st .caption(
+                                    f"**Время до первого токена:** {metadata['time_to_first_token']:.2f}с")
+                            if metadata .get("context_packing"):
+                                packing = metadata["context_packing"]
+                                st .caption(
+                                    f"**Контекст:** {packing['tokens']}/{packing['budget']} токенов, "
+                                    f"фрагментов {packing['chunks_used']}/{packing['chunks_total']}, "
+                                    f"окно {packing['context_window']}")
 
                             if debug_info and debug_info .get("search_results"):
                                 search_results = debug_info["search_results"]
@@ -846,43 +1022,77 @@ elif page == "Чат":
                 st .markdown(prompt)
 
             with st .chat_message("assistant"):
-                with st .spinner("Думаю..."):
-                    response = st .session_state .rag_pipeline .process_query(
-                        prompt,
-                        show_debug=st .session_state .debug_mode,
-                        selected_documents=st .session_state .selected_documents,
-                        search_k=st .session_state .session_manager .get_setting(
-                            'search_k', 10),
-                        search_method=st .session_state .session_manager .get_setting(
-                            'search_method', 'mmr'),
-                        distance_threshold=st .session_state .session_manager .get_setting(
-                            'distance_threshold', 0.25),
-                        confidence_threshold=st .session_state .session_manager .get_setting(
-                            'confidence_threshold', 0.5),
-                        temperature=st .session_state .session_manager .get_setting(
-                            'temperature', 0.2),
-                        max_tokens=st .session_state .session_manager .get_setting(
-                            'max_tokens', 2000),
-                        system_prompt_style=st .session_state .session_manager .get_setting(
-                            'system_prompt_style', 'Профессиональный')
-                    )
-
+                query_events = get_query_pipeline().process_query_events(
+                    prompt,
+                    selected_documents=st .session_state .selected_documents,
+                    search_k=st .session_state .session_manager .get_setting(
+                        'search_k', 10),
+                    search_method=st .session_state .session_manager .get_setting(
+                        'search_method', 'mmr'),
+                    distance_threshold=st .session_state .session_manager .get_setting(
+                        'distance_threshold', 0.25),
+                    confidence_threshold=st .session_state .session_manager .get_setting(
+                        'confidence_threshold', 0.5),
+                    temperature=st .session_state .session_manager .get_setting(
+                        'temperature', 0.2),
+                    max_tokens=st .session_state .session_manager .get_setting(
+                        'max_tokens', 2000),
+                    system_prompt_style=st .session_state .session_manager .get_setting(
+                        'system_prompt_style', 'Профессиональный'),
+                    judgments=st .session_state .session_manager .get_setting(
+                        'judgment_mode', 'concurrent')
+                )
+                sources_placeholder = st .empty()
+                sources_placeholder .caption("Поиск по документам...")
+                query_result = {}
+
+                def answer_tokens():
+                    for event in query_events:
+                        if event["type"] == "sources":
+                            filenames = list(dict .fromkeys(
+                                source["filename"]for source in event["sources"]))
+                            if filenames:
+                                sources_placeholder .caption(
+                                    f"Найдено в: {', '.join(filenames)}")
+                            else:
+                                sources_placeholder .empty()
+                        elif event["type"] == "token":
+                            yield event["text"]
+                        elif event["type"]in ("done", "error"):
+                            query_result["response"] = event["response"]
+                            return
+
+                st .write_stream(answer_tokens())
+                response = query_result .get("response")or {
+                    "answer": "Извините, произошла ошибка при обработке вашего запроса.",
+                    "response_type": "error"
+                }
+                if response["response_type"] == "error":
+                    st .markdown(response["answer"])
+                if response .get("cited_sources"):
+                    st .caption("Цитируемые фрагменты: "+", ".join(
+                        f"[{source['index']+1}] {source['filename']}"for source in response["cited_sources"]))
                 full_response = response["answer"]
 
-                def stream_response():
-                    for char in full_response:
-                        yield char
-                        time .sleep(0.02)
-
-                st .write_stream(stream_response())
-
                 with st .expander("Копировать текст", expanded=False):
                     clean_text = st .session_state .rag_pipeline .markdown_to_text(
                         full_response)
                     st .text(clean_text)
 
+                judgments_placeholder = st .empty()
+                for event in query_events:
+                    if event["type"] == "context_relevance":
+                        judgments_placeholder .caption("Оценка уверенности в ответе...")
+                    elif event["type"] == "confidence":
+                        assessment = event["confidence_assessment"]
+                        judgments_placeholder .caption(
+                            f"Уверенность в ответе: {assessment .get('confidence_level', 'н/д')}"
+                            f" ({assessment .get('confidence_score', 0):.0%})")
+
                 metadata = {
                     "response_time": response .get("response_time", 0),
+                    "time_to_first_token": response .get("time_to_first_token"),
+                    "context_packing": response .get("context_packing"),
                     "response_type": response .get("response_type", "unknown"),
                     "sources": response .get("sources", []),
                 }
@@ -1007,6 +1217,24 @@ elif page == "Чат":
 
                         st .caption("**Производительность:**")
                         st .caption(f"• Время ответа: {time_resp:.3f}с")
+                        if response .get("time_to_first_token")is not None:
+                            st .caption(
+                                f"• Время до первого токена: {response['time_to_first_token']:.3f}с")
+                        if response .get("context_packing"):
+                            packing = response["context_packing"]
+                            compressed = (f", сжато до выдержек: {packing['compressed_chunks']}"
+                                          if packing["compressed_chunks"]else "")
+                            st .caption(
+                                f"• Контекст: {packing['tokens']} из {packing['budget']} токенов бюджета, "
+                                f"всего в запросе {packing['prompt_tokens']} при окне {packing['context_window']}"
+                                f"{compressed}")
+                            if packing .get("max_tokens"):
+                                st .caption(f"• Лимит длины ответа: {packing['max_tokens']} токенов")
+                            if packing .get("overlap_tokens_saved"):
+                                st .caption(
+                                    f"• Склейка перекрытий: {packing['passages']} отрывков из "
+                                    f"{packing['chunks_used']} фрагментов, сэкономлено "
+                                    f"{packing['overlap_tokens_saved']} токенов")
                         st .caption(f"• Тип ответа: {type_resp}")
                         st .caption(
                             f"• Поиск: найдено {len(search_results)}, использовано {sources_count}")
@@ -1279,6 +1507,29 @@ elif page == "Настройки":
                 st .caption(
                     "Большое перекрытие: лучше связывает информацию между частями")
 
+            dedup_modes = {
+                "link": "Связывать с оригиналом",
+                "skip": "Пропускать",
+                "keep": "Хранить все копии"
+            }
+            current_dedup_mode = st .session_state .session_manager .get_setting('dedup_mode', "link")
+            dedup_mode = st .selectbox(
+                "Почти дубликаты фрагментов",
+                options=list(dedup_modes .keys()),
+                index=list(dedup_modes .keys()).index(current_dedup_mode)if current_dedup_mode in dedup_modes else 0,
+                format_func=lambda mode: dedup_modes[mode],
+                help="Что делать с фрагментами, почти совпадающими с уже проиндексированными (MinHash)"
+            )
+            if dedup_mode != current_dedup_mode:
+                st .session_state .session_manager .set_setting('dedup_mode', dedup_mode)
+                st .session_state .rag_pipeline .vector_store .dedup_mode = dedup_mode
+                st .success(f"Режим дедупликации обновлен: {dedup_modes[dedup_mode]}")
+            dedup_stats = st .session_state .rag_pipeline .get_system_status()["vector_store"]["dedup"]
+            if dedup_stats .get("checked_chunks"):
+                st .caption(
+                    f"Доля почти дубликатов: {dedup_stats['dedup_ratio']:.1%} "
+                    f"({dedup_stats['duplicate_chunks']} из {dedup_stats['checked_chunks']} фрагментов)")
+
             st .markdown("### Поиск информации")
             col1, col2 = st .columns(2)
 
@@ -1404,3 +1655,48 @@ elif page == "Настройки":
 
                 st .caption("Малое значение: короткие ответы")
                 st .caption("Большое значение: более развернутые ответы")
+
+            judgment_modes = {
+                "concurrent": "Параллельно с генерацией",
+                "deferred": "После показа ответа",
+                "off": "Не выполнять",
+                "fast": "Один запрос с JSON-ответом",
+                "embedding": "По сходству векторов, без LLM"
+            }
+            current_judgment_mode = st .session_state .session_manager .get_setting('judgment_mode', "concurrent")
+            judgment_mode = st .selectbox(
+                "Оценка релевантности и уверенности",
+                options=list(judgment_modes .keys()),
+                index=list(judgment_modes .keys()).index(current_judgment_mode)
+                if current_judgment_mode in judgment_modes else 0,
+                format_func=lambda mode: judgment_modes[mode],
+                help="Дополнительные вызовы LLM для оценки контекста и ответа"
+            )
+            if judgment_mode != current_judgment_mode:
+                st .session_state .session_manager .set_setting('judgment_mode', judgment_mode)
+                st .success(f"Режим оценок обновлен: {judgment_modes[judgment_mode]}")
+
+            llm_cache = st .session_state .rag_pipeline .llm_manager .cache
+            cache_methods = {
+                "answer": "Ответы",
+                "router": "Маршрутизатор",
+                "relevance": "Оценка релевантности",
+                "confidence": "Оценка уверенности"
+            }
+            enabled_cache_methods = st .multiselect(
+                "Кэш ответов LLM",
+                options=list(cache_methods .keys()),
+                default=[method for method in cache_methods if method in llm_cache .enabled_methods],
+                format_func=lambda method: cache_methods[method],
+                help="Повторный запрос с тем же промптом и параметрами берется с диска без обращения к модели"
+            )
+            if set(enabled_cache_methods) != llm_cache .enabled_methods:
+                llm_cache .set_enabled_methods(enabled_cache_methods)
+                st .success("Настройки кэша обновлены")
+            cache_stats = llm_cache .get_stats()
+            st .caption(
+                f"Записей в кэше: {cache_stats['entries']}, попаданий: {cache_stats['hits']} "
+                f"из {cache_stats['hits']+cache_stats['misses']} ({cache_stats['hit_ratio']:.0%})")
+            if st .button("Очистить кэш ответов"):
+                llm_cache .clear()
+                st .success("Кэш ответов очищен")
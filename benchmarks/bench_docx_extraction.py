@@ -0,0 +1,90 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys .path .insert(0, os .path .dirname(os .path .dirname(os .path .abspath(__file__))))
+
+from docx import Document as DocxDocument
+from docx .enum .text import WD_BREAK
+
+from src .document_processor import DocumentProcessor, SimpleProgressTracker
+
+
+def build_docx(path: str, pages: int, paragraphs_per_page: int = 8, table_every: int = 20, seed: int = 7):
+    rng = random .Random(seed)
+    words = ["договор", "сторона", "обязательство", "порядок", "закон", "право", "срок",
+             "организация", "ответственность", "положение", "настоящий", "регламент"]
+    doc = DocxDocument()
+    for page in range(pages):
+        doc .add_heading(f"Статья {page + 1}", level=2)
+        for _ in range(paragraphs_per_page):
+            last_paragraph = doc .add_paragraph(" ".join(rng .choice(words)for _ in range(rng .randint(40, 70))))
+        if table_every and page % table_every == 0:
+            table = doc .add_table(rows=4, cols=3)
+            for row in table .rows:
+                for cell in row .cells:
+                    cell .text = rng .choice(words)
+        last_paragraph .add_run().add_break(WD_BREAK .PAGE)
+    doc .save(path)
+
+
+def legacy_extract(docx_path: str) -> str:
+    doc = DocxDocument(docx_path)
+    text = ""
+    tracker = SimpleProgressTracker()
+    for i, paragraph in enumerate(doc .paragraphs):
+        if paragraph .text .strip():
+            text += paragraph .text + "\n\n"
+        tracker .update_progress(i + 1, len(doc .paragraphs),
+                                f"Обработан параграф {i + 1} из {len(doc .paragraphs)}")
+    for table in doc .tables:
+        for row in table .rows:
+            row_text = []
+            for cell in row .cells:
+                if cell .text .strip():
+                    row_text .append(cell .text .strip())
+            if row_text:
+                text += " |".join(row_text)+"\n"
+    return text .strip()
+
+
+def timed(name: str, func, *args):
+    start = time .perf_counter()
+    result = func(*args)
+    elapsed = time .perf_counter()-start
+    print(f"{name:<24} {elapsed:10.2f} s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse .ArgumentParser(description="DOCX extraction benchmark")
+    parser .add_argument("--pages", type=int, default=2000)
+    parser .add_argument("--legacy-pages", type=int, default=200,
+                        help="the legacy path is quadratic, so it runs on a smaller document")
+    parser .add_argument("--docx", default=None, help="existing DOCX file to reuse")
+    args = parser .parse_args()
+
+    workdir = tempfile .mkdtemp(prefix="docx_bench_")
+    path = args .docx or os .path .join(workdir, f"bench_{args .pages}_pages.docx")
+    if not os .path .exists(path):
+        timed(f"build {args .pages} pages", build_docx, path, args .pages)
+    print(f"file: {path} ({os .path .getsize(path) / 1024 / 1024:.1f} MB)")
+
+    processor = DocumentProcessor(progress_tracker=SimpleProgressTracker())
+    result, elapsed = timed("streaming extraction", processor .extract_text_from_docx, path)
+    print(f"  {len(result['text']):,} chars, {result['metadata']['paragraphs_count']} paragraphs, "
+          f"{result['metadata']['tables_count']} tables, {args .pages / elapsed:.0f} pages/s")
+
+    if args .legacy_pages:
+        small_path = os .path .join(workdir, f"bench_{args .legacy_pages}_pages.docx")
+        build_docx(small_path, args .legacy_pages)
+        _, fast_small = timed(f"streaming ({args .legacy_pages} p)", processor .extract_text_from_docx, small_path)
+        _, legacy_small = timed(f"legacy ({args .legacy_pages} p)", legacy_extract, small_path)
+        print(f"  speedup on {args .legacy_pages} pages: {legacy_small / fast_small:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
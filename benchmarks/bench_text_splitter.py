@@ -0,0 +1,78 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys .path .insert(0, os .path .dirname(os .path .dirname(os .path .abspath(__file__))))
+
+from src .text_splitter import RAGTextSplitter, LEGAL_SEPARATORS
+
+
+def build_legal_text(target_mb: float, seed: int = 42) -> str:
+    rng = random .Random(seed)
+    words = ["договор", "сторона", "обязательство", "порядок", "закон", "право", "срок",
+             "организация", "ответственность", "положение", "настоящий", "регламент"]
+    parts = []
+    size = 0
+    article = 1
+    while size < target_mb * 1024 * 1024:
+        paragraphs = []
+        for _ in range(rng .randint(2, 6)):
+            sentences = []
+            for _ in range(rng .randint(1, 5)):
+                sentence = " ".join(rng .choice(words)for _ in range(rng .randint(5, 25)))
+                sentences .append(sentence .capitalize())
+            paragraphs .append(". ".join(sentences)+".")
+        if rng .random() < 0.05:
+            paragraphs .append(" ".join(rng .choice(words)for _ in range(400)))
+        block = f"\n\nСтатья {article}. "+"\n".join(paragraphs)
+        parts .append(block)
+        size += len(block .encode("utf-8"))
+        article += 1
+    return "".join(parts)
+
+
+def measure(name: str, split, text: str, repeat: int):
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        start = time .perf_counter()
+        chunks = split(text)
+        best = min(best, time .perf_counter()-start)
+    megabytes = len(text .encode("utf-8"))/(1024 * 1024)
+    print(f"{name:<32} {best * 1000:10.1f} ms {megabytes / best:10.2f} MB/s {len(chunks):8d} chunks")
+    return chunks
+
+
+def main():
+    parser = argparse .ArgumentParser(description="Throughput of the RAG text splitter vs LangChain")
+    parser .add_argument("--size-mb", type=float, default=5.0)
+    parser .add_argument("--chunk-size", type=int, default=512)
+    parser .add_argument("--overlap-percent", type=int, default=25)
+    parser .add_argument("--repeat", type=int, default=3)
+    args = parser .parse_args()
+
+    chunk_overlap = int(args .chunk_size * args .overlap_percent / 100)
+    text = build_legal_text(args .size_mb)
+    print(f"text: {len(text):,} chars, chunk_size={args .chunk_size}, chunk_overlap={chunk_overlap}")
+
+    splitter = RAGTextSplitter(chunk_size=args .chunk_size, chunk_overlap=chunk_overlap,
+                               separators=LEGAL_SEPARATORS, keep_separator=True)
+    fast_chunks = measure("RAGTextSplitter", splitter .split_text, text, args .repeat)
+
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("langchain is not installed, skipping the baseline")
+        return
+
+    baseline = RecursiveCharacterTextSplitter(chunk_size=args .chunk_size, chunk_overlap=chunk_overlap,
+                                              length_function=len, separators=LEGAL_SEPARATORS,
+                                              keep_separator=True)
+    baseline_chunks = measure("RecursiveCharacterTextSplitter", baseline .split_text, text, args .repeat)
+    print("identical chunks:", fast_chunks == baseline_chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+import httpx
+import ollama
+from langchain .schema import Document
+from .flow import Flow, aiter_flow, run_flow_async
+
+
+class AsyncRAGPipeline:
+    """Асинхронные пути запроса и индексации поверх ollama.AsyncClient с общим пулом соединений"""
+
+    def __init__(self, pipeline, host: Optional[str] = None, max_connections: int = 8, embed_batch_size: int = 32,
+                 max_concurrent_files: int = 4):
+        self .logger = logging .getLogger(__name__)
+        self .pipeline = pipeline
+        self .host = host
+        self .max_connections = max(1, max_connections)
+        self .embed_batch_size = max(1, embed_batch_size)
+        self .max_concurrent_files = max(1, max_concurrent_files)
+        self ._client: Optional[ollama .AsyncClient] = None
+
+    @property
+    def client(self) -> ollama .AsyncClient:
+        if self ._client is None:
+            self ._client = ollama .AsyncClient(
+                host=self .host,
+                limits=httpx .Limits(max_connections=self .max_connections,
+                                     max_keepalive_connections=self .max_connections))
+        return self ._client
+
+    async def aclose(self):
+        if self ._client is not None:
+            await self ._client .close()
+            self ._client = None
+
+    async def check_models(self) -> Dict[str, bool]:
+        """Параллельно проверяет, что LLM и модель эмбеддингов отвечают"""
+        async def check_llm() -> bool:
+            response = await self .client .generate(
+                model=self .pipeline .llm_manager .model_name, prompt="test", options={"num_predict": 1})
+            return bool(response and 'response'in response)
+
+        async def check_embedding() -> bool:
+            return bool(await self .embed(["test"]))
+
+        results = await asyncio .gather(check_llm(), check_embedding(), return_exceptions=True)
+        for name, result in zip(("LLM", "embedding"), results):
+            if isinstance(result, Exception):
+                self .logger .error(f"{name} model check failed: {str(result)}")
+        return {
+            "llm": results[0]is True,
+            "embedding": results[1]is True
+        }
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Эмбеддинги пачками, отправленными одновременно; число соединений ограничено пулом клиента"""
+        if not texts:
+            return []
+        model = self .pipeline .vector_store .embedding_model
+        batches = [texts[i:i + self .embed_batch_size]for i in range(0, len(texts), self .embed_batch_size)]
+        responses = await asyncio .gather(*(self .client .embed(model=model, input=batch)for batch in batches))
+        embeddings = [list(embedding)for response in responses for embedding in response["embeddings"]]
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Ollama вернула {len(embeddings)} эмбеддингов для {len(texts)} текстов")
+        return embeddings
+
+    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self .embed(texts)
+
+    async def generate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return await self .client .generate(**request)
+
+    async def stream(self, request: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        return await self .client .generate(stream=True, **request)
+
+    async def next_chunk(self, stream: AsyncIterator[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        try:
+            return await stream .__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def call(self, function: Callable[[], Any]) -> Any:
+        return await asyncio .to_thread(function)
+
+    async def spawn(self, flow: Flow) -> asyncio .Task:
+        return asyncio .create_task(run_flow_async(flow, self))
+
+    async def wait(self, task: asyncio .Task) -> Any:
+        return await task
+
+    async def search_similar(self, query: str, k: int = 5, selected_documents: Any = "all",
+                             distance_threshold: float = 0.6, search_method: str = "mmr") -> List[Dict[str, Any]]:
+        return await run_flow_async(self .pipeline .vector_store ._search_flow(
+            query, k=k, selected_documents=selected_documents, distance_threshold=distance_threshold,
+            search_method=search_method), self)
+
+    async def process_query_events(self, query: str, selected_documents: Any = "all", search_k: int = 10,
+                                   search_method: str = "mmr", distance_threshold: float = 0.25,
+                                   confidence_threshold: float = 0.5, temperature: float = 0.2,
+                                   max_tokens: int = 2000, system_prompt_style: str = "Профессиональный",
+                                   judgments: str = "concurrent") -> AsyncIterator[Dict[str, Any]]:
+        """Асинхронный аналог RAGPipeline.process_query_events: тот же поток событий, ввод-вывод через AsyncClient"""
+        async for event in aiter_flow(self .pipeline ._query_flow(
+                query, selected_documents, search_k, search_method, distance_threshold, confidence_threshold,
+                temperature, max_tokens, system_prompt_style, judgments), self):
+            yield event
+
+    async def process_query(self, query: str, **kwargs) -> Dict[str, Any]:
+        response = None
+        async for event in self .process_query_events(query, **kwargs):
+            if event["type"] == "error":
+                return event["response"]
+            if event["type"] == "done":
+                response = event["response"]
+        return response
+
+    async def add_documents(self, documents: List[Document]) -> bool:
+        """Асинхронный аналог VectorStore.add_documents"""
+        return await run_flow_async(self .pipeline .vector_store ._add_documents_flow(documents), self)
+
+    async def ingest_file(self, file_path: str) -> bool:
+        """Асинхронный аналог RAGPipeline.ingest_file"""
+        return await run_flow_async(self .pipeline ._ingest_flow(file_path), self)
+
+    async def ingest_files(self, file_paths: List[str]) -> Dict[str, bool]:
+        """Индексирует файлы одновременно, не более max_concurrent_files за раз"""
+        semaphore = asyncio .Semaphore(self .max_concurrent_files)
+
+        async def ingest(file_path: str) -> bool:
+            async with semaphore:
+                try:
+                    return await self .ingest_file(file_path)
+                except Exception as e:
+                    self .logger .error(f"Error ingesting {file_path}: {str(e)}")
+                    return False
+
+        results = await asyncio .gather(*(ingest(file_path)for file_path in file_paths))
+        return dict(zip(file_paths, results))
+
+
+class BlockingRAGPipeline:
+    """Синхронный фасад для Streamlit: корутины AsyncRAGPipeline выполняются в фоновом цикле событий"""
+
+    def __init__(self, pipeline, **kwargs):
+        self .pipeline = pipeline
+        self .async_pipeline = AsyncRAGPipeline(pipeline, **kwargs)
+        self ._loop = asyncio .new_event_loop()
+        self ._thread = threading .Thread(target=self ._loop .run_forever, name="async-rag", daemon=True)
+        self ._thread .start()
+
+    def _run(self, coroutine):
+        return asyncio .run_coroutine_threadsafe(coroutine, self ._loop).result()
+
+    def check_models(self) -> Dict[str, bool]:
+        return self ._run(self .async_pipeline .check_models())
+
+    def process_query(self, query: str, **kwargs) -> Dict[str, Any]:
+        return self ._run(self .async_pipeline .process_query(query, **kwargs))
+
+    def process_query_events(self, query: str, **kwargs) -> Iterator[Dict[str, Any]]:
+        events = self .async_pipeline .process_query_events(query, **kwargs)
+        try:
+            while True:
+                try:
+                    yield self ._run(events .__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self ._run(events .aclose())
+
+    def ingest_file(self, file_path: str) -> bool:
+        return self ._run(self .async_pipeline .ingest_file(file_path))
+
+    def ingest_files(self, file_paths: List[str]) -> Dict[str, bool]:
+        return self ._run(self .async_pipeline .ingest_files(file_paths))
+
+    def close(self):
+        if self ._loop .is_running():
+            self ._run(self .async_pipeline .aclose())
+            self ._loop .call_soon_threadsafe(self ._loop .stop)
+            self ._thread .join(timeout=5)
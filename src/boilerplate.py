@@ -0,0 +1,74 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+
+class BoilerplateDetector:
+    """Находит строки, повторяющиеся на многих страницах (колонтитулы, номера страниц, дисклеймеры)"""
+
+    def __init__(self, margin_ratio: float = 0.1, margin_page_ratio: float = 0.3, body_page_ratio: float = 0.6,
+                 min_pages: int = 3, min_body_line_length: int = 20):
+        self .margin_ratio = margin_ratio
+        self .margin_page_ratio = margin_page_ratio
+        self .body_page_ratio = body_page_ratio
+        self .min_pages = min_pages
+        self .min_body_line_length = min_body_line_length
+
+    @staticmethod
+    def normalize(line: str) -> str:
+        line = re .sub(r'\d+', '#', line .strip().lower())
+        return re .sub(r'\s+', ' ', line)
+
+    def page_lines(self, blocks: List[tuple], page_height: float) -> List[Tuple[str, bool]]:
+        """Строки страницы из page.get_text("blocks") с признаком попадания в верхнее или нижнее поле"""
+        top = page_height * self .margin_ratio
+        bottom = page_height * (1 - self .margin_ratio)
+        lines = []
+        for block in blocks:
+            if len(block) > 6 and block[6] != 0:
+                continue
+            in_margin = block[3] <= top or block[1] >= bottom
+            text = block[4][:-1]if block[4].endswith("\n")else block[4]
+            for line in text .split("\n"):
+                lines .append((line, in_margin))
+        return lines
+
+    def find_repeated(self, pages: List[List[Tuple[str, bool]]]) -> Set[Tuple[str, bool]]:
+        page_count = len(pages)
+        if page_count < self .min_pages:
+            return set()
+
+        counts = Counter()
+        for lines in pages:
+            counts .update({(self .normalize(line), in_margin)for line, in_margin in lines if line .strip()})
+
+        margin_threshold = max(self .min_pages, page_count * self .margin_page_ratio)
+        body_threshold = max(self .min_pages, page_count * self .body_page_ratio)
+        repeated = set()
+        for (key, in_margin), count in counts .items():
+            if in_margin and count >= margin_threshold:
+                repeated .add((key, in_margin))
+            elif not in_margin and count >= body_threshold and len(key) >= self .min_body_line_length:
+                repeated .add((key, in_margin))
+        return repeated
+
+    def strip(self, pages: List[List[Tuple[str, bool]]]) -> Tuple[List[str], Dict[str, Any]]:
+        """Возвращает тексты страниц без повторяющихся строк и статистику удаленного"""
+        repeated = self .find_repeated(pages)
+        texts = []
+        removed_lines = 0
+        removed_chars = 0
+        for lines in pages:
+            kept = []
+            for line, in_margin in lines:
+                if line .strip()and (self .normalize(line), in_margin)in repeated:
+                    removed_lines += 1
+                    removed_chars += len(line)+1
+                    continue
+                kept .append(line)
+            texts .append("\n".join(kept).strip())
+        return texts, {
+            "boilerplate_patterns": len(repeated),
+            "boilerplate_lines_removed": removed_lines,
+            "boilerplate_chars_removed": removed_chars
+        }
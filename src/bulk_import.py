@@ -0,0 +1,212 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+from langchain .schema import Document
+
+try:
+    import pyarrow .parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+TEXT_FIELDS = ("text", "content", "page_content")
+VECTOR_FIELDS = ("embedding", "vector")
+FILE_METADATA_KEYS = ("filename", "file_path", "content_hash")
+
+
+def _is_missing(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float)and math .isnan(value):
+        return True
+    return False
+
+
+def _plain(value: Any) -> Any:
+    return value .tolist()if hasattr(value, "tolist")else str(value)
+
+
+def _metadata_value(value: Any) -> Any:
+    """Скалярное значение метаданных: numpy-скаляры приводятся к Python, списки и словари кодируются в JSON"""
+    if hasattr(value, "item")and not hasattr(value, "__len__"):
+        value = value .item()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return json .dumps(_plain(value)if hasattr(value, "tolist")else value, ensure_ascii=False, default=_plain)
+
+
+def iter_rows(path: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """Читает JSONL или Parquet пачками строк, не загружая файл в память целиком"""
+    extension = os .path .splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        batch = []
+        with open(path, "r", encoding="utf-8")as f:
+            for line_number, line in enumerate(f, 1):
+                if not line .strip():
+                    continue
+                try:
+                    batch .append(json .loads(line))
+                except json .JSONDecodeError as e:
+                    batch .append({"_error": f"line {line_number}: {str(e)}"})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+    elif extension in (".parquet", ".pq"):
+        if PYARROW_AVAILABLE:
+            parquet_file = pq .ParquetFile(path)
+            for record_batch in parquet_file .iter_batches(batch_size=batch_size):
+                yield record_batch .to_pylist()
+        else:
+            import pandas as pd
+            frame = pd .read_parquet(path)
+            for offset in range(0, len(frame), batch_size):
+                yield frame .iloc[offset:offset + batch_size].to_dict("records")
+    else:
+        raise ValueError(f"Unsupported import format: {extension} (expected .jsonl or .parquet)")
+
+
+class BulkImporter:
+    """Загрузка готовых фрагментов (текст, метаданные, необязательный вектор) прямо в векторную базу"""
+
+    def __init__(self, vector_store, batch_size: int = 1000, embed_batch_size: int = 64, dedup: bool = True,
+                 file_keys: Iterable[str] = FILE_METADATA_KEYS):
+        self .logger = logging .getLogger(__name__)
+        self .vector_store = vector_store
+        max_batch_size = vector_store .client .get_max_batch_size()
+        self .batch_size = max(1, min(batch_size, max_batch_size))
+        self .embed_batch_size = max(1, embed_batch_size)
+        self .dedup = dedup
+        self .file_keys = tuple(file_keys)
+        self .dimension = vector_store .get_embedding_dimension()
+
+    def _parse_row(self, row: Dict[str, Any], row_number: int, source: str) -> Dict[str, Any]:
+        if "_error"in row:
+            raise ValueError(row["_error"])
+
+        text = next((row[field]for field in TEXT_FIELDS if isinstance(row .get(field), str)), None)
+        if not text or not text .strip():
+            raise ValueError("missing text")
+
+        metadata = row .get("metadata")or {}
+        if isinstance(metadata, str):
+            metadata = json .loads(metadata)
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata must be an object")
+        reserved = set(TEXT_FIELDS)|set(VECTOR_FIELDS)|{"metadata", "id"}
+        for key, value in row .items():
+            if key not in reserved and key not in metadata:
+                metadata[key] = value
+        metadata = {key: _metadata_value(value)for key, value in metadata .items()if not _is_missing(value)}
+        for key in ("chunk_id", "start", "end"):
+            if key in metadata and (isinstance(metadata[key], bool)or not isinstance(metadata[key], int)):
+                raise ValueError(f"{key} must be an integer")
+        metadata .setdefault("filename", os .path .basename(metadata .get("file_path", ""))or os .path .basename(source))
+        metadata .setdefault("chunk_id", row_number)
+
+        vector = next((row[field]for field in VECTOR_FIELDS if row .get(field)is not None), None)
+        if vector is not None:
+            vector = [float(value)for value in vector]
+            if self .dimension is not None and len(vector) != self .dimension:
+                raise ValueError(f"vector dimension {len(vector)} does not match collection dimension {self .dimension}")
+
+        return {
+            "id": str(row["id"])if row .get("id")is not None else None,
+            "document": Document(page_content=text, metadata=metadata),
+            "vector": vector
+        }
+
+    def _ids(self, items: List[Dict[str, Any]]) -> List[str]:
+        default_ids = self .vector_store ._document_ids([item["document"]for item in items])
+        return [item["id"]or default_id for item, default_id in zip(items, default_ids)]
+
+    def import_file(self, path: str, progress_callback=None) -> Dict[str, Any]:
+        """Импортирует файл и возвращает отчет о количестве строк, векторов и вызовов модели"""
+        report = {
+            "file": path,
+            "rows": 0,
+            "imported": 0,
+            "precomputed_vectors": 0,
+            "embedded": 0,
+            "duplicates": 0,
+            "invalid": 0,
+            "errors": [],
+            "dimension": self .dimension
+        }
+        start = time .perf_counter()
+        row_number = 0
+
+        for rows in iter_rows(path, self .batch_size):
+            parsed = []
+            for row in rows:
+                row_number += 1
+                try:
+                    parsed .append(self ._parse_row(row, row_number - 1, path))
+                except Exception as e:
+                    report["invalid"] += 1
+                    if len(report["errors"]) < 20:
+                        report["errors"].append(f"row {row_number}: {str(e)}")
+            report["rows"] += len(rows)
+
+            if self .dedup and parsed:
+                kept = {id(document)for document in self .vector_store .filter_duplicates(
+                    [item["document"]for item in parsed], ids=self ._ids(parsed))}
+                report["duplicates"] += len(parsed)-len(kept)
+                parsed = [item for item in parsed if id(item["document"])in kept]
+
+            missing = [item for item in parsed if item["vector"]is None]
+            for offset in range(0, len(missing), self .embed_batch_size):
+                group = missing[offset:offset + self .embed_batch_size]
+                embeddings = self .vector_store .embed_texts([item["document"].page_content for item in group])
+                for item, embedding in zip(group, embeddings):
+                    item["vector"] = embedding
+                report["embedded"] += len(group)
+            report["precomputed_vectors"] += len(parsed)-len(missing)
+
+            if parsed and self .dimension is None:
+                self .dimension = len(parsed[0]["vector"])
+                report["dimension"] = self .dimension
+            valid = []
+            rejected = []
+            for item in parsed:
+                if len(item["vector"]) != self .dimension:
+                    rejected .append(item)
+                    report["invalid"] += 1
+                    if len(report["errors"]) < 20:
+                        report["errors"].append(
+                            f"{item['document'].metadata .get('filename')}#{item['document'].metadata .get('chunk_id')}: "
+                            f"vector dimension {len(item['vector'])} does not match {self .dimension}")
+                    continue
+                valid .append(item)
+            if self .dedup and rejected:
+                self .vector_store .forget_documents(
+                    [item["document"]for item in rejected], ids=self ._ids(rejected))
+
+            if valid:
+                try:
+                    self .vector_store .upsert_embedded_documents(
+                        [item["document"]for item in valid],
+                        [item["vector"]for item in valid],
+                        ids=[item["id"]for item in valid],
+                        file_keys=self .file_keys)
+                except Exception:
+                    if self .dedup:
+                        self .vector_store .forget_documents(
+                            [item["document"]for item in valid], ids=self ._ids(valid))
+                    raise
+                report["imported"] += len(valid)
+
+            if progress_callback:
+                progress_callback(report)
+
+        if self .dedup:
+            self .vector_store .dedup_index .save()
+        elapsed = time .perf_counter()-start
+        report["elapsed_seconds"] = elapsed
+        report["rows_per_second"] = report["rows"]/elapsed if elapsed > 0 else 0.0
+        return report
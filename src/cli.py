@@ -0,0 +1,451 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List
+from .bulk_import import BulkImporter, FILE_METADATA_KEYS
+from .directory_watcher import SUPPORTED_EXTENSIONS
+from .main import RAGPipeline
+from .notify import notifier
+from .progress import SimpleProgressTracker, LogProgressSink, StageTimingSink
+from .snapshot import SnapshotManager
+
+
+logger = logging .getLogger("rag.cli")
+
+
+def collect_files(paths: List[str], recursive: bool = False) -> List[str]:
+    """Раскрывает список файлов и папок в отсортированный список поддерживаемых файлов"""
+    files = []
+    for path in paths:
+        if os .path .isfile(path):
+            files .append(os .path .abspath(path))
+        elif os .path .isdir(path):
+            if recursive:
+                for root, dirs, names in os .walk(path):
+                    dirs[:] = [d for d in dirs if not d .startswith('.')]
+                    files .extend(os .path .abspath(os .path .join(root, name))
+                                 for name in names if name .lower().endswith(SUPPORTED_EXTENSIONS))
+            else:
+                files .extend(os .path .abspath(os .path .join(path, name))for name in os .listdir(path)
+                             if name .lower().endswith(SUPPORTED_EXTENSIONS)and os .path .isfile(os .path .join(path, name)))
+        else:
+            logger .warning(f"Path not found: {path}")
+    return sorted(set(files))
+
+
+def build_pipeline(args, tracker=None) -> RAGPipeline:
+    chunk_overlap = int(args .chunk_size * args .chunk_overlap / 100)
+    return RAGPipeline(progress_tracker=tracker, chunk_size=args .chunk_size, chunk_overlap=chunk_overlap,
+                       dedup_mode=args .dedup_mode)
+
+
+def ingest_files(args, files: List[str], force: bool) -> Dict[str, Any]:
+    timing = StageTimingSink()
+    sinks = [timing]
+    if args .progress_interval > 0:
+        sinks .append(LogProgressSink(logger, min_interval=args .progress_interval, as_json=args .json))
+    tracker = SimpleProgressTracker(sinks=sinks)
+    pipeline = build_pipeline(args, tracker)
+    document_processor = pipeline .document_processor
+    vector_store = pipeline .vector_store
+
+    report = {
+        "files": len(files),
+        "indexed": 0,
+        "skipped": 0,
+        "failed": 0,
+        "pages": 0,
+        "chunks": 0,
+        "embeddings": 0,
+        "boilerplate_chars_saved": 0,
+        "boilerplate_chunks_saved": 0,
+        "duplicate_chunks": 0
+    }
+
+    start = time .perf_counter()
+    tracker .start_session(len(files), "Ingest")
+    for path in files:
+        tracker .start_file(os .path .basename(path), 5)
+        try:
+            content_hash = document_processor .compute_file_hash(path)
+            existing_filename = vector_store .find_filename_by_content_hash(content_hash)
+            if existing_filename and not force:
+                report["skipped"] += 1
+                tracker .complete_file()
+                continue
+
+            documents = document_processor .process_file(path)
+            if not documents:
+                report["failed"] += 1
+                tracker .set_error(f"No chunks extracted from {path}")
+                continue
+
+            vector_store .delete_documents_by_file_path(path, keep_text=True)
+            duplicates_before = vector_store .dedup_index .get_stats()["duplicate_chunks"]
+            if not vector_store .add_documents(documents):
+                report["failed"] += 1
+                continue
+            duplicates = 0
+            if vector_store .dedup_mode != "keep":
+                duplicates = vector_store .dedup_index .get_stats()["duplicate_chunks"]-duplicates_before
+            stored = len(documents)-duplicates
+
+            first_metadata = documents[0].metadata
+            page_count = first_metadata .get("page_count")
+            if isinstance(page_count, int):
+                report["pages"] += page_count
+            report["boilerplate_chars_saved"] += first_metadata .get("boilerplate_chars_removed", 0)
+            report["boilerplate_chunks_saved"] += first_metadata .get("boilerplate_chunks_saved", 0)
+            report["duplicate_chunks"] += duplicates
+            report["chunks"] += stored
+            report["embeddings"] += stored
+            report["indexed"] += 1
+            tracker .complete_file()
+        except Exception as e:
+            report["failed"] += 1
+            tracker .set_error(f"{path}: {str(e)}")
+
+    tracker .finish_session(report["failed"] == 0)
+    elapsed = time .perf_counter()-start
+
+    report["elapsed_seconds"] = elapsed
+    add_throughput(report, timing .stage_seconds, timing .stage_seconds .get("generating_embeddings", 0.0))
+    report["dedup_ratio"] = vector_store .dedup_index .get_stats()["dedup_ratio"]
+    return report
+
+
+def ingest_files_staged(args, files: List[str], force: bool) -> Dict[str, Any]:
+    sinks = []
+    if args .progress_interval > 0:
+        sinks .append(LogProgressSink(logger, min_interval=args .progress_interval, as_json=args .json))
+    tracker = SimpleProgressTracker(sinks=sinks)
+    pipeline = build_pipeline(args, tracker)
+
+    skipped = 0
+    if not force:
+        pending = []
+        for path in files:
+            content_hash = pipeline .document_processor .compute_file_hash(path)
+            if pipeline .vector_store .find_filename_by_content_hash(content_hash):
+                skipped += 1
+            else:
+                pending .append(path)
+        files = pending
+
+    report = pipeline .ingest_files_staged(
+        files, extract_workers=args .extract_workers, embed_workers=args .embed_workers,
+        batch_size=args .batch_size)
+    tracker .finish_session(not report["failed"])
+    report["files"] += skipped
+    report["skipped"] = skipped
+    report["embeddings"] = report["stages"]["embed"]["items"]
+    stage_seconds = {name: stage["busy_seconds"]for name, stage in report["stages"].items()}
+    add_throughput(report, stage_seconds, stage_seconds["embed"])
+    return report
+
+
+def add_throughput(report: Dict[str, Any], stage_seconds: Dict[str, float], embedding_seconds: float):
+    """Одинаковые формулы скорости для обычного и конвейерного режимов: эмбеддинги - на секунду их генерации"""
+    elapsed = report["elapsed_seconds"]
+    report["pages_per_second"] = report["pages"]/elapsed if elapsed > 0 else 0.0
+    report["chunks_per_second"] = report["chunks"]/elapsed if elapsed > 0 else 0.0
+    report["embeddings_per_second"] = report["embeddings"]/embedding_seconds if embedding_seconds > 0 else 0.0
+    report["stage_seconds"] = stage_seconds
+
+
+def print_report(report: Dict[str, Any], as_json: bool):
+    if as_json:
+        print(json .dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    failed = len(report["failed"])if isinstance(report["failed"], dict)else report["failed"]
+    print(f"files: {report['files']} (indexed {report['indexed']}, skipped {report['skipped']}, "
+          f"failed {failed})")
+    print(f"elapsed: {report['elapsed_seconds']:.2f} s")
+    print(f"pages: {report['pages']} ({report['pages_per_second']:.1f} pages/s)")
+    print(f"chunks: {report['chunks']} ({report['chunks_per_second']:.1f} chunks/s)")
+    print(f"embeddings: {report['embeddings']} ({report['embeddings_per_second']:.1f} embeddings/s)")
+    print(f"boilerplate removed: {report['boilerplate_chars_saved']:,} chars, "
+          f"~{report['boilerplate_chunks_saved']} chunks saved")
+    print(f"near-duplicate chunks: {report['duplicate_chunks']} (collection dedup ratio {report['dedup_ratio']:.1%})")
+    if report["stage_seconds"]:
+        print("stage time:")
+        for stage, seconds in sorted(report["stage_seconds"].items(), key=lambda item: -item[1]):
+            share = seconds / report["elapsed_seconds"]*100 if report["elapsed_seconds"] > 0 else 0.0
+            print(f"  {stage:<24} {seconds:10.2f} s {share:6.1f}%")
+    if report .get("stages"):
+        print("pipeline stages:")
+        for name, stage in report["stages"].items():
+            print(f"  {name:<8} workers={stage['workers']} items={stage['items']} "
+                  f"utilization={stage['utilization'] * 100:5.1f}% starved={stage['starvation'] * 100:5.1f}% "
+                  f"backpressure={stage['backpressure'] * 100:5.1f}% max_queue={stage['max_queue_depth']}")
+    if isinstance(report["failed"], dict):
+        for path, error in report["failed"].items():
+            print(f"  failed: {path}: {error}")
+
+
+def cmd_ingest(args) -> int:
+    files = collect_files(args .paths, recursive=args .recursive)
+    if not files:
+        logger .error("No supported files (PDF, DOCX, TXT) found")
+        return 1
+    if args .staged:
+        report = ingest_files_staged(args, files, force=args .force)
+    else:
+        report = ingest_files(args, files, force=args .force)
+    print_report(report, args .json)
+    return 0 if not report["failed"]else 2
+
+
+def cmd_reindex(args) -> int:
+    files = collect_files([args .directory], recursive=args .recursive)
+    if not files:
+        logger .error(f"No supported files found in {args .directory}")
+        return 1
+    if args .clear:
+        pipeline = build_pipeline(args)
+        if not pipeline .clear_all_data():
+            return 1
+    if args .staged:
+        report = ingest_files_staged(args, files, force=True)
+    else:
+        report = ingest_files(args, files, force=True)
+    print_report(report, args .json)
+    return 0 if not report["failed"]else 2
+
+
+def cmd_delete(args) -> int:
+    pipeline = build_pipeline(args)
+    results = pipeline .vector_store .delete_documents_by_filenames(args .filenames)
+    return print_results(results, args .json, "deleted")
+
+
+def print_results(results: Dict[str, bool], as_json: bool, done: str) -> int:
+    if as_json:
+        print(json .dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for filename, success in results .items():
+            print(f"{filename}: {done if success else 'not found'}")
+    return 0 if all(results .values())else 2
+
+
+def parse_tag(value: str):
+    if value == "":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    if value .lower()in ("true", "false"):
+        return value .lower() == "true"
+    return value
+
+
+def cmd_rename(args) -> int:
+    pipeline = build_pipeline(args)
+    results = pipeline .vector_store .rename_documents({args .old_filename: args .new_filename})
+    return print_results(results, args .json, f"renamed to {args .new_filename}")
+
+
+def cmd_tag(args) -> int:
+    tags = {}
+    for assignment in args .set:
+        key, separator, value = assignment .partition("=")
+        if not separator or not key:
+            logger .error(f"Expected key=value, got: {assignment}")
+            return 1
+        tags[key] = parse_tag(value)
+    pipeline = build_pipeline(args)
+    try:
+        results = pipeline .vector_store .tag_documents(args .filenames, tags)
+    except ValueError as e:
+        logger .error(str(e))
+        return 1
+    return print_results(results, args .json, "tagged")
+
+
+def cmd_stats(args) -> int:
+    pipeline = build_pipeline(args)
+    collection_info = pipeline .vector_store .get_collection_info()
+    document_summary = pipeline .vector_store .get_document_summary()
+    stats = {
+        "collection_name": collection_info .get("collection_name"),
+        "persist_directory": collection_info .get("persist_directory"),
+        "total_chunks": collection_info .get("document_count", 0),
+        "unique_files": document_summary .get("unique_files", 0),
+        "dedup_mode": collection_info .get("dedup_mode"),
+        "dedup": collection_info .get("dedup", {}),
+        "files": document_summary .get("file_details", {})
+    }
+    if args .json:
+        print(json .dumps(stats, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(f"collection: {stats['collection_name']} ({stats['persist_directory']})")
+        print(f"chunks: {stats['total_chunks']}")
+        print(f"files: {stats['unique_files']}")
+        dedup = stats["dedup"]
+        if dedup:
+            print(f"dedup ({stats['dedup_mode']}): ratio {dedup['dedup_ratio']:.1%}, "
+                  f"{dedup['duplicate_chunks']} of {dedup['checked_chunks']} checked chunks, "
+                  f"{dedup['linked_chunks']} linked")
+        for filename, details in sorted(stats["files"].items()):
+            print(f"  {filename:<48} {details['chunk_count']:6d} chunks  pages: {details['page_count']}")
+    return 0
+
+
+def cmd_import(args) -> int:
+    pipeline = build_pipeline(args)
+    importer = BulkImporter(pipeline .vector_store, batch_size=args .import_batch_size,
+                            embed_batch_size=args .batch_size, dedup=not args .no_dedup,
+                            file_keys=[key .strip()for key in args .file_keys .split(",")if key .strip()])
+    reports = []
+    for path in args .paths:
+        try:
+            reports .append(importer .import_file(
+                path, progress_callback=lambda report: logger .info(
+                    f"{report['file']}: {report['rows']} rows read, {report['imported']} imported")))
+        except Exception as e:
+            logger .error(f"Import of {path} failed: {str(e)}")
+            reports .append({"file": path, "error": str(e)})
+
+    if args .json:
+        print(json .dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            if "error"in report:
+                print(f"{report['file']}: failed: {report['error']}")
+                continue
+            print(f"{report['file']}: {report['imported']} of {report['rows']} rows imported "
+                  f"({report['rows_per_second']:.0f} rows/s), dimension {report['dimension']}")
+            print(f"  precomputed vectors: {report['precomputed_vectors']}, embedded: {report['embedded']}, "
+                  f"duplicates: {report['duplicates']}, invalid: {report['invalid']}")
+            for error in report["errors"]:
+                print(f"  invalid: {error}")
+    return 0 if all("error"not in report and not report["invalid"]for report in reports)else 2
+
+
+def cmd_migrate(args) -> int:
+    pipeline = build_pipeline(args)
+    migrated = pipeline .vector_store .migrate_legacy_metadata()
+    if args .json:
+        print(json .dumps(migrated, ensure_ascii=False, indent=2))
+    else:
+        print(f"migrated {migrated['chunks']} chunks of {migrated['documents']} documents")
+    return 0
+
+
+def cmd_export(args) -> int:
+    pipeline = build_pipeline(args)
+    manifest = SnapshotManager(pipeline .vector_store).export(args .path, float16=args .float16)
+    if args .json:
+        print(json .dumps(manifest, ensure_ascii=False, indent=2))
+    else:
+        print(f"exported {manifest['chunk_count']} chunks of {manifest['document_count']} documents to {args .path} "
+              f"({manifest['dtype']}, corpus version {manifest['corpus_version']})")
+    return 0
+
+
+def cmd_import_snapshot(args) -> int:
+    pipeline = build_pipeline(args)
+    try:
+        report = SnapshotManager(pipeline .vector_store).import_snapshot(args .path, replace=not args .merge)
+    except (ValueError, RuntimeError)as e:
+        logger .error(f"Snapshot import failed: {str(e)}")
+        return 2
+    if args .json:
+        print(json .dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"imported {report['chunks']} chunks of {report['documents']} documents in "
+              f"{report['elapsed_seconds']:.2f}s (corpus version {report['manifest']['corpus_version']})")
+    return 0
+
+
+def build_parser() -> argparse .ArgumentParser:
+    parser = argparse .ArgumentParser(
+        prog="python -m src.cli", description="Headless document ingestion for the RAG system")
+    parser .add_argument("--chunk-size", type=int, default=512)
+    parser .add_argument("--chunk-overlap", type=int, default=25, help="overlap in percent of the chunk size")
+    parser .add_argument("--progress-interval", type=float, default=5.0,
+                        help="seconds between progress log lines, 0 disables them")
+    parser .add_argument("--json", action="store_true", help="machine-readable output")
+    parser .add_argument("-v", "--verbose", action="store_true")
+    parser .add_argument("--staged", action="store_true",
+                        help="run extraction, embedding and storage concurrently")
+    parser .add_argument("--extract-workers", type=int, default=2)
+    parser .add_argument("--embed-workers", type=int, default=2)
+    parser .add_argument("--batch-size", type=int, default=32, help="chunks per embedding request in staged mode")
+    parser .add_argument("--dedup-mode", choices=["link", "skip", "keep"], default="link",
+                        help="near-duplicate chunks: link to the original, skip them or keep every copy")
+    subparsers = parser .add_subparsers(dest="command", required=True)
+
+    ingest = subparsers .add_parser("ingest", help="index files or directories")
+    ingest .add_argument("paths", nargs="+")
+    ingest .add_argument("-r", "--recursive", action="store_true")
+    ingest .add_argument("--force", action="store_true", help="reindex files whose content is already indexed")
+    ingest .set_defaults(func=cmd_ingest)
+
+    reindex = subparsers .add_parser("reindex", help="reindex every file in the documents directory")
+    reindex .add_argument("--directory", default="./data/documents")
+    reindex .add_argument("-r", "--recursive", action="store_true")
+    reindex .add_argument("--clear", action="store_true", help="drop the collection before reindexing")
+    reindex .set_defaults(func=cmd_reindex)
+
+    delete = subparsers .add_parser("delete", help="delete documents by filename")
+    delete .add_argument("filenames", nargs="+")
+    delete .set_defaults(func=cmd_delete)
+
+    rename = subparsers .add_parser("rename", help="rename a document without rewriting its chunks")
+    rename .add_argument("old_filename")
+    rename .add_argument("new_filename")
+    rename .set_defaults(func=cmd_rename)
+
+    tag = subparsers .add_parser("tag", help="set file-level metadata on documents")
+    tag .add_argument("filenames", nargs="+")
+    tag .add_argument("--set", action="append", required=True, metavar="KEY=VALUE",
+                     help="metadata to set, an empty value removes the key")
+    tag .set_defaults(func=cmd_tag)
+
+    stats = subparsers .add_parser("stats", help="show collection statistics")
+    stats .set_defaults(func=cmd_stats)
+
+    bulk_import = subparsers .add_parser(
+        "import", help="import pre-chunked rows (text, metadata, optional embedding) from JSONL or Parquet")
+    bulk_import .add_argument("paths", nargs="+")
+    bulk_import .add_argument("--import-batch-size", type=int, default=1000, help="rows written per batch")
+    bulk_import .add_argument("--no-dedup", action="store_true", help="do not check imported chunks for near duplicates")
+    bulk_import .add_argument("--file-keys", default=",".join(FILE_METADATA_KEYS),
+                              help="comma-separated metadata keys shared by the whole file; other keys stay per chunk")
+    bulk_import .set_defaults(func=cmd_import)
+
+    migrate = subparsers .add_parser(
+        "migrate", help="move per-file metadata out of legacy chunks into the documents table")
+    migrate .set_defaults(func=cmd_migrate)
+
+    export = subparsers .add_parser("export", help="export the collection as a snapshot bundle")
+    export .add_argument("path")
+    export .add_argument("--float16", action="store_true", help="store embeddings as float16")
+    export .set_defaults(func=cmd_export)
+
+    import_snapshot = subparsers .add_parser(
+        "import-snapshot", help="load a snapshot bundle without calling the embedding model")
+    import_snapshot .add_argument("path")
+    import_snapshot .add_argument("--merge", action="store_true", help="keep the current collection and upsert into it")
+    import_snapshot .set_defaults(func=cmd_import_snapshot)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging .basicConfig(
+        level=logging .DEBUG if args .verbose else logging .INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    notifier .set_headless(True)
+    return args .func(args)
+
+
+if __name__ == "__main__":
+    sys .exit(main())
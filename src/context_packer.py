@@ -0,0 +1,212 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .text_splitter import merge_overlapping_texts
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+try:
+    from rank_bm25 import BM25Okapi
+    BM25_AVAILABLE = True
+except ImportError:
+    BM25_AVAILABLE = False
+
+
+PACKING_METADATA_KEYS = (
+    "tokens", "prompt_tokens", "budget", "context_window", "chunks_used", "chunks_total", "passages",
+    "overlap_tokens_saved", "compressed_chunks", "max_tokens")
+
+
+def packing_metadata(packing: Dict[str, Any]) -> Dict[str, Any]:
+    """Сведения об упаковке контекста для метаданных ответа, без самих текстов"""
+    return {key: packing[key]for key in PACKING_METADATA_KEYS if key in packing}
+
+
+class TokenCounter:
+    """Подсчет токенов через tiktoken, а без него - по оценке символов на токен"""
+
+    def __init__(self, encoding_name: str = "cl100k_base", chars_per_token: float = 3.0):
+        self .logger = logging .getLogger(__name__)
+        self .chars_per_token = chars_per_token
+        self ._encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self ._encoding = tiktoken .get_encoding(encoding_name)
+            except Exception as e:
+                self .logger .warning(f"tiktoken encoding {encoding_name} unavailable, estimating tokens: {str(e)}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self ._encoding is not None:
+            return len(self ._encoding .encode(text, disallowed_special=()))
+        return int(len(text)/self .chars_per_token)+1
+
+
+class ContextPacker:
+    """Набирает фрагменты в порядке релевантности, пока они помещаются в бюджет токенов"""
+
+    def __init__(self, token_counter: Optional[TokenCounter] = None, separator: str = "\n\n",
+                 safety_margin: int = 128):
+        self .token_counter = token_counter or TokenCounter()
+        self .separator = separator
+        self .safety_margin = safety_margin
+
+    def budget(self, context_window: int, max_tokens: int, prompt_overhead: int) -> int:
+        """Токены, остающиеся под контекст после ответа, системного промпта, вопроса и запаса"""
+        return max(0, context_window - max_tokens - prompt_overhead - self .safety_margin)
+
+    def _passage(self, search_results: List[Dict[str, Any]], members: List[int], source: Any) -> Dict[str, Any]:
+        contents = [search_results[index]["content"]for index in members]
+        content = merge_overlapping_texts(contents, separator=self .separator)
+        best = max(members, key=lambda index: search_results[index].get("similarity", 0.0))
+        tokens = self .token_counter .count(content)
+        source_tokens = self .token_counter .count(self .separator .join(contents))
+        return {
+            "content": content,
+            "index": best,
+            "members": members,
+            "source": source,
+            "position": search_results[members[0]]["metadata"].get("chunk_id", 0)if source is not None else 0,
+            "similarity": search_results[best].get("similarity", 0.0),
+            "tokens": tokens,
+            "saved_tokens": max(0, source_tokens - tokens)
+        }
+
+    def merge_adjacent(self, search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Склеивает фрагменты одного файла с соседними chunk_id, убирая перекрытие, в порядке документа"""
+        passages = []
+        groups: Dict[Any, List[int]] = {}
+        for index, result in enumerate(search_results):
+            metadata = result .get("metadata")or {}
+            source = metadata .get("doc_id")or metadata .get("file_path")or metadata .get("filename")
+            if source is None or not isinstance(metadata .get("chunk_id"), int):
+                passages .append(self ._passage(search_results, [index], None))
+            else:
+                groups .setdefault(source, []).append(index)
+
+        for source, members in groups .items():
+            members .sort(key=lambda index: search_results[index]["metadata"]["chunk_id"])
+            run = [members[0]]
+            for index in members[1:]:
+                step = search_results[index]["metadata"]["chunk_id"]-search_results[run[-1]]["metadata"]["chunk_id"]
+                if step <= 1:
+                    run .append(index)
+                else:
+                    passages .append(self ._passage(search_results, run, source))
+                    run = [index]
+            passages .append(self ._passage(search_results, run, source))
+        return passages
+
+    def pack(self, search_results: List[Dict[str, Any]], budget: int,
+             passages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        if passages is None:
+            passages = self .merge_adjacent(search_results)
+        passages = sorted(passages, key=lambda passage: passage["similarity"], reverse=True)
+        separator_tokens = self .token_counter .count(self .separator)
+        selected = []
+        tokens = 0
+        for passage in passages:
+            passage_tokens = passage["tokens"]+(separator_tokens if selected else 0)
+            if tokens + passage_tokens > budget:
+                continue
+            selected .append(passage)
+            tokens += passage_tokens
+
+        source_rank: Dict[Any, int] = {}
+        document_order = []
+        for rank, passage in enumerate(selected):
+            if passage["source"]is not None:
+                rank = source_rank .setdefault(passage["source"], rank)
+            document_order .append((rank, passage["position"]))
+        selected = [selected[i]for i in sorted(range(len(selected)), key=lambda i: document_order[i])]
+
+        chunks = [passage["content"]for passage in selected]
+        return {
+            "context": self .separator .join(chunks),
+            "chunks": chunks,
+            "indices": [passage["index"]for passage in selected],
+            "members": [passage["members"]for passage in selected],
+            "tokens": tokens,
+            "budget": budget,
+            "chunks_used": sum(len(passage["members"])for passage in selected),
+            "chunks_total": len(search_results),
+            "passages": len(chunks),
+            "overlap_tokens_saved": sum(passage["saved_tokens"]for passage in selected),
+            "compressed_chunks": 0
+        }
+
+
+class ExtractiveCompressor:
+    """Сжимает фрагменты до предложений, ближе всего к запросу по BM25 и сходству исходного фрагмента, без вызовов моделей"""
+
+    def __init__(self, token_counter: TokenCounter, similarity_weight: float = 0.3,
+                 min_sentence_chars: int = 20, separator: str = "\n\n"):
+        self .token_counter = token_counter
+        self .similarity_weight = similarity_weight
+        self .min_sentence_chars = min_sentence_chars
+        self .separator = separator
+
+    def split_sentences(self, text: str) -> List[str]:
+        sentences = [sentence .strip()for sentence in re .split(r'(?<=[.!?…;])\s+|\n+', text)]
+        return [sentence for sentence in sentences if len(sentence) >= self .min_sentence_chars]
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        return re .findall(r'\w+', text .lower())
+
+    def _keyword_scores(self, query: str, sentences: List[str]) -> np .ndarray:
+        query_terms = self ._tokenize(query)
+        if not query_terms:
+            return np .zeros(len(sentences), dtype=np .float32)
+        if BM25_AVAILABLE:
+            scores = np .asarray(
+                BM25Okapi([self ._tokenize(sentence)or [""]for sentence in sentences]).get_scores(query_terms),
+                dtype=np .float32)
+        else:
+            terms = set(query_terms)
+            scores = np .asarray(
+                [len(terms & set(self ._tokenize(sentence)))/len(terms)for sentence in sentences], dtype=np .float32)
+        scores = np .maximum(scores, 0.0)
+        top = float(scores .max())if len(scores)else 0.0
+        return scores / top if top > 0 else scores
+
+    def compress(self, query: str, texts: List[str], budget: int,
+                 similarities: Optional[List[float]] = None) -> List[Tuple[int, str]]:
+        """Лучшие предложения в пределах budget токенов: пары (номер текста, выдержка) в исходном порядке.
+
+        similarities - уже посчитанное при поиске сходство каждого текста с запросом.
+        """
+        positions = []
+        sentences = []
+        for text_index, text in enumerate(texts):
+            for sentence_index, sentence in enumerate(self .split_sentences(text)):
+                positions .append((text_index, sentence_index))
+                sentences .append(sentence)
+        if not sentences or budget <= 0:
+            return []
+
+        scores = self ._keyword_scores(query, sentences)
+        if similarities is not None:
+            priors = np .asarray([similarities[text_index]for text_index, _ in positions], dtype=np .float32)
+            scores = self .similarity_weight * priors +(1 - self .similarity_weight)*scores
+
+        separator_tokens = self .token_counter .count(self .separator)
+        selected = []
+        tokens = 0
+        for position in np .argsort(-scores, kind="stable"):
+            sentence_tokens = self .token_counter .count(sentences[position])+separator_tokens
+            if tokens + sentence_tokens > budget:
+                continue
+            selected .append(int(position))
+            tokens += sentence_tokens
+
+        extracts: Dict[int, List[str]] = {}
+        for position in sorted(selected, key=lambda index: positions[index]):
+            extracts .setdefault(positions[position][0], []).append(sentences[position])
+        return [(text_index, " ".join(parts))for text_index, parts in extracts .items()]
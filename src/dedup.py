@@ -0,0 +1,282 @@
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+
+
+DEDUP_MODES = ("link", "skip", "keep")
+
+_MERSENNE_PRIME = np .uint64((1 << 61)-1)
+_MAX_HASH = np .uint64((1 << 32)-1)
+
+_indexes: Dict[str, "MinHashIndex"] = {}
+_indexes_lock = threading .Lock()
+
+
+class MinHashIndex:
+    """Персистентный MinHash/LSH-индекс фрагментов: подписи и журнал операций на диске только дописываются"""
+
+    def __init__(self, index_dir: str, num_perm: int = 128, bands: int = 16, shingle_size: int = 5,
+                 threshold: float = 0.85, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self .logger = logging .getLogger(__name__)
+        self .index_dir = index_dir
+        self .num_perm = num_perm
+        self .bands = bands
+        self .rows = num_perm // bands
+        self .shingle_size = shingle_size
+        self .threshold = threshold
+        self .signatures_path = os .path .join(index_dir, "signatures.bin")
+        self .log_path = os .path .join(index_dir, "log.jsonl")
+
+        rng = np .random .RandomState(seed)
+        self ._a = rng .randint(1, 1 << 32, size=num_perm, dtype=np .uint64)
+        self ._b = rng .randint(0, 1 << 32, size=num_perm, dtype=np .uint64)
+
+        self ._lock = threading .RLock()
+        self ._reset_memory()
+        self ._pending_rows: List[np .ndarray] = []
+        self ._pending_log: List[Dict[str, Any]] = []
+        self ._stats_dirty = False
+
+        os .makedirs(index_dir, exist_ok=True)
+        self ._load()
+
+    def _reset_memory(self):
+        self ._ids: List[str] = []
+        self ._sources: List[str] = []
+        self ._signatures = np .empty((1024, self .num_perm), dtype=np .uint32)
+        self ._size = 0
+        self ._alive: List[bool] = []
+        self ._positions: Dict[str, int] = {}
+        self ._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self .links: Dict[str, List[Dict[str, Any]]] = {}
+        self .stats = {"checked": 0, "duplicates": 0}
+
+    def _shingles(self, text: str) -> np .ndarray:
+        tokens = re .findall(r'\w+', text .lower())
+        size = self .shingle_size
+        if len(tokens) < size:
+            grams = {" ".join(tokens)}
+        else:
+            grams = {" ".join(tokens[i:i + size])for i in range(len(tokens)-size + 1)}
+        return np .fromiter((zlib .crc32(gram .encode("utf-8"))for gram in grams), dtype=np .uint64)
+
+    def signature(self, text: str) -> np .ndarray:
+        hashes = self ._shingles(text)
+        permuted = (np .outer(hashes, self ._a)+self ._b)%_MERSENNE_PRIME & _MAX_HASH
+        return permuted .min(axis=0).astype(np .uint32)
+
+    def _band_keys(self, signature: np .ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self .rows:(band + 1)*self .rows].tobytes())for band in range(self .bands)]
+
+    def find_duplicate(self, signature: np .ndarray,
+                       exclude_ids: Optional[Set[str]] = None) -> Optional[Tuple[str, float]]:
+        """Лучший живой кандидат из LSH-корзин с оценкой Жаккара не ниже порога; exclude_ids не учитываются"""
+        with self ._lock:
+            candidates = set()
+            for key in self ._band_keys(signature):
+                candidates .update(self ._buckets .get(key, ()))
+            best = None
+            for position in candidates:
+                if not self ._alive[position]or (exclude_ids and self ._ids[position]in exclude_ids):
+                    continue
+                similarity = float(np .mean(self ._signatures[position] == signature))
+                if similarity >= self .threshold and (best is None or similarity > best[1]):
+                    best = (self ._ids[position], similarity)
+            return best
+
+    def _insert(self, chunk_id: str, source: str, signature: np .ndarray):
+        if chunk_id in self ._positions:
+            self ._alive[self ._positions[chunk_id]] = False
+        if self ._size == len(self ._signatures):
+            grown = np .empty((len(self ._signatures)*2, self .num_perm), dtype=np .uint32)
+            grown[:self ._size] = self ._signatures[:self ._size]
+            self ._signatures = grown
+        position = self ._size
+        self ._signatures[position] = signature
+        self ._size += 1
+        self ._ids .append(chunk_id)
+        self ._sources .append(source)
+        self ._alive .append(True)
+        self ._positions[chunk_id] = position
+        for key in self ._band_keys(signature):
+            self ._buckets .setdefault(key, []).append(position)
+
+    def add(self, chunk_id: str, source: str, signature: np .ndarray):
+        with self ._lock:
+            self ._insert(chunk_id, source, signature)
+            self ._pending_rows .append(signature)
+            self ._pending_log .append({"op": "add", "id": chunk_id, "source": source})
+
+    def check_and_add(self, chunk_id: str, source: str, signature: np .ndarray, add_duplicate: bool = False,
+                      exclude_ids: Optional[Set[str]] = None) -> Optional[Tuple[str, float]]:
+        """Атомарно ищет почти дубликат и добавляет фрагмент в индекс, если он уникален или add_duplicate"""
+        with self ._lock:
+            duplicate = self .find_duplicate(signature, exclude_ids)
+            self .stats["checked"] += 1
+            if duplicate is not None:
+                self .stats["duplicates"] += 1
+            self ._stats_dirty = True
+            if duplicate is None or add_duplicate:
+                self .add(chunk_id, source, signature)
+            return duplicate
+
+    def link(self, canonical_id: str, link: Dict[str, Any]):
+        with self ._lock:
+            self .links .setdefault(canonical_id, []).append(link)
+            self ._pending_log .append({"op": "link", "id": canonical_id, "link": link})
+
+    def _remove_position(self, chunk_id: str) -> List[Dict[str, Any]]:
+        position = self ._positions .pop(chunk_id, None)
+        if position is not None:
+            self ._alive[position] = False
+        return self .links .pop(chunk_id, [])
+
+    def remove_ids(self, chunk_ids: List[str]) -> List[str]:
+        """Забывает фрагменты и возвращает источники, чьи связанные копии остались без оригинала"""
+        with self ._lock:
+            orphaned = set()
+            for chunk_id in chunk_ids:
+                orphaned .update(link .get("source")for link in self ._remove_position(chunk_id))
+                self ._pending_log .append({"op": "remove", "id": chunk_id})
+            return sorted(source for source in orphaned if source)
+
+    def remove_source(self, source: str) -> List[str]:
+        """Забывает все фрагменты и ссылки документа-источника"""
+        return self .remove_sources([source])
+
+    def remove_sources(self, sources: List[str]) -> List[str]:
+        """Забывает фрагменты и ссылки нескольких источников за один проход по индексу"""
+        sources = [source for source in sources if source]
+        if not sources:
+            return []
+        with self ._lock:
+            orphaned = self ._apply_remove_sources(set(sources))
+            for source in sources:
+                self ._pending_log .append({"op": "remove_source", "source": source})
+            return orphaned
+
+    def _apply_remove_sources(self, sources: set) -> List[str]:
+        orphaned = set()
+        for chunk_id, position in list(self ._positions .items()):
+            if self ._sources[position]in sources:
+                orphaned .update(link .get("source")for link in self ._remove_position(chunk_id))
+        for canonical_id in list(self .links):
+            remaining = [link for link in self .links[canonical_id]if link .get("source")not in sources]
+            if remaining:
+                self .links[canonical_id] = remaining
+            else:
+                del self .links[canonical_id]
+        return sorted(item for item in orphaned if item and item not in sources)
+
+    def clear(self):
+        with self ._lock:
+            self ._reset_memory()
+            self ._pending_rows = []
+            self ._pending_log = []
+            self ._stats_dirty = False
+            for path in (self .signatures_path, self .log_path):
+                if os .path .exists(path):
+                    os .remove(path)
+
+    def get_links(self, chunk_id: str) -> List[Dict[str, Any]]:
+        with self ._lock:
+            return list(self .links .get(chunk_id, []))
+
+    def save(self):
+        """Дописывает накопленные подписи и операции журнала на диск"""
+        with self ._lock:
+            if not self ._pending_rows and not self ._pending_log and not self ._stats_dirty:
+                return
+            if self ._pending_rows:
+                with open(self .signatures_path, "ab")as f:
+                    f .write(np .stack(self ._pending_rows).astype(np .uint32).tobytes())
+            with open(self .log_path, "a", encoding="utf-8")as f:
+                for entry in self ._pending_log:
+                    f .write(json .dumps(entry, ensure_ascii=False)+"\n")
+                f .write(json .dumps({"op": "stats", **self .stats})+"\n")
+            self ._pending_rows = []
+            self ._pending_log = []
+            self ._stats_dirty = False
+
+    def _load(self):
+        if not (os .path .exists(self .signatures_path)and os .path .exists(self .log_path)):
+            return
+        try:
+            signatures = np .fromfile(self .signatures_path, dtype=np .uint32)
+            signatures = signatures[:len(signatures)//self .num_perm * self .num_perm].reshape(-1, self .num_perm)
+            row = 0
+            with open(self .log_path, "r", encoding="utf-8")as f:
+                for line in f:
+                    if not line .strip():
+                        continue
+                    entry = json .loads(line)
+                    op = entry["op"]
+                    if op == "add":
+                        if row >= len(signatures):
+                            break
+                        self ._insert(entry["id"], entry["source"], signatures[row])
+                        row += 1
+                    elif op == "remove":
+                        self ._remove_position(entry["id"])
+                    elif op == "remove_source":
+                        self ._apply_remove_sources({entry["source"]})
+                    elif op == "link":
+                        self .links .setdefault(entry["id"], []).append(entry["link"])
+                    elif op == "stats":
+                        self .stats = {"checked": entry["checked"], "duplicates": entry["duplicates"]}
+            if self ._size and sum(self ._alive) < self ._size / 2:
+                self ._compact()
+        except Exception as e:
+            self .logger .error(f"Error loading dedup index {self .index_dir}: {str(e)}")
+            self ._reset_memory()
+
+    def _compact(self):
+        """Переписывает файлы индекса без удаленных записей"""
+        live = [(self ._ids[i], self ._sources[i], self ._signatures[i].copy())
+                for i in range(self ._size)if self ._alive[i]]
+        links = self .links
+        stats = self .stats
+        self ._reset_memory()
+        for chunk_id, source, signature in live:
+            self ._insert(chunk_id, source, signature)
+        self .links = links
+        self .stats = stats
+
+        with open(self .signatures_path + ".tmp", "wb")as f:
+            f .write(self ._signatures[:self ._size].tobytes())
+        with open(self .log_path + ".tmp", "w", encoding="utf-8")as f:
+            for chunk_id, source in zip(self ._ids, self ._sources):
+                f .write(json .dumps({"op": "add", "id": chunk_id, "source": source}, ensure_ascii=False)+"\n")
+            for canonical_id, canonical_links in self .links .items():
+                for link in canonical_links:
+                    f .write(json .dumps({"op": "link", "id": canonical_id, "link": link}, ensure_ascii=False)+"\n")
+            f .write(json .dumps({"op": "stats", **self .stats})+"\n")
+        os .replace(self .signatures_path + ".tmp", self .signatures_path)
+        os .replace(self .log_path + ".tmp", self .log_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self ._lock:
+            checked = self .stats["checked"]
+            return {
+                "indexed_chunks": len(self ._positions),
+                "checked_chunks": checked,
+                "duplicate_chunks": self .stats["duplicates"],
+                "dedup_ratio": self .stats["duplicates"]/checked if checked else 0.0,
+                "linked_chunks": sum(len(links)for links in self .links .values())
+            }
+
+
+def get_dedup_index(index_dir: str) -> MinHashIndex:
+    """Один экземпляр индекса на каталог в процессе, чтобы все VectorStore видели одни и те же подписи"""
+    index_dir = os .path .abspath(index_dir)
+    with _indexes_lock:
+        if index_dir not in _indexes:
+            _indexes[index_dir] = MinHashIndex(index_dir)
+        return _indexes[index_dir]
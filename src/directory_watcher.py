@@ -0,0 +1,221 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .ingestion_queue import IngestionQueue
+
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+class DirectoryWatcher:
+    """Опрос дерева каталогов по манифесту mtime/размер с передачей изменений в очередь индексации"""
+
+    def __init__(self, directory: str, ingestion_queue: IngestionQueue, poll_interval: float = 5.0,
+                 manifest_dir: str = "./data/watch_manifests", max_retry_interval: float = 3600.0):
+        self .logger = logging .getLogger(__name__)
+        self .directory = os .path .abspath(directory)
+        self .ingestion_queue = ingestion_queue
+        self .poll_interval = poll_interval
+        self .max_retry_interval = max_retry_interval
+
+        os .makedirs(manifest_dir, exist_ok=True)
+        directory_hash = hashlib .md5(self .directory .encode()).hexdigest()[:12]
+        self .manifest_path = os .path .join(manifest_dir, f"{directory_hash}.json")
+
+        self ._lock = threading .Lock()
+        self ._indexed = self ._load_manifest()
+        self ._last_scan: Dict[str, Tuple[int, int]] = dict(self ._indexed)
+        self ._failed: Dict[str, Dict[str, Any]] = {}
+        self ._stop_event = threading .Event()
+        self ._thread: Optional[threading .Thread] = None
+        self .stats = {
+            "scans": 0,
+            "last_scan_time": 0.0,
+            "last_scan_duration": 0.0,
+            "files_seen": 0,
+            "events": 0
+        }
+
+    def _load_manifest(self) -> Dict[str, Tuple[int, int]]:
+        if not os .path .exists(self .manifest_path):
+            return {}
+        try:
+            with open(self .manifest_path, 'r', encoding='utf-8')as f:
+                data = json .load(f)
+            return {path: tuple(entry)for path, entry in data .get("files", {}).items()}
+        except Exception as e:
+            self .logger .error(f"Error loading watch manifest {self .manifest_path}: {str(e)}")
+            return {}
+
+    def _save_manifest(self):
+        temp_path = self .manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8')as f:
+            json .dump({"directory": self .directory, "files": self ._indexed}, f, ensure_ascii=False)
+        os .replace(temp_path, self .manifest_path)
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        """Рекурсивно собирает (mtime_ns, size) для всех поддерживаемых файлов дерева"""
+        found = {}
+        stack = [self .directory]
+        while stack:
+            current = stack .pop()
+            try:
+                with os .scandir(current)as entries:
+                    for entry in entries:
+                        if entry .name .startswith('.'):
+                            continue
+                        if entry .is_dir(follow_symlinks=False):
+                            stack .append(entry .path)
+                        elif entry .name .lower().endswith(SUPPORTED_EXTENSIONS):
+                            try:
+                                stat = entry .stat()
+                            except OSError:
+                                continue
+                            found[entry .path] = (stat .st_mtime_ns, stat .st_size)
+            except OSError as e:
+                self .logger .warning(f"Cannot scan {current}: {str(e)}")
+        return found
+
+    @staticmethod
+    def diff(previous: Dict[str, Tuple[int, int]], current: Dict[str, Tuple[int, int]]) -> List[Tuple[str, str]]:
+        events = []
+        for path, signature in current .items():
+            old_signature = previous .get(path)
+            if old_signature is None:
+                events .append((path, "created"))
+            elif tuple(old_signature) != tuple(signature):
+                events .append((path, "modified"))
+        for path in previous:
+            if path not in current:
+                events .append((path, "removed"))
+        return events
+
+    def poll_once(self) -> List[Tuple[str, str]]:
+        start = time .time()
+        current = self .scan()
+        with self ._lock:
+            events = self .diff(self ._last_scan, current)
+            self ._last_scan = current
+            events += self ._due_retries(current, {path for path, _ in events}, start)
+
+        for path, event in events:
+            self .ingestion_queue .submit(path, event, callback=self ._on_ingested)
+
+        self .stats["scans"] += 1
+        self .stats["last_scan_time"] = start
+        self .stats["last_scan_duration"] = time .time()-start
+        self .stats["files_seen"] = len(current)
+        self .stats["events"] += len(events)
+        return events
+
+    def _due_retries(self, current: Dict[str, Tuple[int, int]], pending: Set[str], now: float) -> List[Tuple[str, str]]:
+        """Повторы неудачных файлов с неизменной подписью, у которых истекла пауза"""
+        retries = []
+        for path, failure in list(self ._failed .items()):
+            signature = current .get(path)
+            if signature != failure["signature"]:
+                del self ._failed[path]
+            elif path not in pending and now >= failure["retry_at"]:
+                retries .append((path, "modified"if signature else "removed"))
+        return retries
+
+    def _on_ingested(self, path: str, action: str, success: bool):
+        with self ._lock:
+            if not success:
+                signature = self ._last_scan .get(path)
+                failure = self ._failed .get(path)
+                attempts = failure["attempts"]+1 if failure and failure["signature"] == signature else 1
+                self ._failed[path] = {
+                    "signature": signature,
+                    "attempts": attempts,
+                    "retry_at": time .time()+min(self .poll_interval * 2 ** attempts, self .max_retry_interval)
+                }
+                return
+            self ._failed .pop(path, None)
+            if action == "remove":
+                self ._indexed .pop(path, None)
+            elif path in self ._last_scan:
+                self ._indexed[path] = self ._last_scan[path]
+            try:
+                self ._save_manifest()
+            except Exception as e:
+                self .logger .error(f"Error saving watch manifest: {str(e)}")
+
+    def _run(self):
+        while not self ._stop_event .is_set():
+            try:
+                self .poll_once()
+            except Exception as e:
+                self .logger .error(f"Directory poll failed for {self .directory}: {str(e)}")
+            self ._stop_event .wait(self .poll_interval)
+
+    def start(self):
+        if self ._thread and self ._thread .is_alive():
+            return
+        self ._stop_event .clear()
+        self ._thread = threading .Thread(
+            target=self ._run, name=f"watch-{os .path .basename(self .directory)}", daemon=True)
+        self ._thread .start()
+
+    def stop(self, timeout: float = 5.0):
+        self ._stop_event .set()
+        if self ._thread:
+            self ._thread .join(timeout)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self ._lock:
+            indexed = len(self ._indexed)
+            failed = len(self ._failed)
+        return {
+            "directory": self .directory,
+            "running": bool(self ._thread and self ._thread .is_alive()),
+            "poll_interval": self .poll_interval,
+            "indexed_files": indexed,
+            "failed_files": failed,
+            **self .stats
+        }
+
+
+class DirectoryWatchService:
+    """Общий для всех сессий набор наблюдателей за папками с единой очередью индексации"""
+
+    def __init__(self, pipeline, poll_interval: float = 5.0, settle_seconds: float = 2.0):
+        self .pipeline = pipeline
+        self .poll_interval = poll_interval
+        self .ingestion_queue = IngestionQueue(
+            pipeline .handle_file_event, settle_seconds=settle_seconds)
+        self .ingestion_queue .start()
+        self .watchers: Dict[str, DirectoryWatcher] = {}
+        self ._lock = threading .Lock()
+
+    def watch(self, directory: str) -> DirectoryWatcher:
+        directory = os .path .abspath(directory)
+        with self ._lock:
+            watcher = self .watchers .get(directory)
+            if watcher is None:
+                watcher = DirectoryWatcher(
+                    directory, self .ingestion_queue, poll_interval=self .poll_interval)
+                self .watchers[directory] = watcher
+            watcher .start()
+            return watcher
+
+    def unwatch(self, directory: str) -> bool:
+        directory = os .path .abspath(directory)
+        with self ._lock:
+            watcher = self .watchers .pop(directory, None)
+        if watcher is None:
+            return False
+        watcher .stop()
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        with self ._lock:
+            watchers = list(self .watchers .values())
+        return {
+            "queue": self .ingestion_queue .get_status(),
+            "watchers": [watcher .get_status()for watcher in watchers]
+        }
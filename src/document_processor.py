@@ -2,299 +2,42 @@ import fitz
 import os
 import re
 import hashlib
-import time
+import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
-from langchain .text_splitter import RecursiveCharacterTextSplitter
 from langchain .schema import Document
-import streamlit as st
-from enum import Enum
-from dataclasses import dataclass
+from .notify import notifier
+from .text_splitter import RAGTextSplitter, LEGAL_SEPARATORS
+from .progress import ProcessingStage, ProgressState, SimpleProgressTracker, ProgressContext
+from .boilerplate import BoilerplateDetector
+from .document_store import document_id
 
 try:
     from docx import Document as DocxDocument
+    from docx .oxml .ns import qn
+    from docx .table import Table as DocxTable
+    from docx .text .paragraph import Paragraph as DocxParagraph
     DOCX_AVAILABLE = True
 except ImportError:
     DOCX_AVAILABLE = False
 
 
-class ProcessingStage (Enum):
-    INITIALIZING = "initializing"
-    READING_PDF = "reading_pdf"
-    READING_DOCX = "reading_docx"
-    READING_TXT = "reading_txt"
-    PROCESSING_TEXT = "processing_text"
-    CREATING_CHUNKS = "creating_chunks"
-    GENERATING_EMBEDDINGS = "generating_embeddings"
-    STORING_DOCUMENTS = "storing_documents"
-    COMPLETED = "completed"
-    ERROR = "error"
-
-
-@dataclass
-class ProgressState:
-    stage: ProcessingStage = ProcessingStage .INITIALIZING
-    current_file: str = ""
-    current_step: int = 0
-    total_steps: int = 0
-    current_file_index: int = 0
-    total_files: int = 0
-    message: str = ""
-    error_message: str = ""
-    start_time: float = 0
-    stage_start_time: float = 0
-
-    @property
-    def progress_percent(self) -> float:
-        if self .total_steps == 0:
-            return 0.0
-        return min(100.0, (self .current_step / self .total_steps)*100.0)
-
-    @property
-    def file_progress_percent(self) -> float:
-        if self .total_files == 0:
-            return 0.0
-        return min(100.0, (self .current_file_index / self .total_files)*100.0)
-
-    @property
-    def elapsed_time(self) -> float:
-        return time .time()-self .start_time if self .start_time > 0 else 0
-
-    @property
-    def stage_elapsed_time(self) -> float:
-        return time .time()-self .stage_start_time if self .stage_start_time > 0 else 0
-
-
-class SimpleProgressTracker:
-    """Упрощенный трекер прогресса для v1.5.0, интегрированный со Streamlit"""
-
-    def __init__(self):
-        self .state = ProgressState()
-        self .progress_placeholder = None
-        self .status_placeholder = None
-        self .detail_placeholder = None
-        self ._is_active = False
-
-    def setup_ui(self, container=None):
-        """Настройка UI элементов для отображения прогресса"""
-        if container is None:
-            container = st .container()
-
-        with container:
-            self .progress_placeholder = st .empty()
-            self .status_placeholder = st .empty()
-            self .detail_placeholder = st .empty()
-
-    def start_session(self, total_files: int, title: str = "Обработка документов"):
-        """Начать сессию обработки"""
-        self .state = ProgressState(
-            total_files=total_files,
-            start_time=time .time(),
-            stage_start_time=time .time()
-        )
-        self ._is_active = True
-
-        if self .progress_placeholder is None:
-            self .setup_ui()
-
-        self ._update_display(f"{title} ({total_files} файлов)")
-
-    def start_file(self, filename: str, total_steps: int = 5):
-        """Начать обработку файла"""
-        self .state .current_file = filename
-        self .state .current_file_index += 1
-        self .state .current_step = 0
-        self .state .total_steps = total_steps
-        self .state .stage = ProcessingStage .READING_PDF
-        self .state .stage_start_time = time .time()
-        self .state .message = f"Начинаю обработку файла {filename}"
-        self .state .error_message = ""
-
-        self ._update_display()
-
-    def update_stage(self, stage: ProcessingStage, message: str = "", step_increment: int = 1):
-        """Обновить текущий этап"""
-        self .state .stage = stage
-        self .state .current_step += step_increment
-        self .state .stage_start_time = time .time()
-
-        if message:
-            self .state .message = message
-        else:
-            self .state .message = self ._get_default_message(stage)
-
-        self ._update_display()
-
-    def update_progress(self, current: int, total: int = None, message: str = ""):
-        """Обновить прогресс текущего этапа"""
-        self .state .current_step = current
-        if total is not None:
-            self .state .total_steps = total
-        if message:
-            self .state .message = message
-
-        self ._update_display()
-
-    def set_error(self, error_message: str):
-        """Зарегистрировать ошибку"""
-        self .state .stage = ProcessingStage .ERROR
-        self .state .error_message = error_message
-        self .state .message = f"Ошибка: {error_message}"
-
-        self ._update_display()
-
-    def complete_file(self):
-        """Завершить обработку текущего файла"""
-        self .state .stage = ProcessingStage .COMPLETED
-        self .state .current_step = self .state .total_steps
-        self .state .message = f"Файл {self .state .current_file} обработан успешно"
-
-        self ._update_display()
-
-    def finish_session(self, success: bool = True):
-        """Завершить сессию"""
-        self ._is_active = False
-
-        if success:
-            self ._show_final_success()
-        else:
-            self ._show_final_error()
-
-    def _update_display(self, title: str = None):
-        """Обновить отображение прогресса"""
-        if not self ._is_active or not self .progress_placeholder:
-            return
-
-        try:
-            with self .progress_placeholder:
-                if title:
-                    st .subheader(title)
-
-                if self .state .total_files > 0:
-                    file_progress = self .state .file_progress_percent / 100
-                    st .progress(
-                        file_progress,
-                        text=f"Файл {self .state .current_file_index}/{self .state .total_files}"
-                    )
-
-            with self .status_placeholder:
-                if self .state .current_file:
-                    step_progress = self .state .progress_percent / 100
-
-                    st .progress(
-                        step_progress,
-                        text=f"{self .state .current_file}: {self .state .message} ({self .state .progress_percent:.0f}%)"
-                    )
-
-            with self .detail_placeholder:
-                if self .state .error_message:
-                    st .error(f"Ошибка: {self .state .error_message}")
-                elif self .state .stage_elapsed_time > 0:
-                    elapsed = self .state .stage_elapsed_time
-                    if elapsed < 60:
-                        time_str = f"{elapsed:.1f} сек"
-                    else:
-                        time_str = f"{elapsed / 60:.1f} мин"
-
-                    st .caption(f"Время этапа: {time_str}")
-
-        except Exception as e:
-            pass
-
-    def _show_final_success(self):
-        """Показать финальное сообщение об успехе"""
-        if self .progress_placeholder:
-            with self .progress_placeholder:
-                st .success(
-                    f"Успешно обработано {self .state .total_files} файлов")
-
-        if self .status_placeholder:
-            with self .status_placeholder:
-                total_time = self .state .elapsed_time
-                if total_time < 60:
-                    time_str = f"{total_time:.1f} секунд"
-                else:
-                    time_str = f"{total_time / 60:.1f} минут"
-                st .info(f"Общее время обработки: {time_str}")
-
-        if self .detail_placeholder:
-            with self .detail_placeholder:
-                st .empty()
-
-    def _show_final_error(self):
-        """Показать финальное сообщение об ошибке"""
-        if self .progress_placeholder:
-            with self .progress_placeholder:
-                st .error("Обработка завершена с ошибками")
-
-    def _get_default_message(self, stage: ProcessingStage) -> str:
-        """Получить сообщение по умолчанию для этапа"""
-        message_map = {
-            ProcessingStage .INITIALIZING: "Инициализация",
-            ProcessingStage .READING_PDF: "Чтение PDF файла",
-            ProcessingStage .READING_DOCX: "Чтение DOCX файла",
-            ProcessingStage .READING_TXT: "Чтение TXT файла",
-            ProcessingStage .PROCESSING_TEXT: "Обработка текста",
-            ProcessingStage .CREATING_CHUNKS: "Создание фрагментов",
-            ProcessingStage .GENERATING_EMBEDDINGS: "Генерация эмбеддингов",
-            ProcessingStage .STORING_DOCUMENTS: "Сохранение в базу данных",
-            ProcessingStage .COMPLETED: "Завершено",
-            ProcessingStage .ERROR: "Ошибка"
-        }
-        return message_map .get(stage, "Обработка")
-
-    def get_current_state(self) -> Dict[str, Any]:
-        """Получить текущее состояние для отладки"""
-        return {
-            "stage": self .state .stage .value,
-            "current_file": self .state .current_file,
-            "progress_percent": self .state .progress_percent,
-            "file_progress_percent": self .state .file_progress_percent,
-            "current_step": self .state .current_step,
-            "total_steps": self .state .total_steps,
-            "current_file_index": self .state .current_file_index,
-            "total_files": self .state .total_files,
-            "message": self .state .message,
-            "error_message": self .state .error_message,
-            "elapsed_time": self .state .elapsed_time,
-            "is_active": self ._is_active
-        }
-
-
-class ProgressContext:
-    """Контекстный менеджер для автоматического управления прогрессом"""
-
-    def __init__(self, total_files: int, title: str = "Обработка документов"):
-        self .tracker = SimpleProgressTracker()
-        self .total_files = total_files
-        self .title = title
-        self .success = True
-
-    def __enter__(self):
-        self .tracker .setup_ui()
-        self .tracker .start_session(self .total_files, self .title)
-        return self .tracker
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is not None:
-            self .success = False
-            if hasattr(exc_val, '__str__'):
-                self .tracker .set_error(str(exc_val))
-
-        self .tracker .finish_session(self .success)
-        return False
-
-
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, progress_tracker: Optional[SimpleProgressTracker] = None):
+    UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, progress_tracker: Optional[SimpleProgressTracker] = None,
+                 strip_boilerplate: bool = True, document_store=None):
         self .chunk_size = chunk_size
         self .chunk_overlap = chunk_overlap
         self .progress_tracker = progress_tracker
-        self .text_splitter = RecursiveCharacterTextSplitter(
+        self .strip_boilerplate = strip_boilerplate
+        self .document_store = document_store
+        self .boilerplate_detector = BoilerplateDetector()
+        self .text_splitter = RAGTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
-            separators=["\n\nСтатья", "\n\n", ".\n", "\n", ".", "", ""],
+            separators=LEGAL_SEPARATORS,
             keep_separator=True
         )
 
@@ -302,11 +45,11 @@ class DocumentProcessor:
         """Обновить настройки разбиения на фрагменты"""
         self .chunk_size = chunk_size
         self .chunk_overlap = chunk_overlap
-        self .text_splitter = RecursiveCharacterTextSplitter(
+        self .text_splitter = RAGTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             length_function=len,
-            separators=["\n\nСтатья", "\n\n", ".\n", "\n", ".", "", ""],
+            separators=LEGAL_SEPARATORS,
             keep_separator=True
         )
 
@@ -317,7 +60,8 @@ class DocumentProcessor:
                     ProcessingStage .READING_PDF, "Открытие PDF файла")
 
             doc = fitz .open(pdf_path)
-            text = ""
+            page_texts = []
+            page_lines = []
             metadata = {
                 "filename": os .path .basename(pdf_path),
                 "page_count": len(doc),
@@ -330,19 +74,26 @@ class DocumentProcessor:
 
             for page_num in range(len(doc)):
                 page = doc[page_num]
-                page_text = page .get_text().strip()
-                if page_text:
-                    text += f"\n\n{page_text}"
+                if self .strip_boilerplate:
+                    page_lines .append(self .boilerplate_detector .page_lines(
+                        page .get_text("blocks"), page .rect .height))
+                else:
+                    page_texts .append(page .get_text().strip())
 
                 if self .progress_tracker:
-                    progress = int(((page_num + 1)/len(doc))*100)
                     self .progress_tracker .update_progress(
                         page_num + 1, len(doc), f"Обработана страница {page_num + 1} из {len(doc)}")
 
             doc .close()
 
+            if self .strip_boilerplate:
+                page_texts, boilerplate_stats = self .boilerplate_detector .strip(page_lines)
+                metadata .update(boilerplate_stats)
+                metadata["boilerplate_chunks_saved"] = boilerplate_stats["boilerplate_chars_removed"]//max(
+                    1, self .chunk_size - self .chunk_overlap)
+
             return {
-                "text": text .strip(),
+                "text": "\n\n".join(page_text for page_text in page_texts if page_text),
                 "metadata": metadata
             }
 
@@ -350,18 +101,18 @@ class DocumentProcessor:
             error_msg = f"Error extracting text from {pdf_path}: {str(e)}"
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
-            st .error(error_msg)
+            notifier .error(error_msg)
             return None
 
     def extract_text_from_docx(self, docx_path: str) -> Dict[str, Any]:
-        """Извлечение текста из DOCX файла"""
+        """Извлечение текста из DOCX файла за один проход по телу документа"""
         try:
             if not DOCX_AVAILABLE:
                 error_msg = "python-docx library not installed. Please install: pip install python-docx"
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return None
 
             if self .progress_tracker:
@@ -369,42 +120,42 @@ class DocumentProcessor:
                     ProcessingStage .READING_DOCX, "Открытие DOCX файла")
 
             doc = DocxDocument(docx_path)
-            text = ""
+            block_tags = (qn("w:p"), qn("w:tbl"))
+            total_blocks = sum(1 for child in doc .element .body .iterchildren()if child .tag in block_tags)
 
             if self .progress_tracker:
-                total_paragraphs = len(doc .paragraphs)
                 self .progress_tracker .update_stage(
-                    ProcessingStage .PROCESSING_TEXT, f"Извлечение текста из {total_paragraphs} параграфов")
+                    ProcessingStage .PROCESSING_TEXT, f"Извлечение текста из {total_blocks} блоков")
 
-            for i, paragraph in enumerate(doc .paragraphs):
-                if paragraph .text .strip():
-                    text += paragraph .text + "\n\n"
+            parts = []
+            paragraphs_count = 0
+            tables_count = 0
+            report_every = max(1, total_blocks // 100)
 
-                if self .progress_tracker:
-                    progress = int(((i + 1)/len(doc .paragraphs))*100)
+            for i, (block_type, block_text) in enumerate(self .iter_docx_blocks(doc)):
+                if block_type == "paragraph":
+                    paragraphs_count += 1
+                else:
+                    tables_count += 1
+
+                if block_text:
+                    parts .append(block_text)
+
+                if self .progress_tracker and ((i + 1)%report_every == 0 or i + 1 == total_blocks):
                     self .progress_tracker .update_progress(
-                        i + 1, len(doc .paragraphs), f"Обработан параграф {i + 1} из {len(doc .paragraphs)}")
-
-            for table in doc .tables:
-                for row in table .rows:
-                    row_text = []
-                    for cell in row .cells:
-                        if cell .text .strip():
-                            row_text .append(cell .text .strip())
-                    if row_text:
-                        text += " |".join(row_text)+"\n"
+                        i + 1, total_blocks, f"Обработан блок {i + 1} из {total_blocks}")
 
             metadata = {
                 "filename": os .path .basename(docx_path),
                 "page_count": "N/A",
                 "file_path": docx_path,
                 "document_type": "docx",
-                "paragraphs_count": len(doc .paragraphs),
-                "tables_count": len(doc .tables)
+                "paragraphs_count": paragraphs_count,
+                "tables_count": tables_count
             }
 
             return {
-                "text": text .strip(),
+                "text": "\n\n".join(parts).strip(),
                 "metadata": metadata
             }
 
@@ -413,9 +164,25 @@ class DocumentProcessor:
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return None
 
+    def iter_docx_blocks(self, doc):
+        """Потоково отдает параграфы и таблицы DOCX в порядке следования в документе"""
+        paragraph_tag = qn("w:p")
+        table_tag = qn("w:tbl")
+
+        for child in doc .element .body .iterchildren():
+            if child .tag == paragraph_tag:
+                yield "paragraph", DocxParagraph(child, doc).text .strip()
+            elif child .tag == table_tag:
+                rows = []
+                for row in DocxTable(child, doc).rows:
+                    row_text = [cell .text .strip()for cell in row .cells if cell .text .strip()]
+                    if row_text:
+                        rows .append(" |".join(row_text))
+                yield "table", "\n".join(rows)
+
     def extract_text_from_txt(self, txt_path: str) -> Dict[str, Any]:
         """Извлечение текста из TXT файла"""
         try:
@@ -441,7 +208,7 @@ class DocumentProcessor:
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return None
 
             if self .progress_tracker:
@@ -473,7 +240,7 @@ class DocumentProcessor:
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return None
 
     def chunk_document(self, text: str, metadata: Dict[str, Any]) -> List[Document]:
@@ -490,13 +257,22 @@ class DocumentProcessor:
 
         documents = []
         valid_chunk_id = 0
+        doc_id = document_id(metadata["file_path"])if metadata .get("file_path")else None
+        cursor = 0
 
         for i, chunk in enumerate(chunks):
             chunk_cleaned = chunk .strip()
             if len(chunk_cleaned) >= 50:
+                start = text .find(chunk_cleaned, cursor)
+                if start >= 0:
+                    cursor = start + 1
                 chunk_metadata = metadata .copy()
+                if doc_id:
+                    chunk_metadata["doc_id"] = doc_id
                 chunk_metadata["chunk_id"] = valid_chunk_id
                 chunk_metadata["chunk_size"] = len(chunk_cleaned)
+                chunk_metadata["start"] = start
+                chunk_metadata["end"] = start + len(chunk_cleaned)if start >= 0 else -1
 
                 documents .append(Document(
                     page_content=chunk_cleaned,
@@ -508,6 +284,9 @@ class DocumentProcessor:
                     self .progress_tracker .update_progress(valid_chunk_id, len(
                         valid_chunks), f"Создан фрагмент {valid_chunk_id} из {len(valid_chunks)}")
 
+        if documents and doc_id and self .document_store is not None:
+            self .document_store .stage_text(text, metadata, doc_id=doc_id)
+
         return documents
 
     def extract_text_from_file(self, file_path: str) -> Dict[str, Any]:
@@ -525,7 +304,7 @@ class DocumentProcessor:
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return None
 
     def process_file(self, file_path: str) -> List[Document]:
@@ -534,6 +313,9 @@ class DocumentProcessor:
         if not extracted_data:
             return []
 
+        extracted_data["metadata"]["content_hash"] = self .compute_file_hash(
+            file_path)
+
         documents = self .chunk_document(
             extracted_data["text"],
             extracted_data["metadata"]
@@ -541,6 +323,17 @@ class DocumentProcessor:
 
         return documents
 
+    def compute_file_hash(self, file_path: str) -> str:
+        """SHA-256 содержимого файла, читаемого блоками фиксированного размера"""
+        hasher = hashlib .sha256()
+        with open(file_path, "rb")as f:
+            while True:
+                block = f .read(self .UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                hasher .update(block)
+        return hasher .hexdigest()
+
     def process_pdf_file(self, pdf_path: str) -> List[Document]:
         extracted_data = self .extract_text_from_pdf(pdf_path)
         if not extracted_data:
@@ -556,7 +349,7 @@ class DocumentProcessor:
     def process_directory(self, directory_path: str) -> List[Document]:
         """Обработка всех поддерживаемых файлов в директории"""
         if not os .path .exists(directory_path):
-            st .error(f"Directory {directory_path} does not exist")
+            notifier .error(f"Directory {directory_path} does not exist")
             return []
 
         supported_extensions = ['.pdf', '.docx', '.txt']
@@ -566,7 +359,7 @@ class DocumentProcessor:
         ]
 
         if not supported_files:
-            st .warning(
+            notifier .warning(
                 f"No supported files (PDF, DOCX, TXT) found in {directory_path}")
             return []
 
@@ -593,8 +386,8 @@ class DocumentProcessor:
                     continue
 
         else:
-            progress_bar = st .progress(0)
-            status_text = st .empty()
+            progress_bar = notifier .progress(0)
+            status_text = notifier .empty()
 
             for i, file_name in enumerate(supported_files):
                 status_text .text(f"Processing {file_name}...")
@@ -650,7 +443,8 @@ class DocumentProcessor:
                 return new_path
             counter += 1
 
-    def process_uploaded_file(self, uploaded_file) -> List[Document]:
+    def save_uploaded_file(self, uploaded_file) -> Optional[Dict[str, Any]]:
+        """Потоково сохраняет загрузку во временный файл, одновременно вычисляя хеш содержимого"""
         try:
             if self .progress_tracker:
                 self .progress_tracker .start_file(uploaded_file .name, 5)
@@ -658,60 +452,118 @@ class DocumentProcessor:
             docs_dir = os .path .abspath("./data/documents")
             os .makedirs(docs_dir, exist_ok=True)
 
-            file_content = uploaded_file .getbuffer()
+            partial_path = os .path .join(
+                docs_dir, f".upload_{uuid .uuid4().hex}.part")
+            hasher = hashlib .sha256()
+            size_bytes = 0
+
+            if hasattr(uploaded_file, "seek"):
+                uploaded_file .seek(0)
+
+            with open(partial_path, "wb")as f:
+                while True:
+                    block = uploaded_file .read(self .UPLOAD_BLOCK_SIZE)
+                    if not block:
+                        break
+                    hasher .update(block)
+                    f .write(block)
+                    size_bytes += len(block)
 
-            sanitized_name = self ._sanitize_filename(uploaded_file .name)
-            file_extension = os .path .splitext(uploaded_file .name)[1].lower()
+            return {
+                "original_name": uploaded_file .name,
+                "partial_path": partial_path,
+                "docs_dir": docs_dir,
+                "content_hash": hasher .hexdigest(),
+                "size_bytes": size_bytes
+            }
+
+        except Exception as e:
+            error_msg = f"Ошибка сохранения файла: {str(e)}"
+            if self .progress_tracker:
+                self .progress_tracker .set_error(error_msg)
+            else:
+                notifier .error(error_msg)
+            return None
+
+    def discard_saved_upload(self, saved_upload: Dict[str, Any]) -> None:
+        """Удаляет файлы загрузки, которая не будет индексироваться: временный и уже перенесенный"""
+        for path in (saved_upload["partial_path"], saved_upload .get("final_path")):
+            try:
+                if path and os .path .exists(path):
+                    os .remove(path)
+            except OSError:
+                pass
+        saved_upload .pop("final_path", None)
+
+    def process_saved_upload(self, saved_upload: Dict[str, Any]) -> List[Document]:
+        """Переносит сохраненную загрузку на постоянное место, извлекает текст и разбивает на фрагменты"""
+        try:
+            original_name = saved_upload["original_name"]
+            sanitized_name = self ._sanitize_filename(original_name)
+            file_extension = os .path .splitext(original_name)[1].lower()
             final_filename = sanitized_name + file_extension
 
-            final_path = self ._get_unique_filepath(docs_dir, final_filename)
+            final_path = self ._get_unique_filepath(
+                saved_upload["docs_dir"], final_filename)
             final_filename = os .path .basename(final_path)
 
-            with open(final_path, "wb")as f:
-                f .write(file_content)
+            os .replace(saved_upload["partial_path"], final_path)
+            saved_upload["final_path"] = final_path
 
             if not self .progress_tracker:
-                st .info(f"Файл сохранен: {final_filename}")
+                notifier .info(f"Файл сохранен: {final_filename}")
 
             extracted_data = self .extract_text_from_file(final_path)
             if not extracted_data:
                 file_type = os .path .splitext(final_path)[1].upper()
                 error_msg = f"Не удалось извлечь текст из {file_type} файла"
+                self .discard_saved_upload(saved_upload)
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return []
 
             extracted_data["metadata"]["filename"] = final_filename
             extracted_data["metadata"]["file_path"] = final_path
-            extracted_data["metadata"]["original_name"] = uploaded_file .name
+            extracted_data["metadata"]["original_name"] = original_name
+            extracted_data["metadata"]["content_hash"] = saved_upload["content_hash"]
 
             documents = self .chunk_document(
                 extracted_data["text"],
                 extracted_data["metadata"]
             )
 
-            if self .progress_tracker:
+            if not documents:
+                self .discard_saved_upload(saved_upload)
+            elif self .progress_tracker:
                 self .progress_tracker .complete_file()
-            elif documents:
+            else:
                 page_info = extracted_data['metadata'].get('page_count', 'N/A')
                 if page_info != 'N/A':
-                    st .success(
+                    notifier .success(
                         f"Создано {len(documents)} фрагментов из {page_info} страниц")
                 else:
-                    st .success(f"Создано {len(documents)} фрагментов")
+                    notifier .success(f"Создано {len(documents)} фрагментов")
 
             return documents
 
         except Exception as e:
+            self .discard_saved_upload(saved_upload)
             error_msg = f"Ошибка обработки файла: {str(e)}"
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return []
 
+    def process_uploaded_file(self, uploaded_file) -> List[Document]:
+        saved_upload = self .save_uploaded_file(uploaded_file)
+        if not saved_upload:
+            return []
+
+        return self .process_saved_upload(saved_upload)
+
     def get_document_summary(self, documents: List[Document]) -> Dict[str, Any]:
         if not documents:
             return {"total_chunks": 0, "total_characters": 0, "unique_files": 0}
@@ -734,14 +586,14 @@ class DocumentProcessor:
 
             if os .path .exists(file_path):
                 os .remove(file_path)
-                st .success(f"Physical file deleted: {filename}")
+                notifier .success(f"Physical file deleted: {filename}")
                 return True
             else:
-                st .warning(f"Physical file not found: {filename}")
+                notifier .warning(f"Physical file not found: {filename}")
                 return False
 
         except Exception as e:
-            st .error(f"Error deleting physical file {filename}: {str(e)}")
+            notifier .error(f"Error deleting physical file {filename}: {str(e)}")
             return False
 
     def rename_physical_file(self, old_filename: str, new_filename: str) -> bool:
@@ -751,19 +603,19 @@ class DocumentProcessor:
             new_path = os .path .join(docs_dir, new_filename)
 
             if not os .path .exists(old_path):
-                st .warning(f"Original file not found: {old_filename}")
+                notifier .warning(f"Original file not found: {old_filename}")
                 return False
 
             if os .path .exists(new_path):
-                st .error(f"File with name {new_filename} already exists")
+                notifier .error(f"File with name {new_filename} already exists")
                 return False
 
             os .rename(old_path, new_path)
-            st .success(f"File renamed: {old_filename} → {new_filename}")
+            notifier .success(f"File renamed: {old_filename} → {new_filename}")
             return True
 
         except Exception as e:
-            st .error(f"Error renaming file: {str(e)}")
+            notifier .error(f"Error renaming file: {str(e)}")
             return False
 
     def get_physical_file_info(self, filename: str) -> Dict[str, Any]:
@@ -784,5 +636,5 @@ class DocumentProcessor:
             }
 
         except Exception as e:
-            st .error(f"Error getting file info for {filename}: {str(e)}")
+            notifier .error(f"Error getting file info for {filename}: {str(e)}")
             return {"exists": False, "error": str(e)}
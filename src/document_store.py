@@ -0,0 +1,322 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+CHUNK_METADATA_KEYS = ("doc_id", "chunk_id", "start", "end")
+
+
+def document_id(file_path: str) -> str:
+    """Короткий стабильный идентификатор документа по абсолютному пути файла"""
+    return hashlib .md5(os .path .abspath(file_path).encode("utf-8")).hexdigest()[:12]
+
+
+def split_chunk_metadata(metadata: Dict[str, Any],
+                         file_keys: Optional[Iterable[str]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Разделяет метаданные фрагмента на компактные поля фрагмента и общие поля файла.
+
+    Если задан file_keys, общими считаются только эти поля, остальные остаются у фрагмента.
+    """
+    chunk_metadata = {key: metadata[key]for key in CHUNK_METADATA_KEYS if metadata .get(key)is not None}
+    file_metadata = {key: value for key, value in metadata .items()
+                     if key not in CHUNK_METADATA_KEYS and key != "chunk_size"}
+    if file_keys is not None:
+        file_keys = set(file_keys)
+        chunk_metadata .update({key: value for key, value in file_metadata .items()if key not in file_keys})
+        file_metadata = {key: value for key, value in file_metadata .items()if key in file_keys}
+    return chunk_metadata, file_metadata
+
+
+class DocumentStore:
+    """Исходные тексты документов в SQLite: текст пишется один раз при индексации блоками, сжатыми zlib"""
+
+    BLOCK_CHARS = 64 * 1024
+
+    def __init__(self, db_path: str, compression_level: int = 6):
+        self .logger = logging .getLogger(__name__)
+        self .db_path = db_path
+        self .compression_level = compression_level
+        self ._lock = threading .Lock()
+        self ._staged: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        os .makedirs(os .path .dirname(db_path), exist_ok=True)
+        with self ._connect()as conn:
+            conn .executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    content_hash TEXT,
+                    total_chars INTEGER NOT NULL,
+                    block_chars INTEGER NOT NULL,
+                    compressed_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    metadata TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE INDEX IF NOT EXISTS documents_filename ON documents (filename);
+                CREATE INDEX IF NOT EXISTS documents_content_hash ON documents (content_hash);
+                CREATE TABLE IF NOT EXISTS text_blocks (
+                    doc_id TEXT NOT NULL,
+                    block_no INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (doc_id, block_no)
+                );
+            """)
+            columns = {row["name"]for row in conn .execute("PRAGMA table_info(documents)")}
+            if "metadata"not in columns:
+                conn .execute("ALTER TABLE documents ADD COLUMN metadata TEXT NOT NULL DEFAULT '{}'")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3 .connect(self .db_path, timeout=30)
+        conn .row_factory = sqlite3 .Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn .close()
+
+    def save_text(self, text: str, metadata: Dict[str, Any], doc_id: Optional[str] = None) -> str:
+        """Сохраняет текст и метаданные документа, заменяя предыдущую версию, и возвращает doc_id"""
+        file_path = metadata .get("file_path", "")
+        doc_id = doc_id or document_id(file_path)
+        _, file_metadata = split_chunk_metadata(metadata)
+        blocks = [
+            zlib .compress(text[offset:offset + self .BLOCK_CHARS].encode("utf-8"), self .compression_level)
+            for offset in range(0, len(text), self .BLOCK_CHARS)
+        ]
+        with self ._lock, self ._connect()as conn:
+            conn .execute("DELETE FROM text_blocks WHERE doc_id = ?", (doc_id,))
+            conn .execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, metadata .get("filename", os .path .basename(file_path)), file_path,
+                 metadata .get("content_hash"), len(text), self .BLOCK_CHARS, sum(len(block)for block in blocks),
+                 time .time(), json .dumps(file_metadata, ensure_ascii=False)))
+            conn .executemany(
+                "INSERT INTO text_blocks VALUES (?, ?, ?)",
+                [(doc_id, block_no, block)for block_no, block in enumerate(blocks)])
+        return doc_id
+
+    def stage_text(self, text: str, metadata: Dict[str, Any], doc_id: Optional[str] = None) -> str:
+        """Запоминает текст документа до записи его фрагментов; в базу он попадает только через commit_text"""
+        doc_id = doc_id or document_id(metadata .get("file_path", ""))
+        with self ._lock:
+            self ._staged[doc_id] = (text, dict(metadata))
+        return doc_id
+
+    def has_staged(self, doc_id: str) -> bool:
+        with self ._lock:
+            return doc_id in self ._staged
+
+    def commit_text(self, doc_ids: Iterable[str]):
+        """Сохраняет отложенные тексты документов, фрагменты которых уже записаны, заменяя прежние версии"""
+        for doc_id in set(doc_ids):
+            with self ._lock:
+                staged = self ._staged .pop(doc_id, None)
+            if staged is not None:
+                self .save_text(staged[0], staged[1], doc_id=doc_id)
+
+    def discard_text(self, doc_ids: Iterable[str]):
+        """Забывает отложенные тексты неудавшейся индексации; сохраненная версия документа остается"""
+        with self ._lock:
+            for doc_id in doc_ids:
+                self ._staged .pop(doc_id, None)
+
+    def save_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        """Записывает общие метаданные файла, не трогая сохраненный текст"""
+        _, file_metadata = split_chunk_metadata(metadata)
+        file_path = file_metadata .get("file_path", "")
+        with self ._lock, self ._connect()as conn:
+            conn .execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, 0, ?, 0, ?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET filename = excluded.filename, file_path = excluded.file_path, "
+                "content_hash = excluded.content_hash, metadata = excluded.metadata",
+                (doc_id, file_metadata .get("filename", os .path .basename(file_path)), file_path,
+                 file_metadata .get("content_hash"), self .BLOCK_CHARS, time .time(),
+                 json .dumps(file_metadata, ensure_ascii=False)))
+
+    def get_metadata(self, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Метаданные файлов по doc_id одним запросом на каждые 500 идентификаторов"""
+        doc_ids = list(dict .fromkeys(doc_ids))
+        metadata = {}
+        with self ._connect()as conn:
+            for offset in range(0, len(doc_ids), 500):
+                batch = doc_ids[offset:offset + 500]
+                placeholders = ", ".join("?"for _ in batch)
+                for row in conn .execute(
+                        f"SELECT doc_id, metadata FROM documents WHERE doc_id IN ({placeholders})", batch):
+                    metadata[row["doc_id"]] = json .loads(row["metadata"])
+        return metadata
+
+    def find_doc_ids(self, column: str, values: Iterable[str]) -> List[str]:
+        """doc_id документов, у которых filename, content_hash или file_path входит в values"""
+        if column not in ("filename", "content_hash", "file_path"):
+            raise ValueError(f"Unsupported column: {column}")
+        values = list(values)
+        if not values:
+            return []
+        placeholders = ", ".join("?"for _ in values)
+        with self ._connect()as conn:
+            return [row["doc_id"]for row in conn .execute(
+                f"SELECT doc_id FROM documents WHERE {column} IN ({placeholders})", values)]
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        with self ._connect()as conn:
+            rows = conn .execute(
+                "SELECT doc_id, filename, file_path, content_hash, total_chars, metadata FROM documents").fetchall()
+        documents = []
+        for row in rows:
+            document = dict(row)
+            document["metadata"] = json .loads(document["metadata"])
+            documents .append(document)
+        return documents
+
+    def export_rows(self, doc_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Строки таблицы документов вместе со сжатыми блоками текста, без распаковки"""
+        doc_ids = list(dict .fromkeys(doc_ids))
+        rows = []
+        with self ._connect()as conn:
+            for offset in range(0, len(doc_ids), 500):
+                batch = doc_ids[offset:offset + 500]
+                placeholders = ", ".join("?"for _ in batch)
+                for row in conn .execute(f"SELECT * FROM documents WHERE doc_id IN ({placeholders})", batch):
+                    document = dict(row)
+                    document["blocks"] = [block["data"]for block in conn .execute(
+                        "SELECT data FROM text_blocks WHERE doc_id = ? ORDER BY block_no", (row["doc_id"],))]
+                    rows .append(document)
+        return rows
+
+    def import_rows(self, rows: List[Dict[str, Any]]):
+        """Загружает строки, полученные из export_rows, заменяя документы с теми же doc_id"""
+        with self ._lock, self ._connect()as conn:
+            for row in rows:
+                conn .execute("DELETE FROM text_blocks WHERE doc_id = ?", (row["doc_id"],))
+                conn .execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row["doc_id"], row["filename"], row["file_path"], row["content_hash"], row["total_chars"],
+                     row["block_chars"], row["compressed_bytes"], row["created_at"], row["metadata"]))
+                conn .executemany(
+                    "INSERT INTO text_blocks VALUES (?, ?, ?)",
+                    [(row["doc_id"], block_no, block)for block_no, block in enumerate(row["blocks"])])
+
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self ._connect()as conn:
+            row = conn .execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row)if row else None
+
+    def find_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self ._connect()as conn:
+            row = conn .execute(
+                "SELECT * FROM documents WHERE filename = ? ORDER BY created_at DESC LIMIT 1", (filename,)).fetchone()
+        return dict(row)if row else None
+
+    def read_text(self, doc_id: str, offset: int = 0, length: Optional[int] = None) -> str:
+        """Читает фрагмент текста, распаковывая только нужные блоки"""
+        document = self .get_document(doc_id)
+        if not document:
+            return ""
+        total_chars = document["total_chars"]
+        block_chars = document["block_chars"]
+        offset = max(0, min(offset, total_chars))
+        end = total_chars if length is None else min(total_chars, offset + max(0, length))
+        if end <= offset:
+            return ""
+
+        first_block = offset // block_chars
+        last_block = (end - 1)//block_chars
+        with self ._connect()as conn:
+            rows = conn .execute(
+                "SELECT data FROM text_blocks WHERE doc_id = ? AND block_no BETWEEN ? AND ? ORDER BY block_no",
+                (doc_id, first_block, last_block)).fetchall()
+        text = "".join(zlib .decompress(row["data"]).decode("utf-8")for row in rows)
+        start = offset - first_block * block_chars
+        return text[start:start + end - offset]
+
+    def read_page(self, doc_id: str, page: int, page_chars: int) -> Dict[str, Any]:
+        """Страница текста фиксированного размера с данными для пагинации"""
+        document = self .get_document(doc_id)
+        total_chars = document["total_chars"]if document else 0
+        page_count = max(1, -(-total_chars // page_chars))
+        page = max(0, min(page, page_count - 1))
+        return {
+            "text": self .read_text(doc_id, page * page_chars, page_chars),
+            "page": page,
+            "page_count": page_count,
+            "offset": page * page_chars,
+            "total_chars": total_chars
+        }
+
+    def delete(self, doc_ids: List[str]):
+        if not doc_ids:
+            return
+        placeholders = ", ".join("?"for _ in doc_ids)
+        with self ._lock, self ._connect()as conn:
+            conn .execute(f"DELETE FROM text_blocks WHERE doc_id IN ({placeholders})", doc_ids)
+            conn .execute(f"DELETE FROM documents WHERE doc_id IN ({placeholders})", doc_ids)
+
+    def delete_where(self, column: str, value: str):
+        self .delete(self .find_doc_ids(column, [value]))
+
+    def rename_many(self, renames: Dict[str, str]) -> Dict[str, List[str]]:
+        """Переименовывает документы одной транзакцией; путь меняется, если имя файла в нем совпадало со старым.
+        Возвращает doc_id переименованных документов по старому имени"""
+        renamed: Dict[str, List[str]] = {}
+        if not renames:
+            return renamed
+        placeholders = ", ".join("?"for _ in renames)
+        with self ._lock, self ._connect()as conn:
+            rows = conn .execute(
+                f"SELECT doc_id, filename, file_path, metadata FROM documents WHERE filename IN ({placeholders})",
+                list(renames)).fetchall()
+            for row in rows:
+                new_filename = renames[row["filename"]]
+                file_path = row["file_path"]
+                if os .path .basename(file_path) == row["filename"]:
+                    file_path = os .path .join(os .path .dirname(file_path), new_filename)
+                metadata = json .loads(row["metadata"])
+                metadata["filename"] = new_filename
+                if "file_path"in metadata:
+                    metadata["file_path"] = file_path
+                conn .execute(
+                    "UPDATE documents SET filename = ?, file_path = ?, metadata = ? WHERE doc_id = ?",
+                    (new_filename, file_path, json .dumps(metadata, ensure_ascii=False), row["doc_id"]))
+                renamed .setdefault(row["filename"], []).append(row["doc_id"])
+        return renamed
+
+    def update_metadata(self, doc_ids: List[str], updates: Dict[str, Any]) -> int:
+        """Сливает updates с метаданными документов одной транзакцией; значение None удаляет ключ"""
+        if not doc_ids:
+            return 0
+        placeholders = ", ".join("?"for _ in doc_ids)
+        with self ._lock, self ._connect()as conn:
+            rows = conn .execute(
+                f"SELECT doc_id, metadata FROM documents WHERE doc_id IN ({placeholders})", doc_ids).fetchall()
+            for row in rows:
+                metadata = json .loads(row["metadata"])
+                for key, value in updates .items():
+                    if value is None:
+                        metadata .pop(key, None)
+                    else:
+                        metadata[key] = value
+                conn .execute(
+                    "UPDATE documents SET metadata = ? WHERE doc_id = ?",
+                    (json .dumps(metadata, ensure_ascii=False), row["doc_id"]))
+        return len(rows)
+
+    def clear(self):
+        with self ._lock, self ._connect()as conn:
+            conn .execute("DELETE FROM text_blocks")
+            conn .execute("DELETE FROM documents")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self ._connect()as conn:
+            row = conn .execute(
+                "SELECT COUNT(*) AS documents, COALESCE(SUM(total_chars), 0) AS total_chars, "
+                "COALESCE(SUM(compressed_bytes), 0) AS compressed_bytes FROM documents").fetchone()
+        return dict(row)
@@ -0,0 +1,66 @@
+import logging
+import re
+from functools import partial
+from typing import Any, Dict, List, Optional
+import numpy as np
+from .flow import Flow
+
+
+class EmbeddingEstimator:
+    """Оценки релевантности контекста и уверенности в ответе по векторам, без вызовов LLM"""
+
+    def __init__(self, vector_store, llm_manager, support_threshold: float = 0.6, min_sentence_chars: int = 20):
+        self .logger = logging .getLogger(__name__)
+        self .vector_store = vector_store
+        self .llm_manager = llm_manager
+        self .support_threshold = support_threshold
+        self .min_sentence_chars = min_sentence_chars
+
+    def context_relevance(self, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Релевантность из статистики сходства запроса с найденными фрагментами"""
+        similarities = sorted((result .get("similarity", 0.0)for result in search_results), reverse=True)
+        if not similarities:
+            return self .llm_manager ._relevance_result(0, "Фрагменты не найдены")
+        best = similarities[0]
+        top_mean = float(np .mean(similarities[:3]))
+        percentage = int(round(100 * min(1.0, max(0.0, 0.6 * best + 0.4 * top_mean))))
+        details = (f"Сходство запроса с фрагментами: максимум {best:.2f}, среднее по трем лучшим {top_mean:.2f}, "
+                   f"фрагментов: {len(similarities)}")
+        return self .llm_manager ._relevance_result(percentage, details)
+
+    def split_sentences(self, answer: str) -> List[str]:
+        sentences = [sentence .strip()for sentence in re .split(r'(?<=[.!?…])\s+|\n+', answer)]
+        sentences = [sentence for sentence in sentences if len(sentence) >= self .min_sentence_chars]
+        return sentences or ([answer .strip()]if answer .strip()else [])
+
+    def answer_confidence(self, answer: str, search_results: List[Dict[str, Any]],
+                          sentence_embeddings: Optional[List[List[float]]] = None) -> Dict[str, Any]:
+        """Уверенность как доля предложений ответа, близких хотя бы к одному фрагменту контекста"""
+        try:
+            sentences = self .split_sentences(answer)
+            chunk_ids = [result["id"]for result in search_results if result .get("id")]
+            if not sentences or not chunk_ids:
+                return self .llm_manager ._confidence_result(0, "Нет ответа или контекста для сравнения")
+            if sentence_embeddings is None:
+                sentence_embeddings = self .vector_store .embed_texts(sentences)
+            stored = self .vector_store .collection .get(ids=chunk_ids, include=["embeddings"])
+            context = np .asarray(stored["embeddings"], dtype=np .float32)
+            sentence_vectors = np .asarray(sentence_embeddings, dtype=np .float32)
+            context /= np .linalg .norm(context, axis=1, keepdims=True)+1e-12
+            sentence_vectors /= np .linalg .norm(sentence_vectors, axis=1, keepdims=True)+1e-12
+            best = (sentence_vectors @ context .T).max(axis=1)
+            coverage = float(np .mean(best >= self .support_threshold))
+            mean_best = float(np .mean(best))
+            percentage = int(round(100 * min(1.0, max(0.0, 0.7 * coverage + 0.3 * mean_best))))
+            details = (f"Подкреплено контекстом {int(coverage * len(best))} из {len(best)} предложений "
+                       f"(порог {self .support_threshold:.2f}), среднее лучшее сходство {mean_best:.2f}")
+            return self .llm_manager ._confidence_result(percentage, details)
+        except Exception as e:
+            return self .llm_manager ._confidence_fallback(e)
+
+    def _answer_confidence_flow(self, answer: str, search_results: List[Dict[str, Any]]) -> Flow:
+        try:
+            sentence_embeddings = yield ("embed", self .split_sentences(answer))
+        except Exception as e:
+            return self .llm_manager ._confidence_fallback(e)
+        return (yield ("call", partial(self .answer_confidence, answer, search_results, sentence_embeddings)))
@@ -0,0 +1,146 @@
+from concurrent .futures import Executor, Future
+from typing import Any, AsyncIterator, Callable, Generator, Iterator, Optional
+import ollama
+
+
+Flow = Generator[tuple, Any, Any]
+
+
+def _advance(flow: Flow, result: Any, error: Optional[BaseException]) -> tuple:
+    if error is not None:
+        return flow .throw(error)
+    return flow .send(result)
+
+
+def iter_flow(flow: Flow, io) -> Iterator[Any]:
+    """Выполняет поток синхронно: отдает значения ("emit", value), операции (имя, *аргументы) вызывает у io"""
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = _advance(flow, result, error)
+            except StopIteration as stop:
+                return stop .value
+            result, error = None, None
+            if item[0] == "emit":
+                yield item[1]
+                continue
+            try:
+                result = getattr(io, item[0])(*item[1:])
+            except Exception as e:
+                error = e
+    finally:
+        flow .close()
+
+
+def run_flow(flow: Flow, io) -> Any:
+    """Выполняет поток синхронно и возвращает его результат; выданные значения отбрасываются"""
+    emitted = iter_flow(flow, io)
+    while True:
+        try:
+            next(emitted)
+        except StopIteration as stop:
+            return stop .value
+
+
+async def aiter_flow(flow: Flow, io) -> AsyncIterator[Any]:
+    """Асинхронный аналог iter_flow: операции io - корутины"""
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = _advance(flow, result, error)
+            except StopIteration:
+                return
+            result, error = None, None
+            if item[0] == "emit":
+                yield item[1]
+                continue
+            try:
+                result = await getattr(io, item[0])(*item[1:])
+            except Exception as e:
+                error = e
+    finally:
+        flow .close()
+
+
+async def run_flow_async(flow: Flow, io) -> Any:
+    """Асинхронный аналог run_flow"""
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = _advance(flow, result, error)
+            except StopIteration as stop:
+                return stop .value
+            result, error = None, None
+            if item[0] == "emit":
+                continue
+            try:
+                result = await getattr(io, item[0])(*item[1:])
+            except Exception as e:
+                error = e
+    finally:
+        flow .close()
+
+
+def relay(flow: Flow, on_emit: Callable[[Any], Flow]) -> Flow:
+    """Выполняет вложенный поток внутри текущего; каждое выданное им значение обрабатывает поток on_emit"""
+    result, error = None, None
+    try:
+        while True:
+            try:
+                item = _advance(flow, result, error)
+            except StopIteration as stop:
+                return stop .value
+            result, error = None, None
+            if item[0] == "emit":
+                yield from on_emit(item[1])
+                continue
+            try:
+                result = yield item
+            except Exception as e:
+                error = e
+    finally:
+        flow .close()
+
+
+def call_flow(function: Callable[[], Any]) -> Flow:
+    """Поток из одного блокирующего вызова, например для запуска через spawn"""
+    return (yield ("call", function))
+
+
+class SyncIO:
+    """Синхронные операции потоков: Ollama через модуль ollama, эмбеддинги хранилища, фоновые задачи в пуле потоков"""
+
+    def __init__(self, vector_store=None, executor: Optional[Executor] = None):
+        self .vector_store = vector_store
+        self .executor = executor
+
+    def generate(self, request: dict) -> dict:
+        return ollama .generate(**request)
+
+    def stream(self, request: dict) -> Iterator[dict]:
+        return iter(ollama .generate(stream=True, **request))
+
+    def next_chunk(self, stream: Iterator[dict]) -> Optional[dict]:
+        return next(stream, None)
+
+    def embed(self, texts: list) -> list:
+        return self .vector_store .embed_texts(texts)
+
+    def embed_documents(self, texts: list) -> list:
+        return self .vector_store .generate_embeddings(texts)
+
+    def call(self, function: Callable[[], Any]) -> Any:
+        return function()
+
+    def spawn(self, flow: Flow) -> Future:
+        if self .executor is None:
+            future = Future()
+            future .set_result(run_flow(flow, self))
+            return future
+        return self .executor .submit(run_flow, flow, self)
+
+    def wait(self, handle: Future) -> Any:
+        return handle .result()
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+from .progress import SimpleProgressTracker, ProcessingStage, EVENT_PROGRESS
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class IngestionJobCancelled (Exception):
+    pass
+
+
+class JobProgressTracker (SimpleProgressTracker):
+    """Трекер без UI: хранит состояние для опроса из интерфейса и прерывает работу при отмене"""
+
+    def __init__(self, cancel_event: threading .Event):
+        super().__init__(sinks=[])
+        self .cancel_event = cancel_event
+        self ._is_active = True
+
+    def setup_ui(self, container=None):
+        pass
+
+    def _update_display(self, title: str = None, kind: str = EVENT_PROGRESS):
+        if self .cancel_event .is_set()and self .state .stage != ProcessingStage .ERROR:
+            raise IngestionJobCancelled("Задача отменена пользователем")
+        super()._update_display(title, kind)
+
+
+class IngestionJobManager:
+    """Персистентная очередь задач индексации с рабочими потоками, не зависящими от сессий Streamlit"""
+
+    def __init__(self, pipeline_factory, jobs_file: str = "./data/ingestion_jobs.json", num_workers: int = 1,
+                 max_finished_jobs: int = 200):
+        self .logger = logging .getLogger(__name__)
+        self .pipeline_factory = pipeline_factory
+        self .jobs_file = jobs_file
+        self .num_workers = max(1, num_workers)
+        self .max_finished_jobs = max_finished_jobs
+
+        self ._lock = threading .RLock()
+        self ._queue: "queue.Queue[str]" = queue .Queue()
+        self ._jobs: Dict[str, Dict[str, Any]] = {}
+        self ._trackers: Dict[str, JobProgressTracker] = {}
+        self ._cancel_events: Dict[str, threading .Event] = {}
+        self ._workers: List[threading .Thread] = []
+
+        os .makedirs(os .path .dirname(jobs_file)or ".", exist_ok=True)
+        self ._load_jobs()
+
+    def _load_jobs(self):
+        if not os .path .exists(self .jobs_file):
+            return
+        try:
+            with open(self .jobs_file, 'r', encoding='utf-8')as f:
+                jobs = json .load(f)
+        except Exception as e:
+            self .logger .error(f"Error loading ingestion jobs: {str(e)}")
+            return
+
+        for job in sorted(jobs, key=lambda j: j .get("created_at", 0)):
+            if job["status"] == JOB_RUNNING:
+                job["status"] = JOB_QUEUED
+                job["message"] = "Задача прервана перезапуском и поставлена в очередь заново"
+            self ._jobs[job["id"]] = job
+            if job["status"] == JOB_QUEUED:
+                self ._queue .put(job["id"])
+
+    def _save_jobs(self):
+        with self ._lock:
+            finished = [job for job in self ._jobs .values()if job["status"]in FINISHED_STATES]
+            if len(finished) > self .max_finished_jobs:
+                finished .sort(key=lambda j: j .get("finished_at")or 0)
+                for job in finished[:len(finished)-self .max_finished_jobs]:
+                    del self ._jobs[job["id"]]
+
+            temp_path = self .jobs_file + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8')as f:
+                    json .dump(list(self ._jobs .values()), f, ensure_ascii=False, indent=2)
+                os .replace(temp_path, self .jobs_file)
+            except Exception as e:
+                self .logger .error(f"Error saving ingestion jobs: {str(e)}")
+
+    def start(self):
+        with self ._lock:
+            self ._workers = [worker for worker in self ._workers if worker .is_alive()]
+            while len(self ._workers) < self .num_workers:
+                worker = threading .Thread(
+                    target=self ._worker_loop, name=f"ingestion-worker-{len(self ._workers)}", daemon=True)
+                worker .start()
+                self ._workers .append(worker)
+
+    def submit_upload(self, saved_upload: Dict[str, Any], chunk_size: int = 512, chunk_overlap: int = 128,
+                      dedup_mode: str = "link") -> str:
+        """Ставит сохраненную на диск загрузку в очередь индексации и возвращает id задачи"""
+        job_id = uuid .uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "filename": saved_upload["original_name"],
+            "source": saved_upload,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "dedup_mode": dedup_mode,
+            "status": JOB_QUEUED,
+            "message": "В очереди",
+            "error": "",
+            "attempts": 0,
+            "created_at": time .time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": None
+        }
+        with self ._lock:
+            self ._jobs[job_id] = job
+            self ._save_jobs()
+        self ._queue .put(job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        with self ._lock:
+            job = self ._jobs .get(job_id)
+            if not job or job["status"]in FINISHED_STATES:
+                return False
+            if job["status"] == JOB_QUEUED:
+                self ._finish_job(job, JOB_CANCELLED, "Отменено до начала обработки")
+            else:
+                job["message"] = "Отмена..."
+                self ._cancel_events[job_id].set()
+            return True
+
+    def retry(self, job_id: str) -> bool:
+        with self ._lock:
+            job = self ._jobs .get(job_id)
+            if not job or job["status"]not in (JOB_FAILED, JOB_CANCELLED):
+                return False
+            job["status"] = JOB_QUEUED
+            job["message"] = "Повторно поставлено в очередь"
+            job["error"] = ""
+            job["finished_at"] = None
+            job["progress"] = None
+            self ._save_jobs()
+        self ._queue .put(job_id)
+        return True
+
+    def clear_finished(self) -> int:
+        with self ._lock:
+            finished = [job for job in self ._jobs .values()if job["status"]in FINISHED_STATES]
+            for job in finished:
+                partial_path = job["source"]["partial_path"]
+                if job["status"] != JOB_COMPLETED and os .path .exists(partial_path):
+                    try:
+                        os .remove(partial_path)
+                    except OSError:
+                        pass
+                del self ._jobs[job["id"]]
+            self ._save_jobs()
+        return len(finished)
+
+    def get_jobs(self) -> List[Dict[str, Any]]:
+        """Снимок всех задач с текущим прогрессом выполняющихся"""
+        with self ._lock:
+            snapshot = []
+            for job in sorted(self ._jobs .values(), key=lambda j: j["created_at"], reverse=True):
+                item = {key: value for key, value in job .items()if key != "source"}
+                tracker = self ._trackers .get(job["id"])
+                if tracker:
+                    item["progress"] = tracker .get_current_state()
+                snapshot .append(item)
+            return snapshot
+
+    def get_status(self) -> Dict[str, Any]:
+        with self ._lock:
+            counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING)+FINISHED_STATES}
+            for job in self ._jobs .values():
+                counts[job["status"]] += 1
+            return {
+                "workers": sum(1 for worker in self ._workers if worker .is_alive()),
+                **counts
+            }
+
+    def _finish_job(self, job: Dict[str, Any], status: str, message: str, error: str = ""):
+        job["status"] = status
+        job["message"] = message
+        job["error"] = error
+        job["finished_at"] = time .time()
+        tracker = self ._trackers .pop(job["id"], None)
+        if tracker:
+            job["progress"] = tracker .get_current_state()
+        self ._cancel_events .pop(job["id"], None)
+        self ._save_jobs()
+
+    def _worker_loop(self):
+        while True:
+            job_id = self ._queue .get()
+            with self ._lock:
+                job = self ._jobs .get(job_id)
+                if not job or job["status"] != JOB_QUEUED:
+                    continue
+                cancel_event = threading .Event()
+                tracker = JobProgressTracker(cancel_event)
+                job["status"] = JOB_RUNNING
+                job["message"] = "Обработка"
+                job["attempts"] += 1
+                job["started_at"] = time .time()
+                self ._cancel_events[job_id] = cancel_event
+                self ._trackers[job_id] = tracker
+                self ._save_jobs()
+
+            tracker .start_session(1, job["filename"])
+            try:
+                success = self ._run_job(job, tracker)
+                error = tracker .state .error_message
+            except Exception as e:
+                success = False
+                error = str(e)
+
+            cancelled = cancel_event .is_set()and not success
+            if cancelled:
+                self ._cleanup_cancelled(job)
+
+            with self ._lock:
+                if cancelled:
+                    self ._finish_job(job, JOB_CANCELLED, "Отменено")
+                elif success:
+                    self ._finish_job(job, JOB_COMPLETED, tracker .state .message or "Готово")
+                else:
+                    self ._finish_job(job, JOB_FAILED, "Ошибка", error or "Не удалось обработать файл")
+
+    def _run_job(self, job: Dict[str, Any], tracker: JobProgressTracker) -> bool:
+        pipeline = self .pipeline_factory(
+            progress_tracker=tracker, chunk_size=job["chunk_size"], chunk_overlap=job["chunk_overlap"],
+            dedup_mode=job .get("dedup_mode", "link"))
+        source = job["source"]
+        if os .path .exists(source["partial_path"]):
+            return pipeline .ingest_saved_upload(source)
+
+        final_path = source .get("final_path")
+        if final_path and os .path .exists(final_path):
+            tracker .start_file(os .path .basename(final_path), 5)
+            success = pipeline .ingest_file(final_path)
+            if success:
+                tracker .complete_file()
+            return success
+
+        tracker .set_error("Файл загрузки не найден на диске")
+        return False
+
+    def _cleanup_cancelled(self, job: Dict[str, Any]):
+        """Удаляет только документ, созданный этой задачей; копии с тем же содержимым не трогаются"""
+        final_path = job["source"].get("final_path")
+        if not final_path:
+            return
+        try:
+            pipeline = self .pipeline_factory(
+                chunk_size=job["chunk_size"], chunk_overlap=job["chunk_overlap"],
+                dedup_mode=job .get("dedup_mode", "link"))
+            pipeline .vector_store .delete_documents_by_file_path(final_path)
+        except Exception as e:
+            self .logger .error(f"Error cleaning up cancelled job {job['id']}: {str(e)}")
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class IngestionQueue:
+    """Фоновая очередь индексации файлов, объединяющая частые изменения одного и того же пути"""
+
+    def __init__(self, handler: Callable[[str, str], bool], settle_seconds: float = 2.0):
+        self .logger = logging .getLogger(__name__)
+        self .handler = handler
+        self .settle_seconds = settle_seconds
+        self ._pending: Dict[str, Dict[str, Any]] = {}
+        self ._condition = threading .Condition()
+        self ._thread: Optional[threading .Thread] = None
+        self ._stopped = False
+        self ._current_path: Optional[str] = None
+        self .stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "processed": 0,
+            "failed": 0
+        }
+
+    def submit(self, path: str, event: str, callback: Optional[Callable[[str, str, bool], None]] = None):
+        """Ставит событие в очередь; повторные события по тому же пути заменяют предыдущее"""
+        action = "remove"if event == "removed"else "upsert"
+        with self ._condition:
+            if path in self ._pending:
+                self .stats["coalesced"] += 1
+            self ._pending[path] = {
+                "action": action,
+                "due": time .time()+self .settle_seconds,
+                "callback": callback
+            }
+            self .stats["submitted"] += 1
+            self ._condition .notify()
+
+    def start(self):
+        with self ._condition:
+            if self ._thread and self ._thread .is_alive():
+                return
+            self ._stopped = False
+            self ._thread = threading .Thread(
+                target=self ._run, name="ingestion-queue", daemon=True)
+            self ._thread .start()
+
+    def stop(self, timeout: float = 5.0):
+        with self ._condition:
+            self ._stopped = True
+            self ._condition .notify_all()
+        if self ._thread:
+            self ._thread .join(timeout)
+
+    def _next_ready(self):
+        while not self ._stopped:
+            if self ._pending:
+                path, item = min(self ._pending .items(), key=lambda entry: entry[1]["due"])
+                delay = item["due"]-time .time()
+                if delay <= 0:
+                    del self ._pending[path]
+                    return path, item
+                self ._condition .wait(delay)
+            else:
+                self ._condition .wait()
+        return None
+
+    def _run(self):
+        while True:
+            with self ._condition:
+                ready = self ._next_ready()
+                if ready is None:
+                    return
+                path, item = ready
+                self ._current_path = path
+
+            success = False
+            try:
+                success = bool(self .handler(path, item["action"]))
+            except Exception as e:
+                self .logger .error(f"Ingestion of {path} failed: {str(e)}")
+
+            with self ._condition:
+                self ._current_path = None
+                self .stats["processed"if success else "failed"] += 1
+
+            if item["callback"]:
+                try:
+                    item["callback"](path, item["action"], success)
+                except Exception as e:
+                    self .logger .error(f"Ingestion callback for {path} failed: {str(e)}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self ._condition:
+            return {
+                "pending": len(self ._pending),
+                "current_path": self ._current_path,
+                "running": bool(self ._thread and self ._thread .is_alive()),
+                **self .stats
+            }
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+
+CACHE_METHODS = ("router", "relevance", "confidence", "answer")
+_caches: Dict[str, "LLMResponseCache"] = {}
+_caches_lock = threading .Lock()
+
+
+class LLMResponseCache:
+    """Дисковый кэш ответов LLM с точным совпадением запроса, вытеснением по TTL и размеру"""
+
+    def __init__(self, db_path: str = "./data/llm_cache.sqlite3", max_entries: int = 5000,
+                 ttl_seconds: float = 7 * 24 * 3600, evict_every: int = 100):
+        self .logger = logging .getLogger(__name__)
+        self .db_path = db_path
+        self .max_entries = max_entries
+        self .ttl_seconds = ttl_seconds
+        self .evict_every = max(1, evict_every)
+        self ._lock = threading .Lock()
+        self ._writes = 0
+        self .metrics = {method: {"hits": 0, "misses": 0}for method in CACHE_METHODS}
+        os .makedirs(os .path .dirname(os .path .abspath(db_path)), exist_ok=True)
+        with self ._connect()as conn:
+            conn .executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+        self .enabled_methods = set(self ._load_enabled_methods())
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3 .connect(self .db_path, timeout=30)
+        conn .row_factory = sqlite3 .Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn .close()
+
+    def _load_enabled_methods(self) -> Iterable[str]:
+        with self ._connect()as conn:
+            row = conn .execute("SELECT value FROM settings WHERE key = 'enabled_methods'").fetchone()
+        if row is None:
+            return CACHE_METHODS
+        return [method for method in json .loads(row["value"])if method in CACHE_METHODS]
+
+    def set_enabled_methods(self, methods: Iterable[str]):
+        """Включает кэш только для перечисленных методов; выбор сохраняется в базе кэша"""
+        methods = [method for method in methods if method in CACHE_METHODS]
+        with self ._lock, self ._connect()as conn:
+            conn .execute("INSERT OR REPLACE INTO settings VALUES ('enabled_methods', ?)", (json .dumps(methods),))
+        self .enabled_methods = set(methods)
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        payload = {
+            "model": request .get("model"),
+            "system": request .get("system"),
+            "prompt": request .get("prompt"),
+            "options": request .get("options"),
+            "format": request .get("format")
+        }
+        return hashlib .sha256(json .dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, method: str, request: Dict[str, Any]) -> Optional[str]:
+        if method not in self .enabled_methods:
+            return None
+        key = self .make_key(request)
+        now = time .time()
+        with self ._lock, self ._connect()as conn:
+            row = conn .execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row["created_at"] > self .ttl_seconds:
+                conn .execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self .metrics[method]["misses"] += 1
+                return None
+            conn .execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self .metrics[method]["hits"] += 1
+            return row["response"]
+
+    def put(self, method: str, request: Dict[str, Any], response: str):
+        if method not in self .enabled_methods:
+            return
+        now = time .time()
+        with self ._lock, self ._connect()as conn:
+            conn .execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (self .make_key(request), method, request .get("model", ""), response, now, now))
+            self ._writes += 1
+            if self ._writes % self .evict_every == 0:
+                self ._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        conn .execute("DELETE FROM responses WHERE created_at < ?", (now - self .ttl_seconds,))
+        count = conn .execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self .max_entries:
+            conn .execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (count - self .max_entries,))
+
+    def evict(self):
+        """Удаляет просроченные записи и самые давно использованные сверх max_entries"""
+        with self ._lock, self ._connect()as conn:
+            self ._evict(conn, time .time())
+
+    def clear(self):
+        with self ._lock, self ._connect()as conn:
+            conn .execute("DELETE FROM responses")
+        self .metrics = {method: {"hits": 0, "misses": 0}for method in CACHE_METHODS}
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self ._connect()as conn:
+            row = conn .execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(response)), 0) AS chars FROM responses").fetchone()
+        hits = sum(metrics["hits"]for metrics in self .metrics .values())
+        lookups = hits + sum(metrics["misses"]for metrics in self .metrics .values())
+        return {
+            "entries": row["entries"],
+            "response_chars": row["chars"],
+            "max_entries": self .max_entries,
+            "ttl_seconds": self .ttl_seconds,
+            "enabled_methods": sorted(self .enabled_methods),
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "by_method": {method: dict(metrics)for method, metrics in self .metrics .items()}
+        }
+
+
+def get_llm_cache(db_path: str = "./data/llm_cache.sqlite3") -> LLMResponseCache:
+    """Один экземпляр кэша на файл базы в процессе, чтобы настройки и метрики были общими для всех пайплайнов"""
+    db_path = os .path .abspath(db_path)
+    with _caches_lock:
+        if db_path not in _caches:
+            _caches[db_path] = LLMResponseCache(db_path)
+        return _caches[db_path]
@@ -1,13 +1,79 @@
 import ollama
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional, List
 import json
 import logging
+import re
+from .llm_cache import LLMResponseCache, get_llm_cache
+from .flow import Flow, SyncIO, iter_flow, run_flow
+
+
+class ThinkTagFilter:
+    """Потоковый фильтр, вырезающий блоки <think>...</think>, даже если теги разорваны между фрагментами"""
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self .buffer = ""
+        self .inside = False
+
+    def feed(self, text: str) -> str:
+        self .buffer += text
+        output = []
+        while self .buffer:
+            tag = self .CLOSE_TAG if self .inside else self .OPEN_TAG
+            position = self .buffer .lower().find(tag)
+            if position >= 0:
+                if not self .inside:
+                    output .append(self .buffer[:position])
+                self .buffer = self .buffer[position + len(tag):]
+                self .inside = not self .inside
+                continue
+            keep = self ._partial_tag_length(tag)
+            if not self .inside:
+                output .append(self .buffer[:len(self .buffer)-keep])
+            self .buffer = self .buffer[len(self .buffer)-keep:]
+            break
+        return "".join(output)
+
+    def _partial_tag_length(self, tag: str) -> int:
+        lowered = self .buffer .lower()
+        for length in range(min(len(tag)-1, len(lowered)), 0, -1):
+            if lowered .endswith(tag[:length]):
+                return length
+        return 0
+
+    def flush(self) -> str:
+        text = ""if self .inside else self .buffer
+        self .buffer = ""
+        self .inside = False
+        return text
+
+
+STRUCTURED_ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "cited_chunks": {"type": "array", "items": {"type": "integer"}},
+        "relevance": {"type": "integer", "minimum": 0, "maximum": 100},
+        "confidence": {"type": "integer", "minimum": 0, "maximum": 100}
+    },
+    "required": ["answer", "cited_chunks", "relevance", "confidence"]
+}
+
+
+DEFAULT_NUM_CTX = 4096
 
 
 class LLMManager:
-    def __init__(self, model_name: str = "qwen2.5-coder:latest"):
+    def __init__(self, model_name: str = "qwen2.5-coder:latest", cache: Optional[LLMResponseCache] = None,
+                 num_ctx: Optional[int] = None):
         self .model_name = model_name
         self .logger = logging .getLogger(__name__)
+        self .cache = cache if cache is not None else get_llm_cache()
+        self .num_ctx = num_ctx
+        self .io = SyncIO()
+        self ._context_window: Optional[int] = None
         self .system_prompt = """РОЛЬ: Экспертный ассистент-аналитик документов
 
 ВАША МИССИЯ:
@@ -75,12 +141,33 @@ class LLMManager:
                 options={"num_predict": 1}
             )
             self .model_name = model_name
+            self ._context_window = None
             return True
         except Exception as e:
             self .logger .error(
                 f"Failed to update model to {model_name}: {str(e)}")
             return False
 
+    def get_context_window(self) -> int:
+        """Размер контекстного окна: явный num_ctx, параметр num_ctx модели в Ollama или DEFAULT_NUM_CTX"""
+        if self .num_ctx:
+            return self .num_ctx
+        if self ._context_window is None:
+            self ._context_window = DEFAULT_NUM_CTX
+            try:
+                parameters = ollama .show(self .model_name).get("parameters")or ""
+                match = re .search(r'num_ctx\s+(\d+)', parameters)
+                if match:
+                    self ._context_window = int(match .group(1))
+            except Exception as e:
+                self .logger .warning(f"Could not read num_ctx of {self .model_name}: {str(e)}")
+        return self ._context_window
+
+    def prompt_template(self, query: str, system_prompt_style: str = "Профессиональный") -> str:
+        """Текст запроса без контекста (системный промпт, шаблон и вопрос) для подсчета накладных токенов"""
+        request = self ._generation_request(query, "-", 0.0, 0, system_prompt_style)
+        return request["system"]+"\n"+request["prompt"]
+
     def check_model_availability(self) -> bool:
         try:
             models_response = ollama .list()
@@ -114,48 +201,157 @@ class LLMManager:
                     f"Модель {self .model_name} недоступна: {test_error}")
                 return False
 
-    def generate_response(self, prompt: str, context: str = "", temperature: float = 0.2,
-                          max_tokens: int = 2000, system_prompt_style: str = "Профессиональный") -> str:
-        try:
+    def _generate_flow(self, method: str, request: Dict[str, Any]) -> Flow:
+        """Поток ответа generate с учетом кэша; method определяет, включен ли кэш для вызова"""
+        cached = self .cache .get(method, request)
+        if cached is None:
+            cached = (yield ("generate", request))['response']
+            self .cache .put(method, request, cached)
+        return cached
+
+    def _generate(self, method: str, request: Dict[str, Any]) -> str:
+        """Текст ответа ollama.generate с учетом кэша"""
+        return run_flow(self ._generate_flow(method, request), self .io)
 
-            system_prompts = self ._get_system_prompts()
-            style_prompt = system_prompts .get(
-                system_prompt_style, system_prompts["Профессиональный"])
+    def _generation_request(self, prompt: str, context: str, temperature: float, max_tokens: int,
+                            system_prompt_style: str) -> Dict[str, Any]:
+        system_prompts = self ._get_system_prompts()
+        style_prompt = system_prompts .get(
+            system_prompt_style, system_prompts["Профессиональный"])
 
-            combined_system_prompt = f"{self .system_prompt}\n\nСТИЛЬ ОБЩЕНИЯ: {style_prompt}"
+        combined_system_prompt = f"{self .system_prompt}\n\nСТИЛЬ ОБЩЕНИЯ: {style_prompt}"
 
-            if context:
-                full_prompt = f"""БАЗА ЗНАНИЙ:
+        if context:
+            full_prompt = f"""БАЗА ЗНАНИЙ:
 {context}
 
 ВОПРОС ПОЛЬЗОВАТЕЛЯ:
 {prompt}
 
 ВАШ ЭКСПЕРТНЫЙ ОТВЕТ:"""
-            else:
-                full_prompt = f"""ВОПРОС ПОЛЬЗОВАТЕЛЯ:
+        else:
+            full_prompt = f"""ВОПРОС ПОЛЬЗОВАТЕЛЯ:
 {prompt}
 
 ВАШ ОТВЕТ:"""
-            response = ollama .generate(
-                model=self .model_name,
-                prompt=full_prompt,
-                system=combined_system_prompt,
-                options={
-                    "temperature": temperature,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "num_predict": max_tokens,
-                    "repeat_penalty": 1.1
-                }
-            )
+        return {
+            "model": self .model_name,
+            "prompt": full_prompt,
+            "system": combined_system_prompt,
+            "options": {
+                "temperature": temperature,
+                "top_p": 0.9,
+                "top_k": 40,
+                "num_predict": max_tokens,
+                "num_ctx": self .get_context_window(),
+                "repeat_penalty": 1.1
+            }
+        }
+
+    def generate_response(self, prompt: str, context: str = "", temperature: float = 0.2,
+                          max_tokens: int = 2000, system_prompt_style: str = "Профессиональный") -> str:
+        try:
+            response = self ._generate("answer", self ._generation_request(
+                prompt, context, temperature, max_tokens, system_prompt_style))
             clean_response = self ._clean_response(
-                response['response'].strip())
+                response .strip())
             return clean_response
         except Exception as e:
             self .logger .error(f"Error generating response: {str(e)}")
             return "Извините, произошла ошибка при генерации ответа."
 
+    def stream_response(self, prompt: str, context: str = "", temperature: float = 0.2,
+                        max_tokens: int = 2000, system_prompt_style: str = "Профессиональный") -> Iterator[str]:
+        """Отдает ответ по мере генерации, вырезая блоки <think> на лету"""
+        yield from iter_flow(self ._stream_flow(
+            prompt, context, temperature, max_tokens, system_prompt_style), self .io)
+
+    def _stream_flow(self, prompt: str, context: str = "", temperature: float = 0.2,
+                     max_tokens: int = 2000, system_prompt_style: str = "Профессиональный") -> Flow:
+        """Поток ответа по мере генерации: выдает ("emit", текст) без блоков <think>"""
+        think_filter = ThinkTagFilter()
+        started = False
+        try:
+            request = self ._generation_request(prompt, context, temperature, max_tokens, system_prompt_style)
+            cached = self .cache .get("answer", request)
+            stream = None if cached is not None else (yield ("stream", request))
+            raw = []
+            while True:
+                if stream is not None:
+                    chunk = yield ("next_chunk", stream)
+                else:
+                    chunk = None if raw else {"response": cached}
+                if chunk is None:
+                    break
+                raw .append(chunk['response'])
+                text = think_filter .feed(chunk['response'])
+                if not started:
+                    text = text .lstrip()
+                if text:
+                    started = True
+                    yield ("emit", text)
+            text = think_filter .flush()
+            if not started:
+                text = text .lstrip()
+            if text:
+                yield ("emit", text)
+            if cached is None:
+                self .cache .put("answer", request, "".join(raw))
+        except Exception as e:
+            self .logger .error(f"Error streaming response: {str(e)}")
+            yield ("emit", "Извините, произошла ошибка при генерации ответа.")
+
+    def _structured_request(self, prompt: str, chunks: List[str], temperature: float, max_tokens: int,
+                            system_prompt_style: str) -> Dict[str, Any]:
+        context = "\n\n".join(f"[{number}] {chunk}"for number, chunk in enumerate(chunks, 1))
+        request = self ._generation_request(prompt, context, temperature, max_tokens, system_prompt_style)
+        request["prompt"] += """
+
+Верните только JSON с полями:
+answer - ответ пользователю в markdown;
+cited_chunks - номера фрагментов базы знаний [N], на которые опирается ответ;
+relevance - процент (0-100) полезности базы знаний для ответа на вопрос;
+confidence - процент (0-100) уверенности в ответе."""
+        request["format"] = STRUCTURED_ANSWER_SCHEMA
+        return request
+
+    def _parse_structured(self, result_text: str, chunk_count: int) -> Dict[str, Any]:
+        data = json .loads(result_text)
+        relevance = min(100, max(0, int(data .get("relevance", 0))))
+        confidence = min(100, max(0, int(data .get("confidence", 50))))
+        cited = sorted({int(number)for number in data .get("cited_chunks", [])if 1 <= int(number) <= chunk_count})
+        details = f"relevance: {relevance}%, confidence: {confidence}%, cited: {cited}"
+        return {
+            "answer": self ._clean_response(str(data .get("answer", "")).strip()),
+            "cited_chunks": [number - 1 for number in cited],
+            "context_relevance": self ._relevance_result(relevance, details),
+            "confidence_assessment": self ._confidence_result(confidence, details)
+        }
+
+    def generate_structured_response(self, prompt: str, chunks: List[str], temperature: float = 0.2,
+                                     max_tokens: int = 2000,
+                                     system_prompt_style: str = "Профессиональный") -> Dict[str, Any]:
+        """Один вызов с JSON-ответом: ответ, номера процитированных фрагментов, релевантность и уверенность"""
+        return run_flow(self ._structured_flow(prompt, chunks, temperature, max_tokens, system_prompt_style), self .io)
+
+    def _structured_flow(self, prompt: str, chunks: List[str], temperature: float, max_tokens: int,
+                         system_prompt_style: str) -> Flow:
+        try:
+            response = yield from self ._generate_flow("answer", self ._structured_request(
+                prompt, chunks, temperature, max_tokens, system_prompt_style))
+            return self ._parse_structured(response, len(chunks))
+        except Exception as e:
+            return self ._structured_fallback(e)
+
+    def _structured_fallback(self, error: Exception) -> Dict[str, Any]:
+        self .logger .error(f"Error generating structured response: {str(error)}")
+        return {
+            "answer": "Извините, произошла ошибка при генерации ответа.",
+            "cited_chunks": [],
+            "context_relevance": self ._relevance_result(50, "Ошибка оценки релевантности"),
+            "confidence_assessment": self ._confidence_result(50, "Ошибка оценки уверенности")
+        }
+
     def generate_router_decision(self, query: str, context: str) -> Dict[str, Any]:
         """Улучшенный маршрутизатор RAG 2024 с многоуровневой оценкой"""
         try:
@@ -209,17 +405,17 @@ class LLMManager:
 
 РЕШЕНИЕ: [Использовать/Отклонить контекст]"""
 
-            response = ollama .generate(
-                model=self .model_name,
-                prompt=router_prompt,
-                options={
+            response = self ._generate("router", {
+                "model": self .model_name,
+                "prompt": router_prompt,
+                "options": {
                     "temperature": 0.1,
                     "top_p": 0.9,
                     "num_predict": 300
                 }
-            )
+            })
 
-            result_text = response['response'].strip()
+            result_text = response .strip()
 
             relevance_level = 3
             relevance_percentage = 50
@@ -282,45 +478,6 @@ class LLMManager:
             self .logger .error(f"Error in simple router decision: {str(e)}")
             return True
 
-    def summarize_context(self, context: str, max_length: int = 1000) -> str:
-        if len(context) <= max_length:
-            return context
-        try:
-            summary_prompt = f"""РОЛЬ: Профессиональный аналитик-суммаризатор
-
-ЗАДАЧА: Создать структурированное краткое изложение документа
-
-ТРЕБОВАНИЯ:
-• Максимум {max_length} символов
-• Сохранить ВСЮ ключевую информацию
-• Выделить основные факты, цифры, даты
-• Убрать дублирования и избыточность
-• Сохранить язык оригинального текста
-• Структурировать по важности
-
-СТРУКТУРА ИЗЛОЖЕНИЯ:
-1. Главные факты и выводы
-2. Ключевые данные (цифры, даты, имена)
-3. Важные детали и контекст
-
-ИСХОДНЫЙ ДОКУМЕНТ:
-{context}
-
-СТРУКТУРИРОВАННОЕ ИЗЛОЖЕНИЕ:"""
-            response = ollama .generate(
-                model=self .model_name,
-                prompt=summary_prompt,
-                options={
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "num_predict": max_length // 4
-                }
-            )
-            return response['response'].strip()
-        except Exception as e:
-            self .logger .error(f"Error summarizing context: {str(e)}")
-            return context[:max_length]+"..."
-
     def extract_key_topics(self, text: str) -> List[str]:
         try:
             topics_prompt = f"""РОЛЬ: Эксперт-аналитик семантических тем
@@ -361,10 +518,8 @@ class LLMManager:
             self .logger .error(f"Error extracting topics: {str(e)}")
             return []
 
-    def evaluate_context_relevance(self, query: str, context: str) -> Dict[str, Any]:
-        """Новый метод 2024: оценка релевантности контекста для RAGAS-подобной оценки"""
-        try:
-            relevance_prompt = f"""РОЛЬ: Эксперт по оценке релевантности контекста
+    def _relevance_request(self, query: str, context: str) -> Dict[str, Any]:
+        relevance_prompt = f"""РОЛЬ: Эксперт по оценке релевантности контекста
 
 ЗАДАЧА: Оценить какие предложения из контекста действительно полезны для ответа на вопрос
 
@@ -392,48 +547,57 @@ class LLMManager:
 
 ОБЩАЯ РЕЛЕВАНТНОСТЬ: [процент]%
 НАИБОЛЕЕ ПОЛЕЗНЫЕ ПРЕДЛОЖЕНИЯ: [номера предложений]"""
+        return {
+            "model": self .model_name,
+            "prompt": relevance_prompt,
+            "options": {
+                "temperature": 0.1,
+                "top_p": 0.9,
+                "num_predict": 500
+            }
+        }
 
-            response = ollama .generate(
-                model=self .model_name,
-                prompt=relevance_prompt,
-                options={
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "num_predict": 500
-                }
-            )
-
-            result_text = response['response'].strip()
+    def _parse_relevance(self, result_text: str) -> Dict[str, Any]:
+        relevance_percentage = 0
+        lines = result_text .split('\n')
+        for line in lines:
+            if 'ОБЩАЯ РЕЛЕВАНТНОСТЬ' in line:
+                import re
+                match = re .search(r'(\d+)%', line)
+                if match:
+                    relevance_percentage = int(match .group(1))
+                    break
+        return self ._relevance_result(relevance_percentage, result_text)
+
+    def _relevance_result(self, relevance_percentage: int, detailed_analysis: str) -> Dict[str, Any]:
+        return {
+            "relevance_score": relevance_percentage / 100.0,
+            "detailed_analysis": detailed_analysis,
+            "is_relevant": relevance_percentage > 30
+        }
 
-            relevance_percentage = 0
-            lines = result_text .split('\n')
-            for line in lines:
-                if 'ОБЩАЯ РЕЛЕВАНТНОСТЬ' in line:
-                    import re
-                    match = re .search(r'(\d+)%', line)
-                    if match:
-                        relevance_percentage = int(match .group(1))
-                        break
+    def _relevance_fallback(self, error: Exception) -> Dict[str, Any]:
+        self .logger .error(
+            f"Error evaluating context relevance: {str(error)}")
+        return {
+            "relevance_score": 0.5,
+            "detailed_analysis": "Ошибка оценки релевантности",
+            "is_relevant": True
+        }
 
-            return {
-                "relevance_score": relevance_percentage / 100.0,
-                "detailed_analysis": result_text,
-                "is_relevant": relevance_percentage > 30
-            }
+    def evaluate_context_relevance(self, query: str, context: str) -> Dict[str, Any]:
+        """Новый метод 2024: оценка релевантности контекста для RAGAS-подобной оценки"""
+        return run_flow(self ._relevance_flow(query, context), self .io)
 
+    def _relevance_flow(self, query: str, context: str) -> Flow:
+        try:
+            response = yield from self ._generate_flow("relevance", self ._relevance_request(query, context))
+            return self ._parse_relevance(response .strip())
         except Exception as e:
-            self .logger .error(
-                f"Error evaluating context relevance: {str(e)}")
-            return {
-                "relevance_score": 0.5,
-                "detailed_analysis": "Ошибка оценки релевантности",
-                "is_relevant": True
-            }
+            return self ._relevance_fallback(e)
 
-    def assess_confidence(self, query: str, context: str, answer: str) -> Dict[str, Any]:
-        """Новый метод 2024: оценка уверенности в ответе для Uncertainty Reflection"""
-        try:
-            confidence_prompt = f"""РОЛЬ: Аналитик достоверности ответов
+    def _confidence_request(self, query: str, context: str, answer: str) -> Dict[str, Any]:
+        confidence_prompt = f"""РОЛЬ: Аналитик достоверности ответов
 
 ЗАДАЧА: Оценить уверенность в ответе на основе качества контекста и полноты информации
 
@@ -464,55 +628,66 @@ class LLMManager:
 
 ИТОГОВАЯ УВЕРЕННОСТЬ: [процент]%
 ОБОСНОВАНИЕ: [краткое объяснение уровня уверенности]"""
+        return {
+            "model": self .model_name,
+            "prompt": confidence_prompt,
+            "options": {
+                "temperature": 0.1,
+                "top_p": 0.9,
+                "num_predict": 400
+            }
+        }
 
-            response = ollama .generate(
-                model=self .model_name,
-                prompt=confidence_prompt,
-                options={
-                    "temperature": 0.1,
-                    "top_p": 0.9,
-                    "num_predict": 400
-                }
-            )
+    def _parse_confidence(self, result_text: str) -> Dict[str, Any]:
+        confidence_percentage = 50
+        lines = result_text .split('\n')
+        for line in lines:
+            if 'ИТОГОВАЯ УВЕРЕННОСТЬ' in line:
+                import re
+                match = re .search(r'(\d+)%', line)
+                if match:
+                    confidence_percentage = int(match .group(1))
+                    break
+        return self ._confidence_result(confidence_percentage, result_text)
+
+    def _confidence_result(self, confidence_percentage: int, detailed_analysis: str) -> Dict[str, Any]:
+        if confidence_percentage >= 90:
+            level = "очень высокая"
+        elif confidence_percentage >= 70:
+            level = "высокая"
+        elif confidence_percentage >= 50:
+            level = "средняя"
+        elif confidence_percentage >= 30:
+            level = "низкая"
+        else:
+            level = "очень низкая"
 
-            result_text = response['response'].strip()
+        return {
+            "confidence_score": confidence_percentage / 100.0,
+            "confidence_level": level,
+            "detailed_analysis": detailed_analysis,
+            "should_warn_user": confidence_percentage < 50
+        }
 
-            confidence_percentage = 50
-            lines = result_text .split('\n')
-            for line in lines:
-                if 'ИТОГОВАЯ УВЕРЕННОСТЬ' in line:
-                    import re
-                    match = re .search(r'(\d+)%', line)
-                    if match:
-                        confidence_percentage = int(match .group(1))
-                        break
-
-            if confidence_percentage >= 90:
-                level = "очень высокая"
-            elif confidence_percentage >= 70:
-                level = "высокая"
-            elif confidence_percentage >= 50:
-                level = "средняя"
-            elif confidence_percentage >= 30:
-                level = "низкая"
-            else:
-                level = "очень низкая"
+    def _confidence_fallback(self, error: Exception) -> Dict[str, Any]:
+        self .logger .error(f"Error assessing confidence: {str(error)}")
+        return {
+            "confidence_score": 0.5,
+            "confidence_level": "средняя",
+            "detailed_analysis": "Ошибка оценки уверенности",
+            "should_warn_user": False
+        }
 
-            return {
-                "confidence_score": confidence_percentage / 100.0,
-                "confidence_level": level,
-                "detailed_analysis": result_text,
-                "should_warn_user": confidence_percentage < 50
-            }
+    def assess_confidence(self, query: str, context: str, answer: str) -> Dict[str, Any]:
+        """Новый метод 2024: оценка уверенности в ответе для Uncertainty Reflection"""
+        return run_flow(self ._confidence_flow(query, context, answer), self .io)
 
+    def _confidence_flow(self, query: str, context: str, answer: str) -> Flow:
+        try:
+            response = yield from self ._generate_flow("confidence", self ._confidence_request(query, context, answer))
+            return self ._parse_confidence(response .strip())
         except Exception as e:
-            self .logger .error(f"Error assessing confidence: {str(e)}")
-            return {
-                "confidence_score": 0.5,
-                "confidence_level": "средняя",
-                "detailed_analysis": "Ошибка оценки уверенности",
-                "should_warn_user": False
-            }
+            return self ._confidence_fallback(e)
 
     def get_model_info(self) -> Dict[str, Any]:
         try:
@@ -1,7 +1,9 @@
-from typing import Dict, Any, List, Optional
-import streamlit as st
+from typing import Dict, Any, Iterator, List, Optional
+import os
 import time
 import re
+from concurrent .futures import ThreadPoolExecutor
+from functools import partial
 import markdown
 from bs4 import BeautifulSoup
 from .document_processor import DocumentProcessor
@@ -9,30 +11,51 @@ from .vector_store import VectorStore
 from .llm_manager import LLMManager
 from .router import SmartRouter
 from .config import ConfigManager
+from .notify import notifier
+from .progress import ProcessingStage
+from .staged_ingestion import StagedIngestionPipeline
+from .estimators import EmbeddingEstimator
+from .context_packer import packing_metadata
+from .snapshot import SnapshotManager, WARM_SNAPSHOT_DIR
+from .directory_watcher import SUPPORTED_EXTENSIONS
 from .document_processor import SimpleProgressTracker
+from .flow import Flow, SyncIO, call_flow, iter_flow, relay, run_flow
+
+
+JUDGMENT_MODES = ("concurrent", "deferred", "off", "fast", "embedding")
 
 
 class RAGPipeline:
-    def __init__(self, progress_tracker: Optional[SimpleProgressTracker] = None):
+    def __init__(self, progress_tracker: Optional[SimpleProgressTracker] = None, chunk_size: Optional[int] = None,
+                 chunk_overlap: Optional[int] = None, dedup_mode: Optional[str] = None):
         self .config_manager = ConfigManager()
         config = self .config_manager .get_current_config()
         self .progress_tracker = progress_tracker
 
-        import streamlit as st
-        chunk_size = getattr(st .session_state, 'chunk_size', 512)
-        chunk_overlap_percent = getattr(st .session_state, 'chunk_overlap', 25)
-        chunk_overlap = int(chunk_size * chunk_overlap_percent / 100)
+        if chunk_size is None or chunk_overlap is None:
+            import streamlit as st
+            chunk_size = getattr(st .session_state, 'chunk_size', 512)
+            chunk_overlap_percent = getattr(st .session_state, 'chunk_overlap', 25)
+            chunk_overlap = int(chunk_size * chunk_overlap_percent / 100)
+        if dedup_mode is None:
+            import streamlit as st
+            dedup_mode = getattr(st .session_state, 'dedup_mode', "link")
 
+        self .vector_store = VectorStore(
+            embedding_model=config .embedding_model,
+            progress_tracker=progress_tracker,
+            dedup_mode=dedup_mode
+        )
         self .document_processor = DocumentProcessor(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            progress_tracker=progress_tracker
-        )
-        self .vector_store = VectorStore(
-            embedding_model=config .embedding_model,
-            progress_tracker=progress_tracker
+            progress_tracker=progress_tracker,
+            document_store=self .vector_store .document_store
         )
         self .llm_manager = LLMManager(model_name=config .llm_model)
+        self .judgment_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="judgment")
+        self .io = SyncIO(self .vector_store, self .judgment_executor)
+        self .embedding_estimator = EmbeddingEstimator(self .vector_store, self .llm_manager)
 
         self .router = SmartRouter(self .llm_manager, self .vector_store)
         self .stats = {
@@ -43,33 +66,43 @@ class RAGPipeline:
             "total_documents": 0
         }
 
+    def warm_start(self):
+        """Заполняет пустую коллекцию из снимка в WARM_SNAPSHOT_DIR без вызовов модели эмбеддингов; вызывается при старте приложения"""
+        try:
+            report = SnapshotManager(self .vector_store).warm_start(WARM_SNAPSHOT_DIR)
+            if report:
+                notifier .info(
+                    f"Загружен снимок базы знаний: {report['chunks']} фрагментов за {report['elapsed_seconds']:.1f}с")
+        except Exception as e:
+            notifier .warning(f"Не удалось загрузить снимок базы знаний: {str(e)}")
+
     def update_models(self, llm_model: str = None, embedding_model: str = None) -> bool:
         success = True
         if llm_model:
             if self .config_manager .update_llm_model(llm_model):
                 if self .llm_manager .update_model(llm_model):
-                    st .success(f"LLM модель обновлена: {llm_model}")
+                    notifier .success(f"LLM модель обновлена: {llm_model}")
                 else:
-                    st .error(f"Не удалось обновить LLM модель: {llm_model}")
+                    notifier .error(f"Не удалось обновить LLM модель: {llm_model}")
                     success = False
             else:
-                st .error(f"Модель {llm_model} недоступна")
+                notifier .error(f"Модель {llm_model} недоступна")
                 success = False
 
         if embedding_model:
             if self .config_manager .update_embedding_model(embedding_model):
                 if self .vector_store .update_embedding_model(embedding_model):
-                    st .success(
+                    notifier .success(
                         f"Embedding модель обновлена: {embedding_model}")
-                    st .info("Создана новая коллекция для этой модели")
-                    st .warning(
+                    notifier .info("Создана новая коллекция для этой модели")
+                    notifier .warning(
                         "Необходимо переиндексировать документы для новой модели")
                 else:
-                    st .error(
+                    notifier .error(
                         f"Не удалось обновить embedding модель: {embedding_model}")
                     success = False
             else:
-                st .error(f"Embedding модель {embedding_model} недоступна")
+                notifier .error(f"Embedding модель {embedding_model} недоступна")
                 success = False
 
         return success
@@ -77,32 +110,32 @@ class RAGPipeline:
     def initialize_system(self, silent: bool = False) -> bool:
         try:
             if not silent:
-                st .info("Проверка системных компонентов...")
+                notifier .info("Проверка системных компонентов...")
 
             try:
                 import requests
                 response = requests .get(
                     "http://localhost:11434/api/version", timeout=5)
                 if response .status_code != 200:
-                    st .error(
+                    notifier .error(
                         "Ollama сервис недоступен. Запустите: ollama serve")
                     return False
                 else:
                     if not silent:
-                        st .success("Ollama сервис запущен")
+                        notifier .success("Ollama сервис запущен")
             except requests .exceptions .ConnectionError:
-                st .error("Ollama сервис не запущен. Запустите: ollama serve")
+                notifier .error("Ollama сервис не запущен. Запустите: ollama serve")
                 return False
             except Exception as e:
-                st .warning(f"Не удалось проверить статус Ollama: {e}")
+                notifier .warning(f"Не удалось проверить статус Ollama: {e}")
 
             if not self .llm_manager .model_name:
-                st .error("Не найдено доступных LLM моделей")
-                st .info("Установите LLM модель: ollama pull <model_name>")
+                notifier .error("Не найдено доступных LLM моделей")
+                notifier .info("Установите LLM модель: ollama pull <model_name>")
                 return False
 
             if not silent:
-                st .info(
+                notifier .info(
                     f"Тестирование модели LLM ({self .llm_manager .model_name})...")
             try:
                 import ollama
@@ -113,24 +146,24 @@ class RAGPipeline:
                 )
                 if test_response and 'response' in test_response:
                     if not silent:
-                        st .success(
+                        notifier .success(
                             f"Модель LLM ({self .llm_manager .model_name}) работает")
                 else:
-                    st .error("Модель LLM не отвечает корректно")
+                    notifier .error("Модель LLM не отвечает корректно")
                     return False
             except Exception as e:
-                st .error(f"Ошибка тестирования LLM модели: {e}")
-                st .info(
+                notifier .error(f"Ошибка тестирования LLM модели: {e}")
+                notifier .info(
                     f"Убедитесь, что модель установлена: ollama pull {self .llm_manager .model_name}")
                 return False
 
             if not self .vector_store .embedding_model:
-                st .error("Не найдено доступных Embedding моделей")
-                st .info("Установите Embedding модель: ollama pull <model_name>")
+                notifier .error("Не найдено доступных Embedding моделей")
+                notifier .info("Установите Embedding модель: ollama pull <model_name>")
                 return False
 
             if not silent:
-                st .info(
+                notifier .info(
                     f"Тестирование модели эмбеддингов ({self .vector_store .embedding_model})...")
             try:
                 import ollama
@@ -140,154 +173,181 @@ class RAGPipeline:
                 )
                 if 'embedding' in test_response and test_response['embedding']:
                     if not silent:
-                        st .success(
+                        notifier .success(
                             f"Модель эмбеддингов ({self .vector_store .embedding_model}) работает")
                 else:
-                    st .error("Модель эмбеддингов не возвращает векторы")
+                    notifier .error("Модель эмбеддингов не возвращает векторы")
                     return False
             except Exception as e:
-                st .error(f"Ошибка тестирования модели эмбеддингов: {e}")
-                st .info(
+                notifier .error(f"Ошибка тестирования модели эмбеддингов: {e}")
+                notifier .info(
                     f"Убедитесь, что модель установлена: ollama pull {self .vector_store .embedding_model}")
                 return False
 
             collection_info = self .vector_store .get_collection_info()
             if collection_info .get("document_count", 0) == 0:
-                st .warning(
+                notifier .warning(
                     "Векторная база пуста. Загрузите документы для начала работы.")
             else:
                 if not silent:
-                    st .info(
+                    notifier .info(
                         f"Загружено {collection_info .get('document_count', 0)} фрагментов")
 
             if not silent:
-                st .success("Все компоненты системы готовы к работе!")
+                notifier .success("Все компоненты системы готовы к работе!")
             return True
 
         except Exception as e:
-            st .error(f"Ошибка инициализации системы: {str(e)}")
+            notifier .error(f"Ошибка инициализации системы: {str(e)}")
             return False
 
-    def load_documents_from_directory(self, directory_path: str) -> bool:
+    def list_supported_files(self, directory_path: str) -> List[str]:
+        return sorted(
+            os .path .join(directory_path, name)for name in os .listdir(directory_path)
+            if name .lower().endswith(SUPPORTED_EXTENSIONS)and os .path .isfile(os .path .join(directory_path, name))
+        )
+
+    def ingest_files_staged(self, file_paths: List[str], extract_workers: int = 2, embed_workers: int = 2,
+                            batch_size: int = 32) -> Dict[str, Any]:
+        """Индексирует файлы конвейером, в котором извлечение, эмбеддинги и запись идут одновременно"""
+        staged = StagedIngestionPipeline(
+            self .document_processor,
+            self .vector_store,
+            extract_workers=extract_workers,
+            embed_workers=embed_workers,
+            batch_size=batch_size
+        )
+        report = staged .run(file_paths, progress_tracker=self .progress_tracker)
+        self .stats["total_documents"] += report["chunks"]
+        self .stats["last_ingestion"] = report
+        return report
+
+    def _load_directory(self, directory_path: str, start_message: str, success_message: str,
+                        error_prefix: str) -> bool:
         try:
             if self .progress_tracker:
-                from .document_processor import ProcessingStage
                 self .progress_tracker .update_stage(
                     ProcessingStage .INITIALIZING,
-                    "Загрузка документов"
+                    start_message
                 )
             else:
-                st .info("Загрузка документов...")
+                notifier .info(f"{start_message}...")
 
-            documents = self .document_processor .process_directory(
-                directory_path)
+            if not os .path .isdir(directory_path):
+                error_msg = f"Папка не найдена: {directory_path}"
+                if self .progress_tracker:
+                    self .progress_tracker .set_error(error_msg)
+                else:
+                    notifier .error(error_msg)
+                return False
 
-            if not documents:
+            file_paths = self .list_supported_files(directory_path)
+            if not file_paths:
                 error_msg = "Не удалось обработать документы"
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return False
 
-            success = self .vector_store .add_documents(documents)
+            report = self .ingest_files_staged(file_paths)
 
-            if success:
-                self .stats["total_documents"] = len(documents)
+            if report["indexed"]:
                 if self .progress_tracker:
-                    self .progress_tracker .finish_session(True)
+                    self .progress_tracker .finish_session(not report["failed"])
                 else:
-                    st .success(
-                        f"Успешно загружено {len(documents)} фрагментов документов")
+                    notifier .success(success_message .format(chunks=report["chunks"]))
+                    for path, error in report["failed"].items():
+                        notifier .warning(f"{os .path .basename(path)}: {error}")
                 return True
             else:
                 error_msg = "Не удалось добавить документы в векторную базу"
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return False
 
         except Exception as e:
-            error_msg = f"Ошибка загрузки документов: {str(e)}"
+            error_msg = f"{error_prefix}: {str(e)}"
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return False
 
+    def load_documents_from_directory(self, directory_path: str) -> bool:
+        return self ._load_directory(
+            directory_path,
+            "Загрузка документов",
+            "Успешно загружено {chunks} фрагментов документов",
+            "Ошибка загрузки документов"
+        )
+
     def reindex_existing_documents(self, directory_path: str) -> bool:
+        success = self ._load_directory(
+            directory_path,
+            f"Переиндексация документов из {directory_path}",
+            "Успешно переиндексировано {chunks} фрагментов документов",
+            "Ошибка переиндексации документов"
+        )
+        if success and not self .progress_tracker:
+            status = self .get_system_status()
+            notifier .info(
+                f"Статистика: {status['vector_store']['total_documents']} фрагментов из {status['vector_store']['unique_files']} файлов")
+        return success
+
+    def load_uploaded_file(self, uploaded_file) -> bool:
         try:
             if self .progress_tracker:
-                from .document_processor import ProcessingStage
-                self .progress_tracker .update_stage(
-                    ProcessingStage .INITIALIZING,
-                    f"Переиндексация документов из {directory_path}"
-                )
+                pass
             else:
-                st .info(f"Переиндексация документов из {directory_path}...")
-
-            documents = self .document_processor .process_directory(
-                directory_path)
+                notifier .info(f"Обработка файла: {uploaded_file .name}")
 
-            if not documents:
-                error_msg = "Не удалось обработать документы"
-                if self .progress_tracker:
-                    self .progress_tracker .set_error(error_msg)
-                else:
-                    st .error(error_msg)
+            saved_upload = self .document_processor .save_uploaded_file(
+                uploaded_file)
+            if not saved_upload:
                 return False
 
-            success = self .vector_store .add_documents(documents)
-
-            if success:
-                self .stats["total_documents"] = len(documents)
-
-                if self .progress_tracker:
-                    self .progress_tracker .finish_session(True)
-                else:
-                    st .success(
-                        f"Успешно переиндексировано {len(documents)} фрагментов документов")
-
-                status = self .get_system_status()
-                status_msg = f"Статистика: {status['vector_store']['total_documents']} фрагментов из {status['vector_store']['unique_files']} файлов"
-                if self .progress_tracker:
-                    pass
-                else:
-                    st .info(status_msg)
-                return True
-            else:
-                error_msg = "Не удалось добавить документы в векторную базу"
-                if self .progress_tracker:
-                    self .progress_tracker .set_error(error_msg)
-                else:
-                    st .error(error_msg)
-                return False
+            return self .ingest_saved_upload(saved_upload)
 
         except Exception as e:
-            error_msg = f"Ошибка переиндексации документов: {str(e)}"
+            error_msg = f"Ошибка обработки файла: {str(e)}"
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return False
 
-    def load_uploaded_file(self, uploaded_file) -> bool:
+    def ingest_saved_upload(self, saved_upload: Dict[str, Any]) -> bool:
+        """Индексирует сохраненную на диск загрузку, пропуская уже проиндексированное содержимое"""
         try:
-            if self .progress_tracker:
-                pass
-            else:
-                st .info(f"Обработка файла: {uploaded_file .name}")
+            if self .progress_tracker and not self .progress_tracker .state .current_file:
+                self .progress_tracker .start_file(saved_upload["original_name"], 5)
 
-            documents = self .document_processor .process_uploaded_file(
-                uploaded_file)
+            existing_filename = self .vector_store .find_filename_by_content_hash(
+                saved_upload["content_hash"])
+            if existing_filename:
+                self .document_processor .discard_saved_upload(saved_upload)
+                if self .progress_tracker:
+                    self .progress_tracker .complete_file()
+                    self .progress_tracker .update_progress(
+                        self .progress_tracker .state .total_steps,
+                        message=f"Уже проиндексирован как {existing_filename}")
+                else:
+                    notifier .info(
+                        f"Файл {saved_upload['original_name']} уже проиндексирован как {existing_filename}")
+                return True
+
+            documents = self .document_processor .process_saved_upload(
+                saved_upload)
 
             if not documents:
                 error_msg = "Не удалось обработать файл"
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return False
 
             success = self .vector_store .add_documents(documents)
@@ -295,7 +355,7 @@ class RAGPipeline:
             if success:
                 self .stats["total_documents"] += len(documents)
                 if not self .progress_tracker:
-                    st .success(
+                    notifier .success(
                         f"Файл обработан: {len(documents)} фрагментов добавлено")
                 return True
             else:
@@ -303,7 +363,7 @@ class RAGPipeline:
                 if self .progress_tracker:
                     self .progress_tracker .set_error(error_msg)
                 else:
-                    st .error(error_msg)
+                    notifier .error(error_msg)
                 return False
 
         except Exception as e:
@@ -311,102 +371,290 @@ class RAGPipeline:
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
+            return False
+
+    def ingest_file(self, file_path: str) -> bool:
+        """Переиндексирует один файл: удаляет его старые фрагменты и добавляет новые; у файла без текста они только удаляются"""
+        return run_flow(self ._ingest_flow(file_path), self .io)
+
+    def _ingest_flow(self, file_path: str) -> Flow:
+        processor = self .document_processor
+        extracted_data = yield ("call", partial(processor .extract_text_from_file, file_path))
+        if not extracted_data:
             return False
+        extracted_data["metadata"]["content_hash"] = yield ("call", partial(processor .compute_file_hash, file_path))
+        documents = yield ("call", partial(
+            processor .chunk_document, extracted_data["text"], extracted_data["metadata"]))
+        if not documents:
+            return (yield ("call", partial(self .vector_store .delete_documents_by_file_path, file_path)))
+
+        yield ("call", partial(self .vector_store .delete_documents_by_file_path, file_path, keep_text=True))
+        success = yield from self .vector_store ._add_documents_flow(documents)
+        if success:
+            self .stats["total_documents"] += len(documents)
+        return success
+
+    def handle_file_event(self, file_path: str, action: str) -> bool:
+        """Обработчик событий очереди индексации: upsert или remove для файла"""
+        if action == "remove":
+            return self .vector_store .delete_documents_by_file_path(file_path)
+        return self .ingest_file(file_path)
 
     def process_query(self, query: str, show_debug: bool = False, selected_documents: Any = "all",
                       search_k: int = 10, search_method: str = "mmr", distance_threshold: float = 0.25,
                       confidence_threshold: float = 0.5, temperature: float = 0.2, max_tokens: int = 2000,
-                      system_prompt_style: str = "Профессиональный") -> Dict[str, Any]:
+                      system_prompt_style: str = "Профессиональный", stream: bool = False,
+                      judgments: str = "concurrent") -> Dict[str, Any]:
+        """При stream=True ответ отдается генератором answer_stream; остальные поля дополняются после его исчерпания"""
+        events = self .process_query_events(
+            query, selected_documents=selected_documents, search_k=search_k, search_method=search_method,
+            distance_threshold=distance_threshold, confidence_threshold=confidence_threshold,
+            temperature=temperature, max_tokens=max_tokens, system_prompt_style=system_prompt_style,
+            judgments=judgments)
+        response = None
+        for event in events:
+            if event["type"] == "error":
+                return event["response"]
+            if event["type"] == "done":
+                response = event["response"]
+            if stream and event["type"] == "generation":
+                event["response"]["answer_stream"] = (
+                    item["text"]for item in events if item["type"] == "token")
+                return event["response"]
+        return response or {
+            "answer": "Извините, произошла ошибка при обработке вашего запроса.",
+            "response_type": "error",
+            "error": "query processing stopped without a result"
+        }
+
+    def process_query_events(self, query: str, selected_documents: Any = "all", search_k: int = 10,
+                             search_method: str = "mmr", distance_threshold: float = 0.25,
+                             confidence_threshold: float = 0.5, temperature: float = 0.2, max_tokens: int = 2000,
+                             system_prompt_style: str = "Профессиональный",
+                             judgments: str = "concurrent") -> Iterator[Dict[str, Any]]:
+        """Генератор событий по этапам: sources, routing, context_relevance, generation, token, confidence, done/error.
+
+        judgments: concurrent - оценка релевантности идет параллельно с генерацией, уверенность до done;
+        deferred - оценки отдаются после done; off - вспомогательные оценки LLM не выполняются;
+        fast - один вызов с JSON-ответом возвращает ответ, цитаты, релевантность и уверенность;
+        embedding - оценки по сходству векторов, без вызовов LLM.
+        """
+        yield from iter_flow(self ._query_flow(
+            query, selected_documents, search_k, search_method, distance_threshold, confidence_threshold,
+            temperature, max_tokens, system_prompt_style, judgments), self .io)
+
+    def _query_flow(self, query: str, selected_documents: Any, search_k: int, search_method: str,
+                    distance_threshold: float, confidence_threshold: float, temperature: float, max_tokens: int,
+                    system_prompt_style: str, judgments: str) -> Flow:
+        """Общий для синхронного и асинхронного конвейера поток событий запроса; ввод-вывод выполняет драйвер"""
+        if judgments not in JUDGMENT_MODES:
+            raise ValueError(f"Unknown judgments mode: {judgments}")
         start_time = time .time()
+        event = partial(self ._query_event, start_time)
 
+        pending = {}
         try:
-
             self .router .update_confidence_threshold(confidence_threshold)
 
-            search_results = self .vector_store .search_similar(
+            pending["analysis"] = yield ("spawn", call_flow(partial(self .router .analyze_query, query)))
+            search_results = yield from self .vector_store ._search_flow(
                 query,
                 k=search_k,
                 search_method=search_method,
                 selected_documents=selected_documents,
                 distance_threshold=distance_threshold
             )
-
-            routing_result = self .router .route_query(query, search_results)
-
-            if routing_result["can_answer"]:
-                enhanced_context = self .router .enhance_context(
-                    routing_result["context"],
-                    query
-                )
-
-                context_relevance = self .llm_manager .evaluate_context_relevance(
-                    query, enhanced_context
-                )
-
-                answer = self .llm_manager .generate_response(
-                    prompt=query,
-                    context=enhanced_context,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    system_prompt_style=system_prompt_style
-                )
-
-                confidence_assessment = self .llm_manager .assess_confidence(
-                    query, enhanced_context, answer
-                )
-
-                response_type = "success"
-                self .stats["successful_answers"] += 1
-
+            query_analysis = yield ("wait", pending .pop("analysis"))
+            complete_response = self ._begin_response(search_results)
+            yield ("emit", event("sources", sources=complete_response["sources"], search_results=search_results))
+
+            routing_result = yield ("call", partial(self .router .route_query, query, search_results, query_analysis))
+            self ._record_routing(complete_response, routing_result)
+            yield ("emit", event("routing", routing_result=routing_result))
+
+            packing = None
+            if self ._needs_context(routing_result):
+                packing = yield ("call", partial(
+                    self .router .pack_context, query, search_results, max_tokens, system_prompt_style))
+            generation = self ._prepare_generation(
+                complete_response, query, packing, temperature, max_tokens, system_prompt_style)
+
+            relevance_judge = self ._relevance_judge(complete_response, judgments)
+            if relevance_judge == "embedding":
+                complete_response["context_relevance"] = self .embedding_estimator .context_relevance(
+                    search_results)
+                yield ("emit", event("context_relevance", context_relevance=complete_response["context_relevance"]))
+            elif relevance_judge == "llm":
+                pending["relevance"] = yield ("spawn", self .llm_manager ._relevance_flow(query, generation["context"]))
+            yield ("emit", event("generation", response_type=complete_response["response_type"],
+                                 response=complete_response))
+
+            if judgments == "fast"and generation is not None:
+                structured = yield from self .llm_manager ._structured_flow(
+                    query, packing["chunks"], temperature, generation["max_tokens"], system_prompt_style)
+                for item in self ._structured_events(complete_response, structured, packing, start_time):
+                    yield ("emit", item)
+                return
+
+            parts = []
+
+            def on_piece(piece: str) -> Flow:
+                if not parts:
+                    complete_response["time_to_first_token"] = time .time()-start_time
+                parts .append(piece)
+                yield ("emit", event("token", text=piece))
+                relevance = pending .get("relevance")
+                if relevance is not None and relevance .done()and judgments == "concurrent":
+                    complete_response["context_relevance"] = pending .pop("relevance").result()
+                    yield ("emit", event("context_relevance", context_relevance=complete_response["context_relevance"]))
+
+            if generation is None:
+                pieces = self ._fallback_flow(query, routing_result)
             else:
-                if routing_result .get("context", "").strip():
-                    answer = self .llm_manager .generate_response(
-                        prompt=query,
-                        context=routing_result["context"],
-                        temperature=temperature,
-                        max_tokens=max_tokens,
-                        system_prompt_style=system_prompt_style
-                    )
-                    response_type = "partial"
-                else:
-                    answer = self ._generate_fallback_response(
-                        query, routing_result)
-                    response_type = "fallback"
-                self .stats["failed_answers"] += 1
-
-            response_time = time .time()-start_time
-            self .stats["total_queries"] += 1
-            self .stats["average_response_time"] = (
-                (self .stats["average_response_time"] *
-                 (self .stats["total_queries"]-1)+response_time)
-                / self .stats["total_queries"]
-            )
-
-            complete_response = {
-                "answer": answer,
-                "response_type": response_type,
-                "response_time": response_time,
-                "routing_result": routing_result,
-                "search_results": search_results,
-                "query_analysis": routing_result .get("query_analysis", {}),
-                "sources": self ._extract_sources(search_results)
-            }
+                pieces = self .llm_manager ._stream_flow(**generation)
+            yield from relay(pieces, on_piece)
+            answer = self ._finish_answer(complete_response, generation, parts, start_time)
+
+            if judgments == "deferred":
+                yield ("emit", event("done", response=complete_response))
+            if "relevance"in pending:
+                complete_response["context_relevance"] = yield ("wait", pending .pop("relevance"))
+                yield ("emit", event("context_relevance", context_relevance=complete_response["context_relevance"]))
+            confidence_judge = self ._confidence_judge(complete_response, judgments)
+            if confidence_judge == "embedding":
+                estimator = self .embedding_estimator
+                complete_response["confidence_assessment"] = yield from estimator ._answer_confidence_flow(
+                    answer, search_results)
+                yield ("emit", event("confidence", confidence_assessment=complete_response["confidence_assessment"]))
+            elif confidence_judge == "llm":
+                complete_response["confidence_assessment"] = yield from self .llm_manager ._confidence_flow(
+                    query, generation["context"], answer)
+                yield ("emit", event("confidence", confidence_assessment=complete_response["confidence_assessment"]))
+            if judgments != "deferred":
+                yield ("emit", event("done", response=complete_response))
 
-            if 'context_relevance' in locals():
-                complete_response["context_relevance"] = context_relevance
-            if 'confidence_assessment' in locals():
-                complete_response["confidence_assessment"] = confidence_assessment
+        except Exception as e:
+            yield ("emit", self ._error_event(start_time, e))
+        finally:
+            for handle in pending .values():
+                handle .cancel()
+
+    def _fallback_flow(self, query: str, routing_result: Dict[str, Any]) -> Flow:
+        yield ("emit", self ._generate_fallback_response(query, routing_result))
+
+    @staticmethod
+    def _query_event(start_time: float, event_type: str, **payload) -> Dict[str, Any]:
+        return {"type": event_type, "elapsed": time .time()-start_time, **payload}
+
+    def _error_event(self, start_time: float, error: Exception) -> Dict[str, Any]:
+        notifier .error(f"Ошибка обработки запроса: {str(error)}")
+        return self ._query_event(start_time, "error", error=str(error), response={
+            "answer": "Извините, произошла ошибка при обработке вашего запроса.",
+            "response_type": "error",
+            "error": str(error)
+        })
+
+    def _begin_response(self, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "search_results": search_results,
+            "sources": self ._extract_sources(search_results)
+        }
 
-            return complete_response
+    @staticmethod
+    def _record_routing(complete_response: Dict[str, Any], routing_result: Dict[str, Any]):
+        complete_response["routing_result"] = routing_result
+        complete_response["query_analysis"] = routing_result .get("query_analysis", {})
+
+    @staticmethod
+    def _needs_context(routing_result: Dict[str, Any]) -> bool:
+        return bool(routing_result["can_answer"]or routing_result .get("context", "").strip())
+
+    @staticmethod
+    def _prepare_generation(complete_response: Dict[str, Any], query: str, packing: Optional[Dict[str, Any]],
+                            temperature: float, max_tokens: int,
+                            system_prompt_style: str) -> Optional[Dict[str, Any]]:
+        """Тип ответа и параметры генерации по упакованному контексту; None - ответ-заглушка"""
+        if packing is not None:
+            complete_response["context_packing"] = packing_metadata(packing)
+        if packing is None or not packing["chunks"]:
+            complete_response["response_type"] = "fallback"
+            return None
+        complete_response["response_type"] = "success"if complete_response["routing_result"]["can_answer"]else "partial"
+        return {
+            "prompt": query,
+            "context": packing["context"],
+            "temperature": temperature,
+            "max_tokens": packing .get("max_tokens", max_tokens),
+            "system_prompt_style": system_prompt_style
+        }
 
-        except Exception as e:
-            st .error(f"Ошибка обработки запроса: {str(e)}")
-            return {
-                "answer": "Извините, произошла ошибка при обработке вашего запроса.",
-                "response_type": "error",
-                "error": str(e)
+    @staticmethod
+    def _relevance_judge(complete_response: Dict[str, Any], judgments: str) -> Optional[str]:
+        """Чем оценивать релевантность контекста: embedding, llm или None"""
+        if complete_response["response_type"] != "success"or judgments in ("off", "fast"):
+            return None
+        return "embedding"if judgments == "embedding"else "llm"
+
+    @staticmethod
+    def _confidence_judge(complete_response: Dict[str, Any], judgments: str) -> Optional[str]:
+        """Чем оценивать уверенность в ответе: embedding, llm или None"""
+        if complete_response["response_type"] != "success"or judgments == "off":
+            return None
+        return "embedding"if judgments == "embedding"else "llm"
+
+    def _structured_events(self, complete_response: Dict[str, Any], structured: Dict[str, Any],
+                           packing: Dict[str, Any], start_time: float) -> List[Dict[str, Any]]:
+        complete_response["time_to_first_token"] = time .time()-start_time
+        token = self ._query_event(start_time, "token", text=structured["answer"])
+        self ._complete_response(complete_response, structured["answer"], start_time)
+        self ._apply_structured(complete_response, structured, packing["indices"])
+        return [
+            token,
+            self ._query_event(start_time, "context_relevance",
+                               context_relevance=complete_response["context_relevance"]),
+            self ._query_event(start_time, "confidence",
+                               confidence_assessment=complete_response["confidence_assessment"]),
+            self ._query_event(start_time, "done", response=complete_response)
+        ]
+
+    def _finish_answer(self, complete_response: Dict[str, Any], generation: Optional[Dict[str, Any]],
+                       parts: List[str], start_time: float) -> str:
+        answer = "".join(parts)
+        if generation is not None:
+            answer = self .llm_manager ._clean_response(answer)
+        self ._complete_response(complete_response, answer, start_time)
+        return answer
+
+    def _apply_structured(self, complete_response: Dict[str, Any], structured: Dict[str, Any],
+                          indices: List[int]):
+        search_results = complete_response["search_results"]
+        complete_response["context_relevance"] = structured["context_relevance"]
+        complete_response["confidence_assessment"] = structured["confidence_assessment"]
+        complete_response["cited_sources"] = [
+            {
+                "index": index,
+                "filename": search_results[index]["metadata"].get("filename", "Unknown"),
+                "chunk_id": search_results[index]["metadata"].get("chunk_id")
             }
+            for index in (indices[number]for number in structured["cited_chunks"]if number < len(indices))
+        ]
+
+    def _complete_response(self, complete_response: Dict[str, Any], answer: str, start_time: float):
+        complete_response["answer"] = answer
+        if complete_response["response_type"] == "success":
+            self .stats["successful_answers"] += 1
+        else:
+            self .stats["failed_answers"] += 1
+
+        response_time = time .time()-start_time
+        self .stats["total_queries"] += 1
+        self .stats["average_response_time"] = (
+            (self .stats["average_response_time"] *
+             (self .stats["total_queries"]-1)+response_time)
+            / self .stats["total_queries"]
+        )
+        complete_response["response_time"] = response_time
 
     def _generate_fallback_response(self, query: str, routing_result: Dict[str, Any]) -> str:
         language = routing_result .get(
@@ -462,10 +710,12 @@ I'll try to provide a partial answer based on the available information..."""
             "vector_store": {
                 "total_documents": collection_info .get("document_count", 0),
                 "unique_files": document_summary .get("unique_files", 0),
-                "filenames": document_summary .get("filenames", [])
+                "filenames": document_summary .get("filenames", []),
+                "dedup": collection_info .get("dedup", {})
             },
             "llm": llm_info,
             "router": router_metrics,
+            "llm_cache": self .llm_manager .cache .get_stats(),
             "pipeline_stats": self .stats .copy()
         }
 
@@ -473,6 +723,7 @@ I'll try to provide a partial answer based on the available information..."""
         try:
             success = self .vector_store .clear_collection()
             if success:
+                SnapshotManager(self .vector_store).mark_warm_start("cleared")
                 self .stats = {
                     "total_queries": 0,
                     "successful_answers": 0,
@@ -482,7 +733,7 @@ I'll try to provide a partial answer based on the available information..."""
                 }
             return success
         except Exception as e:
-            st .error(f"Ошибка очистки данных: {str(e)}")
+            notifier .error(f"Ошибка очистки данных: {str(e)}")
             return False
 
     def markdown_to_text(self, markdown_text: str) -> str:
@@ -0,0 +1,79 @@
+import logging
+from typing import Optional
+import streamlit as st
+
+try:
+    from streamlit .runtime .scriptrunner import get_script_run_ctx
+except ImportError:
+    get_script_run_ctx = None
+
+
+class _LogElement:
+    """Заглушка элементов st.progress/st.empty для запуска без интерфейса"""
+
+    def __init__(self, logger: logging .Logger):
+        self .logger = logger
+
+    def progress(self, value, text: Optional[str] = None):
+        if text:
+            self .logger .debug(text)
+
+    def text(self, body: str):
+        self .logger .debug(body)
+
+    def empty(self):
+        pass
+
+
+class Notifier:
+    """Пользовательские сообщения: в Streamlit при наличии контекста скрипта, иначе в logging"""
+
+    def __init__(self, logger: Optional[logging .Logger] = None):
+        self .logger = logger or logging .getLogger("rag")
+        self .headless: Optional[bool] = None
+
+    def set_headless(self, headless: Optional[bool] = True):
+        """True — всегда писать в лог, False — всегда в Streamlit, None — определять автоматически"""
+        self .headless = headless
+
+    def use_streamlit(self) -> bool:
+        if self .headless is not None:
+            return not self .headless
+        return get_script_run_ctx is not None and get_script_run_ctx()is not None
+
+    def error(self, message: str):
+        if self .use_streamlit():
+            st .error(message)
+        else:
+            self .logger .error(message)
+
+    def warning(self, message: str):
+        if self .use_streamlit():
+            st .warning(message)
+        else:
+            self .logger .warning(message)
+
+    def info(self, message: str):
+        if self .use_streamlit():
+            st .info(message)
+        else:
+            self .logger .info(message)
+
+    def success(self, message: str):
+        if self .use_streamlit():
+            st .success(message)
+        else:
+            self .logger .info(message)
+
+    def progress(self, value, text: Optional[str] = None):
+        if self .use_streamlit():
+            return st .progress(value, text=text)
+        return _LogElement(self .logger)
+
+    def empty(self):
+        if self .use_streamlit():
+            return st .empty()
+        return _LogElement(self .logger)
+
+
+notifier = Notifier()
@@ -0,0 +1,469 @@
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, List, Optional
+import streamlit as st
+
+
+class ProcessingStage (Enum):
+    INITIALIZING = "initializing"
+    READING_PDF = "reading_pdf"
+    READING_DOCX = "reading_docx"
+    READING_TXT = "reading_txt"
+    PROCESSING_TEXT = "processing_text"
+    CREATING_CHUNKS = "creating_chunks"
+    GENERATING_EMBEDDINGS = "generating_embeddings"
+    STORING_DOCUMENTS = "storing_documents"
+    COMPLETED = "completed"
+    ERROR = "error"
+
+
+@dataclass
+class ProgressState:
+    stage: ProcessingStage = ProcessingStage .INITIALIZING
+    current_file: str = ""
+    current_step: int = 0
+    total_steps: int = 0
+    current_file_index: int = 0
+    total_files: int = 0
+    message: str = ""
+    error_message: str = ""
+    start_time: float = 0
+    stage_start_time: float = 0
+
+    @property
+    def progress_percent(self) -> float:
+        if self .total_steps == 0:
+            return 0.0
+        return min(100.0, (self .current_step / self .total_steps)*100.0)
+
+    @property
+    def file_progress_percent(self) -> float:
+        if self .total_files == 0:
+            return 0.0
+        return min(100.0, (self .current_file_index / self .total_files)*100.0)
+
+    @property
+    def elapsed_time(self) -> float:
+        return time .time()-self .start_time if self .start_time > 0 else 0
+
+    @property
+    def stage_elapsed_time(self) -> float:
+        return time .time()-self .stage_start_time if self .stage_start_time > 0 else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self .stage .value,
+            "current_file": self .current_file,
+            "progress_percent": self .progress_percent,
+            "file_progress_percent": self .file_progress_percent,
+            "current_step": self .current_step,
+            "total_steps": self .total_steps,
+            "current_file_index": self .current_file_index,
+            "total_files": self .total_files,
+            "message": self .message,
+            "error_message": self .error_message,
+            "elapsed_time": self .elapsed_time
+        }
+
+
+EVENT_SESSION_START = "session_start"
+EVENT_FILE_START = "file_start"
+EVENT_STAGE = "stage"
+EVENT_PROGRESS = "progress"
+EVENT_ERROR = "error"
+EVENT_FILE_COMPLETE = "file_complete"
+EVENT_SESSION_FINISH = "session_finish"
+
+IMMEDIATE_EVENTS = (EVENT_SESSION_START, EVENT_ERROR, EVENT_SESSION_FINISH)
+
+
+class ProgressSink:
+    """Получатель событий прогресса; вызывается под блокировкой шины"""
+
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        raise NotImplementedError
+
+
+class NullProgressSink (ProgressSink):
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        pass
+
+
+class ThrottledProgressSink (ProgressSink):
+    """Базовый получатель, пропускающий частые события progress чаще заданной частоты"""
+
+    def __init__(self, min_interval: float = 0.25):
+        self .min_interval = min_interval
+        self ._last_emit = 0.0
+
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        now = time .monotonic()
+        if kind not in IMMEDIATE_EVENTS and now - self ._last_emit < self .min_interval:
+            return
+        if self .emit(kind, state, title, success):
+            self ._last_emit = now
+
+    def emit(self, kind: str, state: ProgressState, title: Optional[str], success: bool) -> bool:
+        raise NotImplementedError
+
+
+class LogProgressSink (ThrottledProgressSink):
+    """Пишет прогресс в logging: строкой для человека или JSON-объектом для машинной обработки"""
+
+    def __init__(self, logger: Optional[logging .Logger] = None, min_interval: float = 1.0, as_json: bool = False):
+        super().__init__(min_interval)
+        self .logger = logger or logging .getLogger(__name__)
+        self .as_json = as_json
+
+    def emit(self, kind: str, state: ProgressState, title: Optional[str], success: bool) -> bool:
+        if self .as_json:
+            event = {"event": kind, "time": time .time(), **state .to_dict()}
+            if title:
+                event["title"] = title
+            if kind == EVENT_SESSION_FINISH:
+                event["success"] = success
+            self .logger .info(json .dumps(event, ensure_ascii=False))
+        elif kind == EVENT_ERROR:
+            self .logger .error(f"{state .current_file}: {state .error_message}")
+        elif kind == EVENT_SESSION_FINISH:
+            self .logger .info(
+                f"{'Finished'if success else 'Finished with errors'}: {state .current_file_index}/{state .total_files} files "
+                f"in {state .elapsed_time:.1f}s")
+        else:
+            self .logger .info(
+                f"[{state .current_file_index}/{state .total_files}] {state .current_file}: "
+                f"{title or state .message} ({state .progress_percent:.0f}%)")
+        return True
+
+
+class QueueProgressSink (ProgressSink):
+    """Передает снимки состояния в очередь (в т.ч. multiprocessing.Queue) для другого процесса или потока"""
+
+    def __init__(self, target_queue, min_interval: float = 0.1):
+        self .target_queue = target_queue
+        self .min_interval = min_interval
+        self ._last_emit = 0.0
+
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        now = time .monotonic()
+        if kind not in IMMEDIATE_EVENTS and now - self ._last_emit < self .min_interval:
+            return
+        self ._last_emit = now
+        try:
+            self .target_queue .put_nowait({"event": kind, "title": title, "success": success, **state .to_dict()})
+        except Exception:
+            pass
+
+
+class StageTimingSink (ProgressSink):
+    """Суммирует время, проведенное в каждом этапе обработки, по всем файлам сессии"""
+
+    def __init__(self):
+        self .stage_seconds: Dict[str, float] = {}
+        self .files_completed = 0
+        self .files_failed = 0
+        self ._current_stage: Optional[str] = None
+        self ._stage_started = 0.0
+
+    def _close_stage(self, now: float):
+        if self ._current_stage is not None:
+            self .stage_seconds[self ._current_stage] = self .stage_seconds .get(
+                self ._current_stage, 0.0)+now - self ._stage_started
+        self ._current_stage = None
+
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        now = time .perf_counter()
+        if kind in (EVENT_FILE_COMPLETE, EVENT_ERROR, EVENT_SESSION_FINISH):
+            self ._close_stage(now)
+            if kind == EVENT_FILE_COMPLETE:
+                self .files_completed += 1
+            elif kind == EVENT_ERROR:
+                self .files_failed += 1
+            return
+
+        stage = state .stage .value
+        if stage != self ._current_stage:
+            self ._close_stage(now)
+            self ._current_stage = stage
+            self ._stage_started = now
+
+
+class StreamlitProgressSink (ThrottledProgressSink):
+    """Отрисовка прогресса в плейсхолдерах Streamlit не чаще нескольких раз в секунду и только из потока скрипта"""
+
+    def __init__(self, min_interval: float = 0.25):
+        super().__init__(min_interval)
+        self .progress_placeholder = None
+        self .status_placeholder = None
+        self .detail_placeholder = None
+        self ._owner_thread = None
+
+    def setup_ui(self, container=None):
+        """Настройка UI элементов для отображения прогресса"""
+        if container is None:
+            container = st .container()
+
+        with container:
+            self .progress_placeholder = st .empty()
+            self .status_placeholder = st .empty()
+            self .detail_placeholder = st .empty()
+        self ._owner_thread = threading .get_ident()
+
+    def handle(self, kind: str, state: ProgressState, title: Optional[str] = None, success: bool = True):
+        if kind == EVENT_SESSION_START and self .progress_placeholder is None:
+            self .setup_ui()
+        if threading .get_ident() != self ._owner_thread:
+            return
+        super().handle(kind, state, title, success)
+
+    def emit(self, kind: str, state: ProgressState, title: Optional[str], success: bool) -> bool:
+        if not self .progress_placeholder:
+            return False
+        if kind == EVENT_SESSION_FINISH:
+            if success:
+                self ._show_final_success(state)
+            else:
+                self ._show_final_error()
+            return True
+
+        try:
+            with self .progress_placeholder:
+                if title:
+                    st .subheader(title)
+
+                if state .total_files > 0:
+                    file_progress = state .file_progress_percent / 100
+                    st .progress(
+                        file_progress,
+                        text=f"Файл {state .current_file_index}/{state .total_files}"
+                    )
+
+            with self .status_placeholder:
+                if state .current_file:
+                    step_progress = state .progress_percent / 100
+
+                    st .progress(
+                        step_progress,
+                        text=f"{state .current_file}: {state .message} ({state .progress_percent:.0f}%)"
+                    )
+
+            with self .detail_placeholder:
+                if state .error_message:
+                    st .error(f"Ошибка: {state .error_message}")
+                elif state .stage_elapsed_time > 0:
+                    elapsed = state .stage_elapsed_time
+                    if elapsed < 60:
+                        time_str = f"{elapsed:.1f} сек"
+                    else:
+                        time_str = f"{elapsed / 60:.1f} мин"
+
+                    st .caption(f"Время этапа: {time_str}")
+
+        except Exception as e:
+            pass
+        return True
+
+    def _show_final_success(self, state: ProgressState):
+        """Показать финальное сообщение об успехе"""
+        if self .progress_placeholder:
+            with self .progress_placeholder:
+                st .success(
+                    f"Успешно обработано {state .total_files} файлов")
+
+        if self .status_placeholder:
+            with self .status_placeholder:
+                total_time = state .elapsed_time
+                if total_time < 60:
+                    time_str = f"{total_time:.1f} секунд"
+                else:
+                    time_str = f"{total_time / 60:.1f} минут"
+                st .info(f"Общее время обработки: {time_str}")
+
+        if self .detail_placeholder:
+            with self .detail_placeholder:
+                st .empty()
+
+    def _show_final_error(self):
+        """Показать финальное сообщение об ошибке"""
+        if self .progress_placeholder:
+            with self .progress_placeholder:
+                st .error("Обработка завершена с ошибками")
+
+
+class ProgressBus:
+    """Потокобезопасная шина прогресса: общее состояние и рассылка событий подключенным получателям"""
+
+    def __init__(self, sinks: Optional[List[ProgressSink]] = None):
+        self .state = ProgressState()
+        self .sinks: List[ProgressSink] = list(sinks)if sinks is not None else []
+        self .lock = threading .RLock()
+
+    def add_sink(self, sink: ProgressSink):
+        with self .lock:
+            self .sinks .append(sink)
+
+    def publish(self, kind: str, title: Optional[str] = None, success: bool = True):
+        with self .lock:
+            for sink in self .sinks:
+                sink .handle(kind, self .state, title, success)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self .lock:
+            return self .state .to_dict()
+
+
+class SimpleProgressTracker:
+    """Упрощенный трекер прогресса для v1.5.0: фасад над шиной событий с получателем Streamlit по умолчанию"""
+
+    def __init__(self, sinks: Optional[List[ProgressSink]] = None):
+        self .streamlit_sink = None
+        if sinks is None:
+            self .streamlit_sink = StreamlitProgressSink()
+            sinks = [self .streamlit_sink]
+        self .bus = ProgressBus(sinks)
+        self ._is_active = False
+
+    @property
+    def state(self) -> ProgressState:
+        return self .bus .state
+
+    @state .setter
+    def state(self, value: ProgressState):
+        self .bus .state = value
+
+    def setup_ui(self, container=None):
+        """Настройка UI элементов для отображения прогресса"""
+        if self .streamlit_sink is None:
+            self .streamlit_sink = StreamlitProgressSink()
+            self .bus .add_sink(self .streamlit_sink)
+        self .streamlit_sink .setup_ui(container)
+
+    def start_session(self, total_files: int, title: str = "Обработка документов"):
+        """Начать сессию обработки"""
+        with self .bus .lock:
+            self .state = ProgressState(
+                total_files=total_files,
+                start_time=time .time(),
+                stage_start_time=time .time()
+            )
+            self ._is_active = True
+
+        self ._update_display(f"{title} ({total_files} файлов)", EVENT_SESSION_START)
+
+    def start_file(self, filename: str, total_steps: int = 5):
+        """Начать обработку файла"""
+        with self .bus .lock:
+            self .state .current_file = filename
+            self .state .current_file_index += 1
+            self .state .current_step = 0
+            self .state .total_steps = total_steps
+            self .state .stage = ProcessingStage .READING_PDF
+            self .state .stage_start_time = time .time()
+            self .state .message = f"Начинаю обработку файла {filename}"
+            self .state .error_message = ""
+
+        self ._update_display(kind=EVENT_FILE_START)
+
+    def update_stage(self, stage: ProcessingStage, message: str = "", step_increment: int = 1):
+        """Обновить текущий этап"""
+        with self .bus .lock:
+            self .state .stage = stage
+            self .state .current_step += step_increment
+            self .state .stage_start_time = time .time()
+
+            if message:
+                self .state .message = message
+            else:
+                self .state .message = self ._get_default_message(stage)
+
+        self ._update_display(kind=EVENT_STAGE)
+
+    def update_progress(self, current: int, total: int = None, message: str = ""):
+        """Обновить прогресс текущего этапа"""
+        with self .bus .lock:
+            self .state .current_step = current
+            if total is not None:
+                self .state .total_steps = total
+            if message:
+                self .state .message = message
+
+        self ._update_display(kind=EVENT_PROGRESS)
+
+    def set_error(self, error_message: str):
+        """Зарегистрировать ошибку"""
+        with self .bus .lock:
+            self .state .stage = ProcessingStage .ERROR
+            self .state .error_message = error_message
+            self .state .message = f"Ошибка: {error_message}"
+
+        self ._update_display(kind=EVENT_ERROR)
+
+    def complete_file(self):
+        """Завершить обработку текущего файла"""
+        with self .bus .lock:
+            self .state .stage = ProcessingStage .COMPLETED
+            self .state .current_step = self .state .total_steps
+            self .state .message = f"Файл {self .state .current_file} обработан успешно"
+
+        self ._update_display(kind=EVENT_FILE_COMPLETE)
+
+    def finish_session(self, success: bool = True):
+        """Завершить сессию"""
+        self ._is_active = False
+        self .bus .publish(EVENT_SESSION_FINISH, success=success)
+
+    def _update_display(self, title: str = None, kind: str = EVENT_PROGRESS):
+        """Передать событие получателям; частоту отрисовки ограничивают сами получатели"""
+        if not self ._is_active:
+            return
+        self .bus .publish(kind, title)
+
+    def _get_default_message(self, stage: ProcessingStage) -> str:
+        """Получить сообщение по умолчанию для этапа"""
+        message_map = {
+            ProcessingStage .INITIALIZING: "Инициализация",
+            ProcessingStage .READING_PDF: "Чтение PDF файла",
+            ProcessingStage .READING_DOCX: "Чтение DOCX файла",
+            ProcessingStage .READING_TXT: "Чтение TXT файла",
+            ProcessingStage .PROCESSING_TEXT: "Обработка текста",
+            ProcessingStage .CREATING_CHUNKS: "Создание фрагментов",
+            ProcessingStage .GENERATING_EMBEDDINGS: "Генерация эмбеддингов",
+            ProcessingStage .STORING_DOCUMENTS: "Сохранение в базу данных",
+            ProcessingStage .COMPLETED: "Завершено",
+            ProcessingStage .ERROR: "Ошибка"
+        }
+        return message_map .get(stage, "Обработка")
+
+    def get_current_state(self) -> Dict[str, Any]:
+        """Получить текущее состояние для отладки"""
+        state = self .bus .snapshot()
+        state["is_active"] = self ._is_active
+        return state
+
+
+class ProgressContext:
+    """Контекстный менеджер для автоматического управления прогрессом"""
+
+    def __init__(self, total_files: int, title: str = "Обработка документов"):
+        self .tracker = SimpleProgressTracker()
+        self .total_files = total_files
+        self .title = title
+        self .success = True
+
+    def __enter__(self):
+        self .tracker .setup_ui()
+        self .tracker .start_session(self .total_files, self .title)
+        return self .tracker
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self .success = False
+            if hasattr(exc_val, '__str__'):
+                self .tracker .set_error(str(exc_val))
+
+        self .tracker .finish_session(self .success)
+        return False
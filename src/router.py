@@ -3,6 +3,7 @@ import logging
 from .llm_manager import LLMManager
 from .vector_store import VectorStore
 from .query_processor import QueryProcessor
+from .context_packer import ContextPacker, ExtractiveCompressor
 
 
 class SmartRouter:
@@ -12,6 +13,10 @@ class SmartRouter:
         self .vector_store = vector_store
         self .confidence_threshold = confidence_threshold
         self .query_processor = QueryProcessor(llm_manager)
+        self .context_packer = ContextPacker()
+        self .compressor = ExtractiveCompressor(self .context_packer .token_counter)
+        self .min_extract_tokens = 48
+        self .min_answer_tokens = 256
 
     def analyze_query(self, query: str) -> Dict[str, Any]:
 
@@ -30,8 +35,10 @@ class SmartRouter:
         }
         return query_analysis
 
-    def route_query(self, query: str, initial_search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        query_analysis = self .analyze_query(query)
+    def route_query(self, query: str, initial_search_results: List[Dict[str, Any]],
+                    query_analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if query_analysis is None:
+            query_analysis = self .analyze_query(query)
         if not initial_search_results:
             return {
                 "can_answer": False,
@@ -43,8 +50,8 @@ class SmartRouter:
         best_distance = min(result['distance']
                             for result in initial_search_results)
         confidence = max(0, 1 - best_distance)
-        context = "\n\n".join([result['content']
-                               for result in initial_search_results])
+        context = self .context_packer .separator .join(
+            [passage["content"]for passage in self .context_packer .merge_adjacent(initial_search_results)])
 
         if confidence >= self .confidence_threshold:
 
@@ -80,15 +87,47 @@ class SmartRouter:
             else:
                 return f"Insufficient relevant data (confidence: {confidence:.2f}). Query type: {query_type}. Additional information needed."
 
-    def enhance_context(self, context: str, query: str) -> str:
-        try:
-            if len(context) > 3000:
-                context = self .llm_manager .summarize_context(
-                    context, max_length=2000)
-            return context
-        except Exception as e:
-            self .logger .error(f"Error enhancing context: {str(e)}")
-            return context
+    def pack_context(self, query: str, search_results: List[Dict[str, Any]], max_tokens: int,
+                     system_prompt_style: str = "Профессиональный") -> Dict[str, Any]:
+        """Упаковывает фрагменты в бюджет окна модели; из не поместившихся остаток бюджета заполняется выдержками.
+
+        Самый релевантный отрывок помещается всегда: под него урезается max_tokens ответа. Если и тогда
+        на ответ остается меньше min_answer_tokens, контекст пуст и отвечать по документам нельзя.
+        """
+        token_counter = self .context_packer .token_counter
+        context_window = self .llm_manager .get_context_window()
+        overhead = token_counter .count(self .llm_manager .prompt_template(query, system_prompt_style))
+        budget = self .context_packer .budget(context_window, max_tokens, overhead)
+        passages = self .context_packer .merge_adjacent(search_results)
+        top_tokens = max(passages, key=lambda passage: passage["similarity"])["tokens"]if passages else 0
+        if top_tokens > budget:
+            answer_tokens = min(max_tokens, context_window - overhead - self .context_packer .safety_margin - top_tokens)
+            if answer_tokens < self .min_answer_tokens:
+                self .logger .warning(
+                    f"Top passage of {top_tokens} tokens does not fit the {context_window}-token window")
+                budget = 0
+            else:
+                max_tokens = answer_tokens
+                budget = self .context_packer .budget(context_window, max_tokens, overhead)
+        packing = self .context_packer .pack(search_results, budget, passages)
+        packing["max_tokens"] = max_tokens
+        used = {index for members in packing["members"]for index in members}
+        skipped = [index for index in range(len(search_results))if index not in used]
+        if packing["chunks"]and skipped and budget - packing["tokens"] >= self .min_extract_tokens:
+            extracts = self .compressor .compress(
+                query, [search_results[index]["content"]for index in skipped], budget - packing["tokens"],
+                [search_results[index].get("similarity", 0.0)for index in skipped])
+            for position, extract in extracts:
+                packing["chunks"].append(extract)
+                packing["indices"].append(skipped[position])
+                packing["members"].append([skipped[position]])
+            packing["context"] = self .context_packer .separator .join(packing["chunks"])
+            packing["tokens"] = token_counter .count(packing["context"])
+            packing["chunks_used"] += len(extracts)
+            packing["compressed_chunks"] = len(extracts)
+        packing["context_window"] = context_window
+        packing["prompt_tokens"] = overhead + packing["tokens"]
+        return packing
 
     def get_routing_metrics(self) -> Dict[str, Any]:
         return {
@@ -34,13 +34,15 @@ class SessionManager:
             'debug_mode',
             'chunk_size',
             'chunk_overlap',
+            'dedup_mode',
             'search_k',
             'search_method',
             'distance_threshold',
             'confidence_threshold',
             'temperature',
             'max_tokens',
-            'system_prompt_style'
+            'system_prompt_style',
+            'judgment_mode'
         ]
 
     def initialize_defaults(self):
@@ -53,13 +55,15 @@ class SessionManager:
             'debug_mode': False,
             'chunk_size': 512,
             'chunk_overlap': 25,
+            'dedup_mode': "link",
             'search_k': 10,
             'search_method': "mmr",
             'distance_threshold': 0.5,
             'confidence_threshold': 0.5,
             'temperature': 0.5,
             'max_tokens': 2000,
-            'system_prompt_style': "Профессиональный"
+            'system_prompt_style': "Профессиональный",
+            'judgment_mode': "concurrent"
         }
 
         for key, default_value in defaults .items():
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+
+SNAPSHOT_FORMAT = 1
+WARM_SNAPSHOT_DIR = "./data/snapshot"
+WARM_START_MARKER = "warm_start.json"
+
+
+class SnapshotManager:
+    """Экспорт и импорт коллекции как компактного набора: эмбеддинги .npy, фрагменты и документы в Parquet, манифест"""
+
+    def __init__(self, vector_store, batch_size: int = 2000):
+        self .logger = logging .getLogger(__name__)
+        self .vector_store = vector_store
+        self .batch_size = max(1, min(batch_size, vector_store .client .get_max_batch_size()))
+
+    def export(self, path: str, float16: bool = False) -> Dict[str, Any]:
+        """Выгружает текущую коллекцию в каталог path и возвращает манифест"""
+        start = time .perf_counter()
+        collection = self .vector_store .collection
+        count = collection .count()
+        os .makedirs(path, exist_ok=True)
+        dtype = np .float16 if float16 else np .float32
+
+        embeddings_path = os .path .join(path, "embeddings.npy")
+        embeddings = None
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[str] = []
+        version = hashlib .sha256()
+
+        for offset in range(0, count, self .batch_size):
+            batch = collection .get(
+                include=["embeddings", "documents", "metadatas"], limit=self .batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            vectors = np .asarray(batch["embeddings"], dtype=np .float32)
+            if embeddings is None:
+                embeddings = np .lib .format .open_memmap(
+                    embeddings_path, mode="w+", dtype=dtype, shape=(count, vectors .shape[1]))
+            embeddings[len(ids):len(ids)+len(vectors)] = vectors .astype(dtype)
+            for chunk_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                ids .append(chunk_id)
+                documents .append(document)
+                metadatas .append(json .dumps(metadata or {}, ensure_ascii=False, sort_keys=True))
+                version .update(chunk_id .encode("utf-8"))
+                version .update(hashlib .md5(document .encode("utf-8")).digest())
+
+        dimension = 0
+        if embeddings is not None:
+            dimension = embeddings .shape[1]
+            embeddings .flush()
+            del embeddings
+        elif os .path .exists(embeddings_path):
+            os .remove(embeddings_path)
+
+        pd .DataFrame({"id": ids, "document": documents, "metadata": metadatas}).to_parquet(
+            os .path .join(path, "chunks.parquet"), compression="zstd", index=False)
+
+        doc_ids = {json .loads(metadata).get("doc_id")for metadata in metadatas}
+        doc_rows = self .vector_store .document_store .export_rows(doc_id for doc_id in doc_ids if doc_id)
+        pd .DataFrame(doc_rows, columns=[
+            "doc_id", "filename", "file_path", "content_hash", "total_chars", "block_chars",
+            "compressed_bytes", "created_at", "metadata", "blocks"
+        ]).to_parquet(os .path .join(path, "documents.parquet"), compression="zstd", index=False)
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "embedding_model": self .vector_store .embedding_model,
+            "collection_name": self .vector_store .collection_name,
+            "corpus_version": version .hexdigest()[:16],
+            "chunk_count": len(ids),
+            "document_count": len(doc_rows),
+            "dimension": dimension,
+            "dtype": np .dtype(dtype).name,
+            "created_at": time .strftime("%Y-%m-%dT%H:%M:%S"),
+            "export_seconds": round(time .perf_counter()-start, 3)
+        }
+        with open(os .path .join(path, "manifest.json"), "w", encoding="utf-8")as f:
+            json .dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+    @staticmethod
+    def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+        manifest_path = os .path .join(path, "manifest.json")
+        if not os .path .exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8")as f:
+            return json .load(f)
+
+    def import_snapshot(self, path: str, replace: bool = True, rebuild_dedup: bool = True) -> Dict[str, Any]:
+        """Загружает набор без обращений к модели эмбеддингов; replace очищает коллекцию перед загрузкой"""
+        manifest = self .read_manifest(path)
+        if manifest is None:
+            raise ValueError(f"No manifest.json in {path}")
+        if manifest .get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {manifest .get('format')}")
+        if manifest["embedding_model"] != self .vector_store .embedding_model:
+            raise ValueError(
+                f"Snapshot was built with {manifest['embedding_model']}, "
+                f"but the current embedding model is {self .vector_store .embedding_model}")
+        current_dimension = self .vector_store .get_embedding_dimension()
+        if not replace and current_dimension is not None and manifest["dimension"] != current_dimension:
+            raise ValueError(
+                f"Snapshot dimension {manifest['dimension']} does not match collection dimension {current_dimension}")
+
+        start = time .perf_counter()
+        if replace and not self .vector_store .clear_collection():
+            raise RuntimeError("Could not clear the collection before import")
+
+        documents = pd .read_parquet(os .path .join(path, "documents.parquet"))
+        doc_rows = documents .to_dict("records")
+        for row in doc_rows:
+            row["blocks"] = [bytes(block)for block in row["blocks"]]
+        self .vector_store .document_store .import_rows(doc_rows)
+
+        chunks = pd .read_parquet(os .path .join(path, "chunks.parquet"))
+        embeddings = None
+        if len(chunks):
+            embeddings = np .load(os .path .join(path, "embeddings.npy"), mmap_mode="r")
+        for offset in range(0, len(chunks), self .batch_size):
+            batch = chunks .iloc[offset:offset + self .batch_size]
+            self .vector_store .collection .upsert(
+                ids=batch["id"].tolist(),
+                documents=batch["document"].tolist(),
+                metadatas=[json .loads(metadata)for metadata in batch["metadata"]],
+                embeddings=np .asarray(embeddings[offset:offset + len(batch)], dtype=np .float32)
+            )
+
+        if rebuild_dedup:
+            self ._rebuild_dedup_index(chunks, documents)
+
+        return {
+            "manifest": manifest,
+            "chunks": len(chunks),
+            "documents": len(doc_rows),
+            "elapsed_seconds": time .perf_counter()-start
+        }
+
+    def _rebuild_dedup_index(self, chunks: pd .DataFrame, documents: pd .DataFrame):
+        dedup_index = self .vector_store .dedup_index
+        sources = {row["doc_id"]: row["file_path"]or row["filename"]for row in documents .to_dict("records")}
+        for chunk_id, document, metadata in zip(chunks["id"], chunks["document"], chunks["metadata"]):
+            doc_id = json .loads(metadata).get("doc_id")
+            dedup_index .add(chunk_id, sources .get(doc_id, doc_id or ""), dedup_index .signature(document))
+        dedup_index .save()
+
+    def _marker_path(self) -> str:
+        return os .path .join(self .vector_store .persist_directory, WARM_START_MARKER)
+
+    def _read_marker(self) -> Dict[str, Any]:
+        marker_path = self ._marker_path()
+        if not os .path .exists(marker_path):
+            return {}
+        with open(marker_path, "r", encoding="utf-8")as f:
+            return json .load(f)
+
+    def mark_warm_start(self, reason: str):
+        """Запоминает в каталоге данных, что снимок для коллекции больше не загружается: он применен или коллекция очищена"""
+        marker = self ._read_marker()
+        marker[self .vector_store .collection_name] = {"reason": reason, "marked_at": time .time()}
+        temp_path = self ._marker_path()+".tmp"
+        with open(temp_path, "w", encoding="utf-8")as f:
+            json .dump(marker, f, ensure_ascii=False)
+        os .replace(temp_path, self ._marker_path())
+
+    def warm_start(self, path: str = WARM_SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+        """Один раз на каталог данных загружает набор из path в пустую коллекцию той же модели эмбеддингов"""
+        manifest = self .read_manifest(path)
+        if manifest is None or self .vector_store .collection_name in self ._read_marker():
+            return None
+        if self .vector_store .collection .count() > 0:
+            return None
+        if manifest .get("embedding_model") != self .vector_store .embedding_model:
+            self .logger .info(
+                f"Skipping warm snapshot {path}: built with {manifest .get('embedding_model')}")
+            return None
+        report = self .import_snapshot(path, replace=False)
+        self .mark_warm_start("applied")
+        return report
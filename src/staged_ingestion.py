@@ -0,0 +1,339 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent .futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from langchain .schema import Document
+from .document_processor import DocumentProcessor
+from .progress import SimpleProgressTracker, ProcessingStage
+
+
+_SENTINEL = object()
+_extraction_processor: Optional[DocumentProcessor] = None
+
+
+def _init_extraction(chunk_size: int, chunk_overlap: int, strip_boilerplate: bool):
+    global _extraction_processor
+    _extraction_processor = DocumentProcessor(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, strip_boilerplate=strip_boilerplate)
+
+
+def _extract_file(path: str) -> Tuple[List[Document], str, Dict[str, Any]]:
+    """Извлекает и разбивает файл в процессе-исполнителе; текст документа сохраняет основной процесс"""
+    extracted_data = _extraction_processor .extract_text_from_file(path)
+    if not extracted_data:
+        return [], "", {}
+    extracted_data["metadata"]["content_hash"] = _extraction_processor .compute_file_hash(path)
+    documents = _extraction_processor .chunk_document(extracted_data["text"], extracted_data["metadata"])
+    return documents, extracted_data["text"], extracted_data["metadata"]
+
+
+class StageMetrics:
+    """Счетчики этапа: время работы, простой в ожидании входа и блокировка на переполненной выходной очереди"""
+
+    def __init__(self, name: str, workers: int, output_queue: Optional[queue .Queue] = None):
+        self .name = name
+        self .workers = workers
+        self .output_queue = output_queue
+        self .items = 0
+        self .busy_seconds = 0.0
+        self .wait_seconds = 0.0
+        self .blocked_seconds = 0.0
+        self .max_queue_depth = 0
+        self ._lock = threading .Lock()
+
+    def add(self, busy: float = 0.0, wait: float = 0.0, blocked: float = 0.0, items: int = 0):
+        with self ._lock:
+            self .busy_seconds += busy
+            self .wait_seconds += wait
+            self .blocked_seconds += blocked
+            self .items += items
+            if self .output_queue is not None:
+                self .max_queue_depth = max(self .max_queue_depth, self .output_queue .qsize())
+
+    def to_dict(self, wall_seconds: float) -> Dict[str, Any]:
+        capacity = wall_seconds * self .workers
+        return {
+            "workers": self .workers,
+            "items": self .items,
+            "busy_seconds": self .busy_seconds,
+            "wait_seconds": self .wait_seconds,
+            "blocked_seconds": self .blocked_seconds,
+            "utilization": self .busy_seconds / capacity if capacity > 0 else 0.0,
+            "starvation": self .wait_seconds / capacity if capacity > 0 else 0.0,
+            "backpressure": self .blocked_seconds / capacity if capacity > 0 else 0.0,
+            "max_queue_depth": self .max_queue_depth,
+            "queue_size": self .output_queue .maxsize if self .output_queue is not None else 0
+        }
+
+
+class StagedIngestionPipeline:
+    """Конвейер извлечение → эмбеддинги → запись, этапы которого работают одновременно через ограниченные очереди.
+
+    Извлечение идет в extract_workers отдельных процессах, у каждого свой DocumentProcessor.
+    """
+
+    def __init__(self, document_processor, vector_store, extract_workers: int = 2, embed_workers: int = 2,
+                 chunk_queue_size: int = 8, store_queue_size: int = 4, batch_size: int = 32,
+                 replace_existing: bool = True):
+        self .logger = logging .getLogger(__name__)
+        self .document_processor = document_processor
+        self .vector_store = vector_store
+        self .extract_workers = max(1, extract_workers)
+        self .embed_workers = max(1, embed_workers)
+        self .chunk_queue_size = chunk_queue_size
+        self .store_queue_size = store_queue_size
+        self .batch_size = max(1, batch_size)
+        self .replace_existing = replace_existing
+
+    def run(self, file_paths: List[str], progress_tracker: Optional[SimpleProgressTracker] = None) -> Dict[str, Any]:
+        """Индексирует файлы и возвращает отчет с метриками этапов"""
+        input_queue: queue .Queue = queue .Queue()
+        chunk_queue: queue .Queue = queue .Queue(maxsize=self .chunk_queue_size)
+        store_queue: queue .Queue = queue .Queue(maxsize=self .store_queue_size)
+        for path in file_paths:
+            input_queue .put(path)
+        for _ in range(self .extract_workers):
+            input_queue .put(_SENTINEL)
+
+        metrics = {
+            "extract": StageMetrics("extract", self .extract_workers, chunk_queue),
+            "embed": StageMetrics("embed", self .embed_workers, store_queue),
+            "store": StageMetrics("store", 1)
+        }
+        lock = threading .Lock()
+        files: Dict[str, Dict[str, Any]] = {
+            path: {"expected": None, "stored": 0, "pages": 0, "boilerplate_chars": 0, "boilerplate_chunks": 0,
+                   "duplicates": 0, "error": "", "old_ids": [], "new_ids": [],
+                   "doc_ids": []}
+            for path in file_paths
+        }
+        finished_files: List[str] = []
+        remaining = {"extract": self .extract_workers, "embed": self .embed_workers}
+        executor = ProcessPoolExecutor(
+            max_workers=self .extract_workers, mp_context=multiprocessing .get_context("spawn"),
+            initializer=_init_extraction,
+            initargs=(self .document_processor .chunk_size, self .document_processor .chunk_overlap,
+                      self .document_processor .strip_boilerplate))
+
+        def fail(path: str, error: str):
+            with lock:
+                if not files[path]["error"]:
+                    files[path]["error"] = error
+                    finished_files .append(path)
+
+        def finish_file(path: str):
+            try:
+                self .vector_store .document_store .commit_text(files[path]["doc_ids"])
+                self .vector_store .delete_chunk_ids(files[path]["old_ids"])
+            except Exception as e:
+                self .logger .error(f"Error replacing previous version of {path}: {str(e)}")
+
+        def extract_worker():
+            while True:
+                start = time .perf_counter()
+                path = input_queue .get()
+                waited = time .perf_counter()-start
+                if path is _SENTINEL:
+                    metrics["extract"].add(wait=waited)
+                    break
+
+                start = time .perf_counter()
+                try:
+                    documents, text, metadata = executor .submit(_extract_file, path).result()
+                except Exception as e:
+                    documents = []
+                    fail(path, str(e))
+                busy = time .perf_counter()-start
+
+                if not documents:
+                    fail(path, "Не удалось извлечь текст")
+                    metrics["extract"].add(busy=busy, wait=waited, items=1)
+                    continue
+                files[path]["doc_ids"] = self .vector_store .source_doc_ids(documents)
+                for doc_id in files[path]["doc_ids"]:
+                    self .vector_store .document_store .stage_text(text, metadata, doc_id=doc_id)
+
+                first_metadata = documents[0].metadata
+                page_count = first_metadata .get("page_count")
+                start = time .perf_counter()
+                try:
+                    old_ids = self .vector_store .get_file_chunk_ids(path)if self .replace_existing else []
+                    ids = self .vector_store .document_ids(documents, set(old_ids))
+                    kept = {id(document)for document in self .vector_store .filter_duplicates(
+                        documents, ids, exclude_ids=set(old_ids))}
+                    unique = [(document, chunk_id)for document, chunk_id in zip(documents, ids)
+                              if id(document)in kept]
+                except Exception as e:
+                    fail(path, f"Ошибка записи в векторную базу: {str(e)}")
+                    metrics["extract"].add(busy=busy + time .perf_counter()-start, wait=waited, items=1)
+                    continue
+                busy += time .perf_counter()-start
+                with lock:
+                    files[path]["expected"] = len(unique)
+                    files[path]["old_ids"] = old_ids
+                    files[path]["new_ids"] = [chunk_id for _, chunk_id in unique]
+                    files[path]["duplicates"] = len(documents)-len(unique)
+                    files[path]["pages"] = page_count if isinstance(page_count, int)else 0
+                    files[path]["boilerplate_chars"] = first_metadata .get("boilerplate_chars_removed", 0)
+                    files[path]["boilerplate_chunks"] = first_metadata .get("boilerplate_chunks_saved", 0)
+                    if not unique:
+                        finished_files .append(path)
+                if not unique:
+                    finish_file(path)
+
+                blocked = 0.0
+                for offset in range(0, len(unique), self .batch_size):
+                    start = time .perf_counter()
+                    chunk_queue .put((path, unique[offset:offset + self .batch_size]))
+                    blocked += time .perf_counter()-start
+                metrics["extract"].add(busy=busy, wait=waited, blocked=blocked, items=1)
+
+            with lock:
+                remaining["extract"] -= 1
+                last = remaining["extract"] == 0
+            if last:
+                for _ in range(self .embed_workers):
+                    chunk_queue .put(_SENTINEL)
+
+        def embed_worker():
+            while True:
+                start = time .perf_counter()
+                item = chunk_queue .get()
+                waited = time .perf_counter()-start
+                if item is _SENTINEL:
+                    metrics["embed"].add(wait=waited)
+                    break
+
+                path, batch = item
+                if files[path]["error"]:
+                    metrics["embed"].add(wait=waited)
+                    continue
+
+                start = time .perf_counter()
+                try:
+                    embeddings = self .vector_store .embed_texts([doc .page_content for doc, _ in batch])
+                except Exception as e:
+                    fail(path, f"Ошибка генерации эмбеддингов: {str(e)}")
+                    metrics["embed"].add(busy=time .perf_counter()-start, wait=waited)
+                    continue
+                busy = time .perf_counter()-start
+
+                start = time .perf_counter()
+                store_queue .put((path, batch, embeddings))
+                metrics["embed"].add(busy=busy, wait=waited,
+                                     blocked=time .perf_counter()-start, items=len(batch))
+
+            with lock:
+                remaining["embed"] -= 1
+                last = remaining["embed"] == 0
+            if last:
+                store_queue .put(_SENTINEL)
+
+        def store_worker():
+            while True:
+                start = time .perf_counter()
+                item = store_queue .get()
+                waited = time .perf_counter()-start
+                if item is _SENTINEL:
+                    metrics["store"].add(wait=waited)
+                    break
+
+                path, batch, embeddings = item
+                if files[path]["error"]:
+                    metrics["store"].add(wait=waited)
+                    continue
+
+                start = time .perf_counter()
+                try:
+                    self .vector_store .add_embedded_documents(
+                        [doc for doc, _ in batch], embeddings, ids=[chunk_id for _, chunk_id in batch])
+                except Exception as e:
+                    fail(path, f"Ошибка записи в векторную базу: {str(e)}")
+                    metrics["store"].add(busy=time .perf_counter()-start, wait=waited)
+                    continue
+                metrics["store"].add(busy=time .perf_counter()-start, wait=waited, items=len(batch))
+
+                with lock:
+                    files[path]["stored"] += len(batch)
+                    complete = files[path]["stored"] == files[path]["expected"]
+                    if complete:
+                        finished_files .append(path)
+                if complete:
+                    finish_file(path)
+
+        threads = [threading .Thread(target=extract_worker, name=f"ingest-extract-{i}", daemon=True)
+                   for i in range(self .extract_workers)]
+        threads += [threading .Thread(target=embed_worker, name=f"ingest-embed-{i}", daemon=True)
+                    for i in range(self .embed_workers)]
+        writer = threading .Thread(target=store_worker, name="ingest-store", daemon=True)
+        threads .append(writer)
+
+        if progress_tracker and not progress_tracker ._is_active:
+            progress_tracker .start_session(len(file_paths), f"Обработка {len(file_paths)} файлов")
+
+        wall_start = time .perf_counter()
+        for thread in threads:
+            thread .start()
+
+        reported = 0
+        while True:
+            writer .join(0.25)
+            done = not writer .is_alive()
+            if progress_tracker:
+                reported = self ._report_progress(progress_tracker, files, finished_files, reported, lock)
+            if done:
+                break
+        for thread in threads:
+            thread .join()
+        executor .shutdown()
+        wall_seconds = time .perf_counter()-wall_start
+
+        failed = {path: state["error"]for path, state in files .items()if state["error"]}
+        for path in failed:
+            self .vector_store .document_store .discard_text(files[path]["doc_ids"])
+            if files[path]["new_ids"]:
+                try:
+                    self .vector_store .delete_chunk_ids(files[path]["new_ids"])
+                except Exception as e:
+                    self .logger .error(f"Error deleting partial chunks of {path}: {str(e)}")
+        self .vector_store .dedup_index .save()
+        indexed = [path for path, state in files .items()if not state["error"]and state["expected"]is not None]
+
+        return {
+            "files": len(file_paths),
+            "indexed": len(indexed),
+            "failed": failed,
+            "chunks": sum(files[path]["stored"]for path in indexed),
+            "pages": sum(files[path]["pages"]for path in indexed),
+            "boilerplate_chars_saved": sum(files[path]["boilerplate_chars"]for path in indexed),
+            "boilerplate_chunks_saved": sum(files[path]["boilerplate_chunks"]for path in indexed),
+            "duplicate_chunks": sum(files[path]["duplicates"]for path in indexed),
+            "dedup_ratio": self .vector_store .dedup_index .get_stats()["dedup_ratio"],
+            "elapsed_seconds": wall_seconds,
+            "stages": {name: stage .to_dict(wall_seconds)for name, stage in metrics .items()}
+        }
+
+    def _report_progress(self, tracker: SimpleProgressTracker, files: Dict[str, Dict[str, Any]],
+                         finished_files: List[str], reported: int, lock: threading .Lock) -> int:
+        with lock:
+            newly_finished = finished_files[reported:]
+            stored = sum(state["stored"]for state in files .values())
+            expected = sum(state["expected"]or 0 for state in files .values())
+
+        for path in newly_finished:
+            tracker .start_file(os .path .basename(path), 1)
+            if files[path]["error"]:
+                tracker .set_error(f"{os .path .basename(path)}: {files[path]['error']}")
+            else:
+                tracker .complete_file()
+
+        if expected:
+            if tracker .state .stage != ProcessingStage .STORING_DOCUMENTS:
+                tracker .update_stage(ProcessingStage .STORING_DOCUMENTS, step_increment=0)
+            tracker .update_progress(
+                stored, expected, f"Сохранено {stored} из {expected} известных фрагментов")
+        return reported + len(newly_finished)
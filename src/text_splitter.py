@@ -0,0 +1,158 @@
+from typing import Callable, List, Optional, Union
+from collections import deque
+
+
+LEGAL_SEPARATORS = ["\n\nСтатья", "\n\n", ".\n", "\n", ".", "", ""]
+
+
+class RAGTextSplitter:
+    """Линейный по времени аналог RecursiveCharacterTextSplitter с теми же границами фрагментов"""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, separators: Optional[List[str]] = None,
+                 keep_separator: Union[bool, str] = True, length_function: Callable[[str], int] = len,
+                 strip_whitespace: bool = True):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller.")
+        self .chunk_size = chunk_size
+        self .chunk_overlap = chunk_overlap
+        self .separators = list(separators)if separators is not None else list(LEGAL_SEPARATORS)
+        self .keep_separator = keep_separator
+        self .length_function = length_function
+        self .strip_whitespace = strip_whitespace
+        self ._plan = self ._compile_separators(self .separators)
+
+    def _compile_separators(self, separators: List[str]) -> List[tuple]:
+        """Заранее вычисляет для каждого уровня разделитель и оставшийся список уровней"""
+        plan = []
+        for i, separator in enumerate(separators):
+            if separator == "":
+                plan .append((separator, len(separators)))
+                break
+            plan .append((separator, i + 1))
+        return plan
+
+    def split_text(self, text: str) -> List[str]:
+        chunks = []
+        self ._split_level(text, 0, chunks)
+        return chunks
+
+    def _choose_separator(self, text: str, level: int):
+        for separator, next_level in self ._plan[level:]:
+            if separator == "" or separator in text:
+                return separator, next_level
+        return self .separators[-1], len(self .separators)
+
+    def _split_level(self, text: str, level: int, out: List[str]):
+        separator, next_level = self ._choose_separator(text, level)
+        if separator == "" and self .length_function is len and self .chunk_size > 1:
+            self ._merge_characters(text, out)
+            return
+
+        has_deeper_levels = next_level < len(self .separators) and separator != ""
+
+        splits = self ._split_on(text, separator)
+        merge_separator = ""if self .keep_separator else separator
+
+        good_splits = []
+        for piece in splits:
+            if self .length_function(piece) < self .chunk_size:
+                good_splits .append(piece)
+                continue
+            if good_splits:
+                self ._merge_splits(good_splits, merge_separator, out)
+                good_splits = []
+            if has_deeper_levels:
+                self ._split_level(piece, next_level, out)
+            else:
+                out .append(piece)
+
+        if good_splits:
+            self ._merge_splits(good_splits, merge_separator, out)
+
+    def _split_on(self, text: str, separator: str) -> List[str]:
+        if not separator:
+            return list(text)
+
+        parts = text .split(separator)
+        if not self .keep_separator:
+            splits = parts
+        elif self .keep_separator == "end":
+            splits = [part + separator for part in parts[:-1]]
+            splits .append(parts[-1])
+        else:
+            splits = [parts[0]]
+            splits .extend(separator + part for part in parts[1:])
+        return [s for s in splits if s != ""]
+
+    def _join(self, pieces, separator: str) -> Optional[str]:
+        text = separator .join(pieces)
+        if self .strip_whitespace:
+            text = text .strip()
+        return text if text != ""else None
+
+    def _merge_splits(self, splits: List[str], separator: str, out: List[str]):
+        separator_len = self .length_function(separator)
+        chunk_size = self .chunk_size
+        chunk_overlap = self .chunk_overlap
+
+        window = deque()
+        lengths = deque()
+        total = 0
+        for piece in splits:
+            piece_len = self .length_function(piece)
+            if total + piece_len + (separator_len if window else 0) > chunk_size:
+                if window:
+                    doc = self ._join(window, separator)
+                    if doc is not None:
+                        out .append(doc)
+                    while total > chunk_overlap or (
+                        total + piece_len + (separator_len if window else 0) > chunk_size and total > 0
+                    ):
+                        total -= lengths .popleft()+(separator_len if len(window) > 1 else 0)
+                        window .popleft()
+            window .append(piece)
+            lengths .append(piece_len)
+            total += piece_len + (separator_len if len(window) > 1 else 0)
+
+        doc = self ._join(window, separator)
+        if doc is not None:
+            out .append(doc)
+
+    def _merge_characters(self, text: str, out: List[str]):
+        """Посимвольное слияние через срезы: эквивалентно _merge_splits для отдельных символов"""
+        if self .chunk_overlap >= self .chunk_size:
+            self ._merge_splits(list(text), "", out)
+            return
+
+        step = self .chunk_size - self .chunk_overlap
+        start = 0
+        while start + self .chunk_size < len(text):
+            doc = self ._join((text[start:start + self .chunk_size],), "")
+            if doc is not None:
+                out .append(doc)
+            start += step
+
+        doc = self ._join((text[start:],), "")
+        if doc is not None:
+            out .append(doc)
+
+
+def overlap_length(left: str, right: str, min_overlap: int = 20) -> int:
+    """Длина самого длинного суффикса left, совпадающего с префиксом right (0, если короче min_overlap)"""
+    for size in range(min(len(left), len(right)), min_overlap - 1, -1):
+        if left .endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_overlapping_texts(texts: List[str], min_overlap: int = 20, separator: str = "\n\n") -> str:
+    """Склеивает соседние фрагменты, убирая их перекрытие; без перекрытия соединяет через separator"""
+    merged = ""
+    for text in texts:
+        if not merged:
+            merged = text
+            continue
+        size = overlap_length(merged[-len(text):], text, min_overlap)
+        merged += text[size:]if size else separator + text
+    return merged
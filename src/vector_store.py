@@ -1,22 +1,30 @@
 import chromadb
 from chromadb .config import Settings
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Iterable, Optional, Set, Union
 import ollama
-import streamlit as st
 from langchain .schema import Document
 import os
 import hashlib
 import re
+import uuid
 import numpy as np
+from functools import partial
 from .document_processor import SimpleProgressTracker, ProcessingStage
+from .notify import notifier
+from .dedup import MinHashIndex, DEDUP_MODES, get_dedup_index
+from .document_store import DocumentStore, CHUNK_METADATA_KEYS, document_id, split_chunk_metadata
+from .text_splitter import merge_overlapping_texts
+from .flow import Flow, SyncIO, run_flow
 
 
 class VectorStore:
-    def __init__(self, collection_name: str = "rag_documents", persist_directory: str = "./data/chroma_db", embedding_model: str = "qwen3-embedding:latest", progress_tracker: Optional[SimpleProgressTracker] = None):
+    def __init__(self, collection_name: str = "rag_documents", persist_directory: str = "./data/chroma_db", embedding_model: str = "qwen3-embedding:latest", progress_tracker: Optional[SimpleProgressTracker] = None,
+                 dedup_mode: str = "link"):
         self .base_collection_name = collection_name
         self .persist_directory = os .path .abspath(persist_directory)
         self .embedding_model = embedding_model
         self .progress_tracker = progress_tracker
+        self .dedup_mode = dedup_mode if dedup_mode in DEDUP_MODES else "link"
 
         os .makedirs(self .persist_directory, exist_ok=True)
 
@@ -40,6 +48,12 @@ class VectorStore:
             metadata={"hnsw:space": "cosine",
                       "embedding_model": embedding_model}
         )
+        self .dedup_index = self ._open_dedup_index()
+        self .document_store = DocumentStore(os .path .join(self .persist_directory, "documents.sqlite3"))
+        self ._migrate_if_needed()
+
+    def _open_dedup_index(self) -> MinHashIndex:
+        return get_dedup_index(os .path .join(self .persist_directory, "dedup", self .collection_name))
 
     def _get_collection_name_for_model(self, model_name: str) -> str:
         model_hash = hashlib .md5(model_name .encode()).hexdigest()[:8]
@@ -62,14 +76,16 @@ class VectorStore:
                     metadata={"hnsw:space": "cosine",
                               "embedding_model": model_name}
                 )
+                self .dedup_index = self ._open_dedup_index()
+                self ._migrate_if_needed()
 
                 return True
             else:
-                st .error(f"Failed to test embedding model {model_name}")
+                notifier .error(f"Failed to test embedding model {model_name}")
                 return False
 
         except Exception as e:
-            st .error(
+            notifier .error(
                 f"Failed to update embedding model to {model_name}: {str(e)}")
             return False
 
@@ -82,8 +98,8 @@ class VectorStore:
             embeddings = []
 
             if not self .progress_tracker and len(texts) > 10:
-                progress_bar = st .progress(0)
-                status_text = st .empty()
+                progress_bar = notifier .progress(0)
+                status_text = notifier .empty()
 
             for i, text in enumerate(texts):
                 try:
@@ -99,7 +115,7 @@ class VectorStore:
                         if self .progress_tracker:
                             self .progress_tracker .set_error(error_msg)
                         else:
-                            st .error(error_msg)
+                            notifier .error(error_msg)
                         return []
 
                 except Exception as e:
@@ -107,7 +123,7 @@ class VectorStore:
                     if self .progress_tracker:
                         self .progress_tracker .set_error(error_msg)
                     else:
-                        st .error(error_msg)
+                        notifier .error(error_msg)
                     return []
 
                 if self .progress_tracker:
@@ -129,63 +145,279 @@ class VectorStore:
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
+            return []
+
+    def _document_ids(self, documents: List[Document]) -> List[str]:
+        ids = []
+        for i, doc in enumerate(documents):
+            filename = doc .metadata .get("filename", "unknown")
+            chunk_id = doc .metadata .get("chunk_id", i)
+            unique_id = f"{filename}_{chunk_id}_{hashlib .md5(doc .page_content .encode()).hexdigest()[:8]}"
+            ids .append(unique_id)
+        return ids
+
+    def _storage_metadatas(self, documents: List[Document],
+                           file_keys: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Компактные метаданные фрагментов для Chroma; общие поля файла записываются в таблицу документов"""
+        metadatas = []
+        saved = set()
+        for doc in documents:
+            chunk_metadata, file_metadata = split_chunk_metadata(doc .metadata, file_keys)
+            doc_id = chunk_metadata .get("doc_id")or document_id(
+                file_metadata .get("file_path")or file_metadata .get("filename", "unknown"))
+            chunk_metadata["doc_id"] = doc_id
+            if doc_id not in saved:
+                if not self .document_store .has_staged(doc_id):
+                    self .document_store .save_metadata(doc_id, file_metadata)
+                saved .add(doc_id)
+            metadatas .append(chunk_metadata)
+        return metadatas
+
+    def _join_metadata(self, metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Дополняет метаданные фрагментов общими полями файла из таблицы документов"""
+        metadatas = [metadata or {}for metadata in metadatas]
+        file_metadata = self .document_store .get_metadata(
+            metadata["doc_id"]for metadata in metadatas if metadata .get("doc_id"))
+        joined = []
+        for metadata in metadatas:
+            merged = {**file_metadata .get(metadata .get("doc_id"), {}), **metadata}
+            if merged .get("start", -1) >= 0 and merged .get("end", -1) >= 0:
+                merged["chunk_size"] = merged["end"]-merged["start"]
+            joined .append(merged)
+        return joined
+
+    def _doc_ids_for_filenames(self, filenames: List[str]) -> List[str]:
+        return self .document_store .find_doc_ids("filename", filenames)
+
+    def _chunk_ids_for_doc_ids(self, doc_ids: List[str]) -> List[str]:
+        if not doc_ids:
             return []
+        return self .collection .get(where={"doc_id": {"$in": doc_ids}}, include=[])["ids"]
+
+    def _migrate_if_needed(self):
+        try:
+            probe = self .collection .get(limit=1, include=["metadatas"])
+            if probe["metadatas"]and "doc_id"not in (probe["metadatas"][0]or {}):
+                migrated = self .migrate_legacy_metadata()
+                notifier .info(
+                    f"Метаданные {migrated['chunks']} фрагментов {migrated['documents']} документов "
+                    "перенесены в таблицу документов")
+        except Exception as e:
+            notifier .error(f"Error migrating chunk metadata: {str(e)}")
+
+    def migrate_legacy_metadata(self) -> Dict[str, int]:
+        """Переводит фрагменты, хранящие полные метаданные файла, на doc_id, смещения и таблицу документов"""
+        results = self .collection .get(include=["metadatas"])
+        groups: Dict[str, List[str]] = {}
+        for chunk_id, metadata in zip(results["ids"], results["metadatas"]):
+            metadata = metadata or {}
+            if "doc_id"not in metadata:
+                source = metadata .get("file_path")or metadata .get("filename", "unknown")
+                groups .setdefault(source, []).append(chunk_id)
+
+        migrated_chunks = 0
+        for source, ids in groups .items():
+            chunks = self .collection .get(ids=ids, include=["documents", "metadatas"])
+            order = sorted(range(len(chunks["ids"])),
+                           key=lambda i: chunks["metadatas"][i].get("chunk_id", i))
+            doc_id = document_id(source)
+            _, file_metadata = split_chunk_metadata(chunks["metadatas"][order[0]])
+
+            stored = self .document_store .get_document(doc_id)
+            if stored and stored["total_chars"]:
+                text = self .document_store .read_text(doc_id)
+                self .document_store .save_metadata(doc_id, file_metadata)
+            else:
+                text = merge_overlapping_texts([chunks["documents"][i].strip()for i in order])
+                self .document_store .save_text(text, file_metadata, doc_id=doc_id)
+
+            cursor = 0
+            metadatas = []
+            for i in order:
+                content = chunks["documents"][i].strip()
+                start = text .find(content, cursor)
+                if start >= 0:
+                    cursor = start + 1
+                legacy_keys = set(chunks["metadatas"][i])-{"chunk_id"}
+                metadata = {key: None for key in legacy_keys}
+                metadata .update({
+                    "doc_id": doc_id,
+                    "chunk_id": chunks["metadatas"][i].get("chunk_id", i),
+                    "start": start,
+                    "end": start + len(content)if start >= 0 else -1
+                })
+                metadatas .append(metadata)
+
+            self .collection .update(ids=[chunks["ids"][i]for i in order], metadatas=metadatas)
+            migrated_chunks += len(order)
+
+        return {"documents": len(groups), "chunks": migrated_chunks}
+
+    def filter_duplicates(self, documents: List[Document], ids: Optional[List[str]] = None,
+                          exclude_ids: Optional[Set[str]] = None) -> List[Document]:
+        """Отсеивает почти дубликаты уже проиндексированных фрагментов согласно dedup_mode;
+        exclude_ids - фрагменты, которые не считаются оригиналами (например, заменяемая версия файла)"""
+        kept = []
+        for document, chunk_id in zip(documents, ids or self ._document_ids(documents)):
+            metadata = document .metadata
+            source = metadata .get("file_path")or metadata .get("filename", "unknown")
+            signature = self .dedup_index .signature(document .page_content)
+            duplicate = self .dedup_index .check_and_add(
+                chunk_id, source, signature, add_duplicate=self .dedup_mode == "keep", exclude_ids=exclude_ids)
+            if duplicate is not None and self .dedup_mode != "keep":
+                if self .dedup_mode == "link":
+                    self .dedup_index .link(duplicate[0], {
+                        "source": source,
+                        "filename": metadata .get("filename"),
+                        "chunk_id": metadata .get("chunk_id"),
+                        "similarity": round(duplicate[1], 3)
+                    })
+                continue
+            kept .append(document)
+        return kept
+
+    def _warn_orphaned(self, sources: List[str]):
+        if sources and self .dedup_mode == "link":
+            notifier .warning(
+                "Удалены оригиналы почти дубликатов из: "+", ".join(os .path .basename(source)for source in sources)+
+                ". Переиндексируйте эти документы, чтобы восстановить их фрагменты")
+
+    def forget_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+        """Убирает из индекса дубликатов фрагменты, которые не удалось сохранить"""
+        self .dedup_index .remove_ids(ids or self ._document_ids(documents))
+        self .dedup_index .save()
+
+    @staticmethod
+    def source_doc_ids(documents: List[Document]) -> List[str]:
+        return list(dict .fromkeys(doc .metadata["doc_id"]for doc in documents if doc .metadata .get("doc_id")))
+
+    def commit_documents(self, documents: List[Document]):
+        """Сохраняет отложенные тексты документов после успешной записи их фрагментов"""
+        self .document_store .commit_text(self .source_doc_ids(documents))
+
+    def discard_documents(self, documents: List[Document]):
+        """Отбрасывает отложенные тексты документов, фрагменты которых не удалось сохранить"""
+        self .document_store .discard_text(self .source_doc_ids(documents))
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Пакетная генерация эмбеддингов одним запросом к Ollama; при ошибке бросает исключение"""
+        if not texts:
+            return []
+        response = ollama .embed(model=self .embedding_model, input=texts)
+        embeddings = response["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Ollama вернула {len(embeddings)} эмбеддингов для {len(texts)} текстов")
+        return [list(embedding)for embedding in embeddings]
+
+    def add_embedded_documents(self, documents: List[Document], embeddings: List[List[float]],
+                               ids: Optional[List[str]] = None):
+        """Сохраняет фрагменты с уже вычисленными эмбеддингами; ошибки пробрасываются вызывающему"""
+        self .collection .add(
+            documents=[doc .page_content for doc in documents],
+            metadatas=self ._storage_metadatas(documents),
+            ids=ids or self ._document_ids(documents),
+            embeddings=embeddings
+        )
+
+    def upsert_embedded_documents(self, documents: List[Document], embeddings: List[List[float]],
+                                  ids: Optional[List[Optional[str]]] = None,
+                                  file_keys: Optional[Iterable[str]] = None):
+        """Добавляет или заменяет фрагменты с готовыми эмбеддингами; пустые id вычисляются как обычно.
+        file_keys - поля, общие для файла; остальные метаданные хранятся у каждого фрагмента"""
+        default_ids = self ._document_ids(documents)
+        self .collection .upsert(
+            documents=[doc .page_content for doc in documents],
+            metadatas=self ._storage_metadatas(documents, file_keys),
+            ids=[chunk_id or default_id for chunk_id, default_id in zip(ids or default_ids, default_ids)],
+            embeddings=embeddings
+        )
+
+    def get_embedding_dimension(self) -> Optional[int]:
+        """Размерность векторов коллекции или None, если она пуста"""
+        sample = self .collection .get(limit=1, include=["embeddings"])
+        if sample["embeddings"]is None or len(sample["embeddings"]) == 0:
+            return None
+        return len(sample["embeddings"][0])
 
     def add_documents(self, documents: List[Document]) -> bool:
+        return run_flow(self ._add_documents_flow(documents), SyncIO(self))
+
+    def _add_documents_flow(self, documents: List[Document]) -> Flow:
+        """Поток записи фрагментов: блокирующие шаги - операции call, эмбеддинги - операция embed_documents"""
+        source_documents = documents
         try:
             if not documents:
                 return False
 
-            texts = [doc .page_content for doc in documents]
-            metadatas = [doc .metadata for doc in documents]
+            documents = yield ("call", partial(self .filter_duplicates, documents))
+            if not documents:
+                yield ("call", self .dedup_index .save)
+                yield ("call", partial(self .commit_documents, source_documents))
+                if not self .progress_tracker:
+                    notifier .info("Все фрагменты уже есть в базе как почти дубликаты")
+                return True
 
-            ids = []
-            for i, doc in enumerate(documents):
-                filename = doc .metadata .get("filename", "unknown")
-                chunk_id = doc .metadata .get("chunk_id", i)
-                unique_id = f"{filename}_{chunk_id}_{hashlib .md5(doc .page_content .encode()).hexdigest()[:8]}"
-                ids .append(unique_id)
+            texts = [doc .page_content for doc in documents]
+            ids = self ._document_ids(documents)
 
             if not self .progress_tracker:
-                st .info("Generating embeddings...")
+                notifier .info("Generating embeddings...")
 
-            embeddings = self .generate_embeddings(texts)
+            embeddings = yield ("embed_documents", texts)
 
             if not embeddings:
+                self .forget_documents(documents)
+                self .discard_documents(source_documents)
                 return False
 
             if self .progress_tracker:
                 self .progress_tracker .update_stage(
                     ProcessingStage .STORING_DOCUMENTS, f"Сохранение {len(documents)} документов в базу данных")
             else:
-                st .info("Adding documents to vector store...")
+                notifier .info("Adding documents to vector store...")
 
-            self .collection .add(
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids,
-                embeddings=embeddings
-            )
+            yield ("call", partial(self .add_embedded_documents, documents, embeddings, ids))
 
+            yield ("call", self .dedup_index .save)
+            yield ("call", partial(self .commit_documents, source_documents))
             if not self .progress_tracker:
-                st .success(
+                notifier .success(
                     f"Added {len(documents)} documents to vector store")
             return True
 
         except Exception as e:
+            self .forget_documents(documents)
+            self .discard_documents(source_documents)
             error_msg = f"Error adding documents: {str(e)}"
             if self .progress_tracker:
                 self .progress_tracker .set_error(error_msg)
             else:
-                st .error(error_msg)
+                notifier .error(error_msg)
             return False
 
     def search_similar(self, query: str, k: int = 5, selected_documents: Any = "all",
                        distance_threshold: float = 0.6, search_method: str = "mmr") -> List[Dict[str, Any]]:
+        return run_flow(self ._search_flow(query, k=k, selected_documents=selected_documents,
+                                          distance_threshold=distance_threshold, search_method=search_method),
+                        SyncIO(self))
+
+    def _search_flow(self, query: str, k: int = 5, selected_documents: Any = "all",
+                     distance_threshold: float = 0.6, search_method: str = "mmr") -> Flow:
         try:
-            query_embedding = self .generate_embeddings([query])[0]
+            query_embedding = (yield ("embed_documents", [query]))[0]
+        except Exception as e:
+            notifier .error(f"Error searching documents: {str(e)}")
+            return []
+        return (yield ("call", partial(self .search_by_embedding, query_embedding, k=k,
+                                       selected_documents=selected_documents,
+                                       distance_threshold=distance_threshold, search_method=search_method)))
 
+    def search_by_embedding(self, query_embedding: List[float], k: int = 5, selected_documents: Any = "all",
+                            distance_threshold: float = 0.6, search_method: str = "mmr") -> List[Dict[str, Any]]:
+        """Поиск по готовому эмбеддингу запроса, без обращения к модели"""
+        try:
             if search_method == "mmr":
 
                 n_results = min(k * 4, 100)
@@ -200,10 +432,13 @@ class VectorStore:
             }
 
             if selected_documents != "all" and isinstance(selected_documents, list) and selected_documents:
-                search_params["where"] = {
-                    "filename": {"$in": selected_documents}}
+                doc_ids = self ._doc_ids_for_filenames(selected_documents)
+                if not doc_ids:
+                    return []
+                search_params["where"] = {"doc_id": {"$in": doc_ids}}
 
             results = self .collection .query(**search_params)
+            metadatas = self ._join_metadata(results['metadatas'][0])
 
             candidates = []
             for i in range(len(results['documents'][0])):
@@ -212,12 +447,16 @@ class VectorStore:
 
                 if distance <= distance_threshold:
                     result = {
+                        "id": results['ids'][0][i],
                         "content": results['documents'][0][i],
-                        "metadata": results['metadatas'][0][i],
+                        "metadata": metadatas[i],
                         "distance": distance,
                         "similarity": similarity,
                         "embedding": None
                     }
+                    duplicates = self .dedup_index .get_links(results['ids'][0][i])
+                    if duplicates:
+                        result["duplicates"] = duplicates
                     candidates .append(result)
 
             if search_method == "similarity":
@@ -244,7 +483,7 @@ class VectorStore:
             return final_results
 
         except Exception as e:
-            st .error(f"Error searching documents: {str(e)}")
+            notifier .error(f"Error searching documents: {str(e)}")
             return []
 
     def _apply_mmr(self, candidates: List[Dict[str, Any]], query_embedding: List[float],
@@ -296,7 +535,7 @@ class VectorStore:
             return selected
 
         except Exception as e:
-            st .error(f"Error applying MMR: {str(e)}")
+            notifier .error(f"Error applying MMR: {str(e)}")
 
             return sorted(candidates, key=lambda x: x["similarity"], reverse=True)[:k]
 
@@ -317,7 +556,7 @@ class VectorStore:
             return dot_product / (norm1 * norm2)
 
         except Exception as e:
-            st .error(f"Error calculating cosine similarity: {str(e)}")
+            notifier .error(f"Error calculating cosine similarity: {str(e)}")
             return 0.0
 
     def get_collection_info(self) -> Dict[str, Any]:
@@ -326,94 +565,209 @@ class VectorStore:
             return {
                 "document_count": count,
                 "collection_name": self .collection_name,
-                "persist_directory": self .persist_directory
+                "persist_directory": self .persist_directory,
+                "dedup_mode": self .dedup_mode,
+                "dedup": self .dedup_index .get_stats()
             }
         except Exception as e:
-            st .error(f"Error getting collection info: {str(e)}")
+            notifier .error(f"Error getting collection info: {str(e)}")
             return {"document_count": 0}
 
+    def _collection_doc_ids(self) -> Set[str]:
+        doc_ids = set()
+        batch_size = self .client .get_max_batch_size()
+        for offset in range(0, self .collection .count(), batch_size):
+            batch = self .collection .get(include=["metadatas"], limit=batch_size, offset=offset)
+            doc_ids .update(metadata["doc_id"]for metadata in batch["metadatas"]if metadata and metadata .get("doc_id"))
+        return doc_ids
+
+    def _doc_ids_used_elsewhere(self, doc_ids: List[str]) -> Set[str]:
+        """doc_id, на которые ссылаются коллекции других моделей эмбеддингов, - таблица документов у них общая"""
+        used = set()
+        for collection in self .client .list_collections():
+            if collection .name == self .collection_name:
+                continue
+            for offset in range(0, len(doc_ids), 500):
+                found = collection .get(where={"doc_id": {"$in": doc_ids[offset:offset + 500]}}, include=["metadatas"])
+                used .update(metadata .get("doc_id")for metadata in found["metadatas"]if metadata)
+        return used
+
+    def _delete_document_rows(self, doc_ids: List[str]):
+        doc_ids = list(doc_ids)
+        used = self ._doc_ids_used_elsewhere(doc_ids)if doc_ids else set()
+        self .document_store .delete([doc_id for doc_id in doc_ids if doc_id not in used])
+
     def clear_collection(self) -> bool:
         try:
+            doc_ids = sorted(self ._collection_doc_ids())
             self .client .delete_collection(self .collection_name)
 
             self .collection = self .client .get_or_create_collection(
                 name=self .collection_name,
                 metadata={"hnsw:space": "cosine"}
             )
+            self .dedup_index .clear()
+            self ._delete_document_rows(doc_ids)
 
-            st .success("Collection cleared successfully")
+            notifier .success("Collection cleared successfully")
             return True
 
         except Exception as e:
-            st .error(f"Error clearing collection: {str(e)}")
+            notifier .error(f"Error clearing collection: {str(e)}")
             return False
 
-    def delete_documents_by_filename(self, filename: str) -> bool:
+    def find_filename_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """Ищет уже проиндексированный документ с тем же содержимым"""
         try:
-            results = self .collection .get(
-                include=["metadatas"]
-            )
-
-            ids_to_delete = []
-            for i, metadata in enumerate(results['metadatas']):
-                if metadata .get('filename') == filename:
-                    ids_to_delete .append(results['ids'][i])
-
-            if ids_to_delete:
-                self .collection .delete(ids=ids_to_delete)
-                st .success(
-                    f"Deleted {len(ids_to_delete)} documents from {filename}")
-                return True
-            else:
-                st .warning(f"No documents found for {filename}")
-                return False
+            doc_ids = self .document_store .find_doc_ids("content_hash", [content_hash])
+            for doc_id in doc_ids:
+                if self .collection .get(where={"doc_id": doc_id}, include=[], limit=1)["ids"]:
+                    return self .document_store .get_metadata([doc_id]).get(doc_id, {}).get('filename')
+            return None
 
         except Exception as e:
-            st .error(f"Error deleting documents: {str(e)}")
-            return False
+            notifier .error(f"Error looking up document by content hash: {str(e)}")
+            return None
+
+    def _delete_doc_ids(self, doc_ids: List[str], keep_text: bool = False) -> Dict[str, int]:
+        """Удаляет фрагменты документов одним запросом по doc_id и возвращает число удаленных фрагментов по doc_id"""
+        if not doc_ids:
+            return {}
+        chunks = self .collection .get(where={"doc_id": {"$in": doc_ids}}, include=["metadatas"])
+        counts: Dict[str, int] = {}
+        for metadata in chunks["metadatas"]:
+            counts[metadata["doc_id"]] = counts .get(metadata["doc_id"], 0)+1
+
+        if chunks["ids"]:
+            self .collection .delete(ids=chunks["ids"])
+        sources = [metadata .get("file_path")for metadata in self .document_store .get_metadata(doc_ids).values()]
+        orphaned = set(self .dedup_index .remove_ids(chunks["ids"]))
+        orphaned .update(self .dedup_index .remove_sources(sources))
+        self ._warn_orphaned(sorted(orphaned - set(sources)))
+        self .dedup_index .save()
+        if not keep_text:
+            self ._delete_document_rows(doc_ids)
+        return counts
+
+    def _update_legacy_chunks(self, filenames: List[str], build_update) -> set:
+        """Обновляет только метаданные фрагментов старой раскладки, где filename хранится в самом фрагменте"""
+        legacy = self .collection .get(where={"filename": {"$in": filenames}}, include=["metadatas"])
+        if legacy["ids"]:
+            self .collection .update(
+                ids=legacy["ids"],
+                metadatas=[build_update(metadata)for metadata in legacy["metadatas"]]
+            )
+        return {metadata["filename"]for metadata in legacy["metadatas"]}
 
     def delete_documents_by_filenames(self, filenames: List[str]) -> Dict[str, bool]:
-        results = {}
-
-        for filename in filenames:
-            results[filename] = self .delete_documents_by_filename(filename)
+        """Удаляет документы по именам: один запрос к таблице документов и одно удаление в Chroma"""
+        try:
+            doc_ids = self ._doc_ids_for_filenames(filenames)
+            filenames_by_doc = {doc_id: metadata .get("filename")
+                                for doc_id, metadata in self .document_store .get_metadata(doc_ids).items()}
+            counts = self ._delete_doc_ids(doc_ids)
+            deleted = {filenames_by_doc .get(doc_id)for doc_id, count in counts .items()if count}
+            return {filename: filename in deleted for filename in filenames}
 
-        return results
+        except Exception as e:
+            notifier .error(f"Error deleting documents: {str(e)}")
+            return {filename: False for filename in filenames}
 
-    def update_filename_in_metadata(self, old_filename: str, new_filename: str) -> bool:
+    def delete_documents_by_filename(self, filename: str) -> bool:
         try:
-            results = self .collection .get(
-                where={"filename": old_filename},
-                include=["metadatas", "documents", "embeddings"]
-            )
+            counts = self ._delete_doc_ids(self ._doc_ids_for_filenames([filename]))
+            deleted = sum(counts .values())
 
-            if not results['ids']:
-                st .warning(f"No documents found for {old_filename}")
+            if deleted:
+                notifier .success(
+                    f"Deleted {deleted} documents from {filename}")
+                return True
+            else:
+                notifier .warning(f"No documents found for {filename}")
                 return False
 
-            updated_metadatas = []
-            for metadata in results['metadatas']:
-                updated_metadata = metadata .copy()
-                updated_metadata['filename'] = new_filename
-                updated_metadatas .append(updated_metadata)
+        except Exception as e:
+            notifier .error(f"Error deleting documents: {str(e)}")
+            return False
 
-            self .collection .delete(ids=results['ids'])
+    def _file_doc_ids(self, file_path: str) -> List[str]:
+        return list(dict .fromkeys(
+            [document_id(file_path)]+self .document_store .find_doc_ids(
+                "file_path", [file_path, os .path .abspath(file_path)])))
+
+    def get_file_chunk_ids(self, file_path: str) -> List[str]:
+        """Идентификаторы фрагментов, уже сохраненных для файла"""
+        return self ._chunk_ids_for_doc_ids(self ._file_doc_ids(file_path))
+
+    def document_ids(self, documents: List[Document], exclude_ids: Optional[Set[str]] = None) -> List[str]:
+        """Идентификаторы фрагментов для записи; совпадающие с exclude_ids получают уникальный суффикс"""
+        suffix = uuid .uuid4().hex[:8]
+        return [chunk_id if not exclude_ids or chunk_id not in exclude_ids else f"{chunk_id}_{suffix}"
+                for chunk_id in self ._document_ids(documents)]
+
+    def delete_chunk_ids(self, chunk_ids: List[str]):
+        """Удаляет фрагменты по id вместе с их записями в индексе дубликатов; тексты документов не трогает"""
+        if not chunk_ids:
+            return
+        self .collection .delete(ids=chunk_ids)
+        self ._warn_orphaned(self .dedup_index .remove_ids(chunk_ids))
+        self .dedup_index .save()
+
+    def delete_documents_by_file_path(self, file_path: str, keep_text: bool = False) -> bool:
+        """Удаляет все фрагменты файла по его полному пути без сообщений в интерфейсе.
+        keep_text оставляет текст документа, который заменит новая обработка файла после записи фрагментов"""
+        try:
+            current_id = document_id(file_path)
+            doc_ids = self ._file_doc_ids(file_path)
+            self ._delete_doc_ids(doc_ids, keep_text=True)
+            self ._delete_document_rows([doc_id for doc_id in doc_ids if not keep_text or doc_id != current_id])
+            return True
+        except Exception as e:
+            if self .progress_tracker:
+                self .progress_tracker .set_error(
+                    f"Error deleting documents for {file_path}: {str(e)}")
+            return False
 
-            self .collection .add(
-                ids=results['ids'],
-                documents=results['documents'],
-                metadatas=updated_metadatas,
-                embeddings=results['embeddings']
-            )
+    def rename_documents(self, renames: Dict[str, str]) -> Dict[str, bool]:
+        """Переименовывает документы в таблице документов; фрагменты и эмбеддинги не перезаписываются"""
+        try:
+            renamed = self .document_store .rename_many(renames)
+            legacy = self ._update_legacy_chunks(
+                list(renames), lambda metadata: {"filename": renames[metadata["filename"]]})
+            return {old: old in renamed or old in legacy for old in renames}
 
-            st .success(
-                f"Updated filename from {old_filename} to {new_filename}")
-            return True
+        except Exception as e:
+            notifier .error(f"Error renaming documents: {str(e)}")
+            return {old: False for old in renames}
+
+    def tag_documents(self, filenames: List[str], tags: Dict[str, Any]) -> Dict[str, bool]:
+        """Задает общие метаданные файлов (категория, теги и т.п.); None удаляет ключ"""
+        reserved = set(CHUNK_METADATA_KEYS)|{"filename", "file_path", "content_hash"}
+        if reserved & set(tags):
+            raise ValueError(f"Reserved metadata keys: {', '.join(sorted(reserved & set(tags)))}")
+        for key, value in tags .items():
+            if value is not None and not isinstance(value, (str, int, float, bool)):
+                raise ValueError(f"Metadata value for {key} must be str, int, float or bool")
+        try:
+            doc_ids = self ._doc_ids_for_filenames(filenames)
+            self .document_store .update_metadata(doc_ids, tags)
+            tagged = {metadata .get("filename")for metadata in self .document_store .get_metadata(doc_ids).values()}
+            legacy = self ._update_legacy_chunks(filenames, lambda metadata: dict(tags))
+            return {filename: filename in tagged or filename in legacy for filename in filenames}
 
         except Exception as e:
-            st .error(f"Error updating filename: {str(e)}")
+            notifier .error(f"Error tagging documents: {str(e)}")
+            return {filename: False for filename in filenames}
+
+    def update_filename_in_metadata(self, old_filename: str, new_filename: str) -> bool:
+        if not self .rename_documents({old_filename: new_filename}).get(old_filename):
+            notifier .warning(f"No documents found for {old_filename}")
             return False
 
+        notifier .success(
+            f"Updated filename from {old_filename} to {new_filename}")
+        return True
+
     def get_document_summary(self) -> Dict[str, Any]:
         try:
             results = self .collection .get(include=["metadatas"])
@@ -426,62 +780,80 @@ class VectorStore:
                     "file_details": {}
                 }
 
-            filenames = []
+            chunk_counts: Dict[str, int] = {}
             for metadata in results['metadatas']:
-                filename = metadata .get('filename', 'unknown')
-                if filename and filename != 'unknown':
-                    filenames .append(filename)
-
-            unique_filenames = list(set(filenames))
+                doc_id = (metadata or {}).get('doc_id')
+                chunk_counts[doc_id] = chunk_counts .get(doc_id, 0)+1
+            documents = self .document_store .get_metadata(doc_id for doc_id in chunk_counts if doc_id)
 
             file_details = {}
-            for filename in unique_filenames:
-                file_chunks = [m for m in results['metadatas']
-                               if m .get('filename') == filename]
-                if file_chunks:
-                    first_chunk = file_chunks[0]
-                    file_details[filename] = {
-                        "chunk_count": len(file_chunks),
-                        "page_count": first_chunk .get('page_count', 'Unknown'),
-                        "file_path": first_chunk .get('file_path', 'Unknown'),
-                        "original_name": first_chunk .get('original_name', filename)
-                    }
+            for doc_id, chunk_count in chunk_counts .items():
+                metadata = documents .get(doc_id)
+                if not metadata or not metadata .get('filename'):
+                    continue
+                filename = metadata['filename']
+                if filename in file_details:
+                    file_details[filename]["chunk_count"] += chunk_count
+                    continue
+                file_details[filename] = {
+                    "chunk_count": chunk_count,
+                    "page_count": metadata .get('page_count', 'Unknown'),
+                    "file_path": metadata .get('file_path', 'Unknown'),
+                    "original_name": metadata .get('original_name', filename)
+                }
 
             return {
                 "total_documents": len(results['metadatas']),
-                "unique_files": len(unique_filenames),
-                "filenames": unique_filenames,
+                "unique_files": len(file_details),
+                "filenames": list(file_details),
                 "file_details": file_details
             }
 
         except Exception as e:
-            st .error(f"Error getting document summary: {str(e)}")
+            notifier .error(f"Error getting document summary: {str(e)}")
             return {"total_documents": 0, "unique_files": 0, "filenames": [], "file_details": {}}
 
+    def _rebuild_document_text(self, doc_id: str) -> str:
+        """Склейка текста из фрагментов для документов, сохраненных без исходного текста"""
+        results = self .collection .get(where={"doc_id": doc_id}, include=["documents", "metadatas"])
+        order = sorted(range(len(results['ids'])),
+                       key=lambda i: (results['metadatas'][i]or {}).get('chunk_id', i))
+        return merge_overlapping_texts([results['documents'][i].strip()for i in order])
+
+    def _read_document_page(self, stored: Dict[str, Any], page: int = 0,
+                            page_chars: Optional[int] = None) -> Dict[str, Any]:
+        if stored["total_chars"]:
+            if page_chars:
+                return self .document_store .read_page(stored["doc_id"], page, page_chars)
+            text = self .document_store .read_text(stored["doc_id"])
+        else:
+            text = self ._rebuild_document_text(stored["doc_id"])
+            if page_chars:
+                page_count = max(1, -(-len(text)//page_chars))
+                page = max(0, min(page, page_count - 1))
+                return {
+                    "text": text[page * page_chars:(page + 1)*page_chars],
+                    "page": page,
+                    "page_count": page_count,
+                    "offset": page * page_chars,
+                    "total_chars": len(text)
+                }
+        return {"text": text, "page": 0, "page_count": 1, "offset": 0, "total_chars": len(text)}
+
     def get_document_preview(self, filename: str, max_length: int = 300) -> str:
         try:
-            results = self .collection .get(
-                where={"filename": filename},
-                include=["documents"],
-                limit=2
-            )
-
-            if not results or not results .get('documents') or len(results['documents']) == 0:
+            stored = self .document_store .find_by_filename(filename)
+            if not stored:
                 return "Предпросмотр недоступен"
 
-            preview_text = ""
-            for doc_text in results['documents']:
-                if doc_text and doc_text .strip():
-                    preview_text += doc_text .strip()+""
-                    if len(preview_text) > max_length:
-                        break
-
-            preview_text = preview_text .strip()
+            preview_text = self ._read_document_page(stored, 0, max_length * 2)["text"]
 
             preview_text = re .sub(r'--- Page \d+ ---', '', preview_text)
 
+            preview_text = preview_text .strip()
+
             if len(preview_text) > max_length:
-                preview_text = preview_text[:max_length].rsplit('', 1)[
+                preview_text = preview_text[:max_length].rsplit(' ', 1)[
                     0]+"..."
 
             return preview_text if preview_text else "Контент не найден"
@@ -489,14 +861,18 @@ class VectorStore:
         except Exception as e:
             return f"Ошибка загрузки предпросмотра: {str(e)}"
 
-    def get_full_document_content(self, filename: str) -> Dict[str, Any]:
-        try:
-            results = self .collection .get(
-                where={"filename": filename},
-                include=["documents", "metadatas"]
-            )
+    def _format_full_text(self, text: str) -> str:
+        text = re .sub(r'--- Page \d+ ---\s*',
+                       '\n\n=== Страница ===\n\n', text)
+        return re .sub(r'\n\s*\n\s*\n', '\n\n', text)
 
-            if not results or not results .get('documents'):
+    def get_full_document_content(self, filename: str, page: int = 0,
+                                  page_chars: Optional[int] = None, preview_chunks: int = 10) -> Dict[str, Any]:
+        """Текст документа из хранилища исходных текстов, целиком или страницей по page_chars символов"""
+        try:
+            stored = self .document_store .find_by_filename(filename)
+            chunk_ids = self ._chunk_ids_for_doc_ids([stored["doc_id"]])if stored else []
+            if not chunk_ids:
                 return {
                     "success": False,
                     "error": "Документ не найден",
@@ -504,44 +880,31 @@ class VectorStore:
                     "chunks": []
                 }
 
-            chunks_data = []
-            for i, doc_text in enumerate(results['documents']):
-                metadata = results['metadatas'][i]if i < len(
-                    results['metadatas'])else {}
-                chunk_id = metadata .get('chunk_id', i)
-
-                chunks_data .append({
-                    "chunk_id": chunk_id,
-                    "text": doc_text,
-                    "metadata": metadata
-                })
-
+            chunks = self .collection .get(
+                where={"$and": [{"doc_id": stored["doc_id"]}, {"chunk_id": {"$lt": preview_chunks}}]},
+                include=["documents", "metadatas"]
+            )
+            chunks_data = [
+                {"chunk_id": metadata .get('chunk_id', i), "text": text, "metadata": metadata}
+                for i, (text, metadata)in enumerate(zip(chunks['documents'], self ._join_metadata(chunks['metadatas'])))
+            ]
             chunks_data .sort(key=lambda x: x['chunk_id'])
+            file_metadata = self .document_store .get_metadata([stored["doc_id"]]).get(stored["doc_id"], {})
 
-            full_text = ""
-            for chunk_data in chunks_data:
-                text = chunk_data['text'].strip()
-                if text:
-                    full_text += text + "\n\n"
-
-            full_text = full_text .strip()
-
-            full_text = re .sub(r'--- Page \d+ ---\s*',
-                                '\n\n=== Страница ===\n\n', full_text)
-
-            full_text = re .sub(r'\n\s*\n\s*\n', '\n\n', full_text)
-
-            first_metadata = chunks_data[0]['metadata']if chunks_data else {}
+            text_page = self ._read_document_page(stored, page, page_chars)
 
             return {
                 "success": True,
-                "content": full_text,
+                "content": self ._format_full_text(text_page["text"]).strip(),
                 "chunks": chunks_data,
-                "total_chunks": len(chunks_data),
-                "page_count": first_metadata .get('page_count', 'Unknown'),
-                "file_path": first_metadata .get('file_path', 'Unknown'),
-                "original_name": first_metadata .get('original_name', filename),
-                "total_characters": len(full_text)
+                "total_chunks": len(chunk_ids),
+                "page_count": file_metadata .get('page_count', 'Unknown'),
+                "file_path": stored["file_path"],
+                "original_name": file_metadata .get('original_name', filename),
+                "total_characters": text_page["total_chars"],
+                "text_page": text_page["page"],
+                "text_pages": text_page["page_count"],
+                "text_offset": text_page["offset"]
             }
 
         except Exception as e: